@@ -7,19 +7,51 @@ app.config.from_object('abacuspb.settings')
 db = MongoClient()[app.config['MONGO_DBNAME']]
 
 from abacuspb.resources.accounts import AccountListAPI, AccountAPI
-from abacuspb.resources.transactions import TransactionListAPI, TransactionAPI
-from abacuspb.resources.payees import PayeeListAPI, PayeeAPI
+from abacuspb.resources.transactions import TransactionListAPI, TransactionAPI, TransactionExportAPI, TransactionBulkAPI
+from abacuspb.resources.payees import PayeeListAPI, PayeeAPI, PayeeSearchAPI
 from abacuspb.resources.categories import CategoryListAPI, CategoryAPI
+from abacuspb.resources.reports import SpendingReportAPI, NetWorthAPI
+from abacuspb.resources.search import TransactionSearchAPI
+from abacuspb.resources.budgets import BudgetAPI, BudgetCategoryAPI
+from abacuspb.resources.schedules import ScheduleListAPI, ScheduleAPI
+from abacuspb.resources.admin import BalanceCheckAPI, CacheStatsAPI
+from abacuspb.indexes import ensure_indexes
+from abacuspb.journal import replay_journal, start_replayer
+from abacuspb.encoding import encode_json
 
 api = Api(app)
 api.add_resource(AccountListAPI, '/api/accounts', endpoint = 'accounts')
 api.add_resource(AccountAPI, '/api/accounts/<id>', endpoint = 'account')
 api.add_resource(TransactionListAPI, '/api/transactions/<account_id>', endpoint = 'transactions')
+api.add_resource(TransactionExportAPI, '/api/transactions/<account_id>/export', endpoint = 'transactions_export')
+api.add_resource(TransactionBulkAPI, '/api/transactions/<account_id>/bulk', endpoint = 'transactions_bulk')
 api.add_resource(TransactionAPI, '/api/transactions/<account_id>/<trans_id>', endpoint = 'transaction')
 api.add_resource(PayeeListAPI, '/api/payees', endpoint = 'payees')
+api.add_resource(PayeeSearchAPI, '/api/payees/search', endpoint = 'payee_search')
 api.add_resource(PayeeAPI, '/api/payees/<id>', endpoint = 'payee')
 api.add_resource(CategoryListAPI, '/api/categories', endpoint = 'categories')
 api.add_resource(CategoryAPI, '/api/categories/<id>', endpoint = 'category')
+api.add_resource(ScheduleListAPI, '/api/schedules', endpoint = 'schedules')
+api.add_resource(ScheduleAPI, '/api/schedules/<id>', endpoint = 'schedule')
+api.add_resource(SpendingReportAPI, '/api/reports/spending', endpoint = 'spending_report')
+api.add_resource(NetWorthAPI, '/api/networth', endpoint = 'networth')
+api.add_resource(BudgetAPI, '/api/budgets/<month>', endpoint = 'budget')
+api.add_resource(BudgetCategoryAPI, '/api/budgets/<month>/<category_id>', endpoint = 'budget_category')
+api.add_resource(TransactionSearchAPI, '/api/search/transactions', endpoint = 'transaction_search')
+api.add_resource(BalanceCheckAPI, '/api/admin/balances', endpoint = 'admin_balances')
+api.add_resource(CacheStatsAPI, '/api/admin/cache', endpoint = 'admin_cache')
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    resp = make_response(encode_json(data), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+@app.before_first_request
+def bootstrap():
+    ensure_indexes()
+    replay_journal() # Finish writes interrupted by a crash
+    start_replayer()
 
 @app.route('/')
 def index():
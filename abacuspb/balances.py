@@ -0,0 +1,46 @@
+from pymongo import ReturnDocument
+from abacuspb import db
+from abacuspb.storage import guard_journal
+from abacuspb.versions import bump_version
+from abacuspb.money import to_dollars
+
+BALANCE_FIELDS = ['bal_uncleared', 'bal_cleared', 'bal_reconciled']
+
+def balance_delta(transaction, sign=1):
+    """
+    Per-balance change in cents caused by a transaction (sign=-1 to reverse it)
+    """
+    amount = sign * transaction['amount']
+    delta = {'bal_uncleared': amount, 'bal_cleared': 0, 'bal_reconciled': 0}
+    if transaction['reconciled'] in ['C', 'R']:
+        delta['bal_cleared'] = amount
+    if transaction['reconciled'] == 'R':
+        delta['bal_reconciled'] = amount
+    return delta
+
+def apply_balance_delta(account_id, delta, journal_id=None):
+    """
+    Add a balance delta (in cents) to an account and return the new balances.
+    
+    With a journal_id the $inc is applied at most once per journal entry:
+    the entry id is recorded on the account in the same update, so
+    replaying the entry leaves the balances alone.
+    """
+    spec = {'id': account_id}
+    update = {'$inc': delta}
+    if journal_id != None:
+        spec, update = guard_journal(spec, update, journal_id)
+    account = db.accounts.find_one_and_update(spec, update,
+                                              projection=BALANCE_FIELDS,
+                                              return_document=ReturnDocument.AFTER)
+    if account != None:
+        bump_version('accounts')
+    if account == None and journal_id != None: # Already applied
+        account = db.accounts.find_one({'id': account_id}, projection=BALANCE_FIELDS)
+    if account == None:
+        return None
+    
+    return { 'uri': '/api/accounts/' + account_id,
+             'bal_uncleared': to_dollars(account['bal_uncleared']),
+             'bal_cleared': to_dollars(account['bal_cleared']),
+             'bal_reconciled': to_dollars(account['bal_reconciled']) }
@@ -0,0 +1,66 @@
+from abacuspb import db
+from abacuspb.cache import all_categories
+
+def budget_amounts(month):
+    """
+    {category id: cents} budgeted for a month. A category's budget stays in
+    force from the month it is set until a later month sets a new one.
+    """
+    groups = db.budgets.aggregate([{'$match': {'month': {'$lte': month}}},
+                                   {'$sort': {'month': -1}},
+                                   {'$group': {'_id': '$category_id', 'amount': {'$first': '$amount'}}}])
+    return dict((group['_id'], group['amount']) for group in groups)
+
+def monitored_accounts():
+    """
+    Ids of the accounts whose transactions count against budgets
+    """
+    return [account['id'] for account in db.accounts.find({'budget_monitored': True}, projection={'id': True})]
+
+def budget_actuals(month, accounts):
+    """
+    {category id: cents} spent per category in a month across the accounts,
+    read from the monthly rollups so the cost does not grow with history
+    """
+    groups = db.rollups.aggregate([{'$match': {'account_id': {'$in': accounts}, 'month': month}},
+                                   {'$group': {'_id': '$category', 'sum': {'$sum': '$sum'}}}])
+    return dict((group['_id'], group['sum']) for group in groups)
+
+def tracking_category(category_id, categories):
+    """
+    The budget tracked category a category's transactions count towards:
+    itself, or else its nearest tracked parent. None if there is none.
+    """
+    seen = set()
+    while category_id in categories and category_id not in seen:
+        if categories[category_id].get('budget_tracked'):
+            return category_id
+        seen.add(category_id)
+        category_id = categories[category_id].get('parent_id')
+    return None
+
+def budget_report(month):
+    """
+    Budget vs. actual for every budget tracked category in a month (YYYY-MM)
+    over the budget monitored accounts. Untracked sub-categories count
+    towards their tracked parent. Amounts are in cents; actuals are signed
+    like transaction amounts, so spending is negative and remaining is
+    budget + actual.
+    """
+    categories = dict((c['id'], c) for c in all_categories())
+    accounts = monitored_accounts()
+    budgets = budget_amounts(month)
+    actuals = {}
+    for category_id, amount in budget_actuals(month, accounts).iteritems():
+        tracked = tracking_category(category_id, categories)
+        if tracked:
+            actuals[tracked] = actuals.get(tracked, 0) + amount
+    rows = []
+    for category in categories.itervalues():
+        if category.get('budget_tracked'):
+            budget = budgets.get(category['id'], 0)
+            actual = actuals.get(category['id'], 0)
+            rows.append({'id': category['id'], 'name': category['name'],
+                         'budget': budget, 'actual': actual, 'remaining': budget + actual})
+    rows.sort(key=lambda row: row['name'])
+    return accounts, rows
@@ -0,0 +1,112 @@
+import threading, time
+from collections import OrderedDict
+from abacuspb import app, db
+
+MISSING = object()
+
+class LRUCache(object):
+    """
+    Thread-safe read-through cache with a size limit (least recently used
+    entries are evicted first) and a time to live, which bounds how stale an
+    entry can get when another process writes to the database.
+    
+    Loads run outside the lock. Invalidation bumps a generation counter
+    (per key, or for the whole cache), and a load only stores its value if
+    no invalidation happened since it started, so a value read before a
+    write cannot be cached after it.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (expires, value), oldest first
+        self.generation = 0 # Bumped by invalidate()
+        self.generations = {} # key -> generation, bumped by invalidate(key)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, load):
+        """
+        Cached value for key, calling load() on a miss or an expired entry
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(key, MISSING)
+            if entry is not MISSING and entry[0] > now:
+                self.entries[key] = entry # Most recently used
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            started = (self.generation, self.generations.get(key, 0))
+        value = load()
+        with self.lock:
+            if started == (self.generation, self.generations.get(key, 0)):
+                self.entries[key] = (now + self.ttl, value)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return value
+    
+    def invalidate(self, key=None):
+        """
+        Drop one entry, or every entry when no key is given
+        """
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+                self.generations.clear()
+                self.generation += 1
+            else:
+                self.entries.pop(key, None)
+                self.generations[key] = self.generations.get(key, 0) + 1
+    
+    def stats(self):
+        with self.lock:
+            return { 'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                     'maxsize': self.maxsize, 'ttl': self.ttl }
+
+caches = {
+    'accounts': LRUCache(app.config['CACHE_SIZE'], app.config['CACHE_TTL']),
+    'payees': LRUCache(app.config['CACHE_SIZE'], app.config['CACHE_TTL']),
+    'categories': LRUCache(app.config['CACHE_SIZE'], app.config['CACHE_TTL'])
+}
+
+ACCOUNT_METADATA = {'_id': False, 'bal_uncleared': False, 'bal_cleared': False, 'bal_reconciled': False, 'journal': False}
+
+def account_metadata(account_id):
+    """
+    An account without its balances (which change on every transaction
+    write), or None when it does not exist. Treat the result as read-only.
+    """
+    return caches['accounts'].get(account_id, lambda: db.accounts.find_one({'id': account_id}, projection=ACCOUNT_METADATA))
+
+def all_payees():
+    """
+    Every payee as {'id', 'name'}. Treat the result as read-only.
+    """
+    return caches['payees'].get('*', lambda: list(db.payees.find(projection={'_id': False, 'id': True, 'name': True})))
+
+def all_categories():
+    """
+    Every category as {'id', 'name', 'parent_id', 'budget_tracked'}. Treat the result as read-only.
+    """
+    return caches['categories'].get('*', lambda: list(db.categories.find(
+        projection={'_id': False, 'id': True, 'name': True, 'parent_id': True, 'budget_tracked': True})))
+
+def invalidate(name, key=None):
+    """
+    Called by the write paths of a collection: drop the key and any
+    whole-collection entry, or everything when no key is given
+    """
+    caches[name].invalidate(key)
+    if key is not None:
+        caches[name].invalidate('*')
+
+def clear_caches():
+    """
+    Empty every cache, e.g. after writing to the database directly
+    """
+    for cache in caches.itervalues():
+        cache.invalidate()
+
+def cache_stats():
+    return dict((name, cache.stats()) for name, cache in caches.iteritems())
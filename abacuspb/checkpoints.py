@@ -0,0 +1,122 @@
+from datetime import datetime
+from pymongo import UpdateMany, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from abacuspb import db
+from abacuspb.storage import transactions_for, guard_journal
+import pymongo
+
+CHECKPOINT_RETRIES = 3 # Attempts to store a new checkpoint while the account is being written to
+
+def previous_month(month):
+    """
+    'YYYY-MM' of the month before a 'YYYY-MM' month
+    """
+    year, mon = int(month[0:4]), int(month[5:7])
+    if mon == 1:
+        return '%04d-12' % (year - 1)
+    return '%04d-%02d' % (year, mon - 1)
+
+def checkpoint_balance(account_id, month):
+    """
+    Total in cents of an account's transactions up to the end of a
+    'YYYY-MM' month.
+
+    Served from a stored checkpoint when there is one; otherwise summed
+    forward from the nearest earlier checkpoint over the monthly rollups
+    and stored for next time. The checkpoint is claimed first as a pending
+    placeholder that adjust_checkpoints counts writes on, and the sum is
+    only stored if no write landed while it was computed; otherwise it is
+    computed again.
+    """
+    key = {'account_id': account_id, 'month': month}
+    balance = None
+    for attempt in range(CHECKPOINT_RETRIES):
+        try:
+            checkpoint = db.checkpoints.find_one_and_update(key,
+                                                            {'$setOnInsert': {'balance': 0, 'writes': 0, 'pending': True}},
+                                                            upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError: # Claimed by a concurrent request
+            continue
+        if not checkpoint.get('pending'):
+            return checkpoint['balance']
+        balance = rollup_balance(account_id, month)
+        stored = db.checkpoints.update_one(dict(key, pending=True, writes=checkpoint['writes']),
+                                           {'$set': {'balance': balance}, '$unset': {'pending': True}})
+        if stored.matched_count:
+            return balance
+    if balance == None:
+        balance = rollup_balance(account_id, month)
+    return balance # Still being written to; stored by a later read
+
+def rollup_balance(account_id, month):
+    """
+    Total in cents of an account's transactions up to the end of a month,
+    from the nearest earlier stored checkpoint and the rollups after it
+    """
+    earlier = db.checkpoints.find_one({'account_id': account_id, 'month': {'$lt': month}, 'pending': {'$exists': False}},
+                                      sort=[('month', pymongo.DESCENDING)])
+    months = {'$lte': month}
+    balance = 0
+    if earlier:
+        months['$gt'] = earlier['month']
+        balance = earlier['balance']
+    for group in db.rollups.aggregate([{'$match': {'account_id': account_id, 'month': months}},
+                                       {'$group': {'_id': None, 'total': {'$sum': '$sum'}}}]):
+        balance += group['total']
+    return balance
+
+def opening_balance(account_id):
+    """
+    Account balance in cents before its first transaction: the stored
+    bal_uncleared less the total of its rollups, so running balances end
+    at the account balance, like the net worth series. A write landing
+    between the two reads shifts it until the write completes.
+    """
+    account = db.accounts.find_one({'id': account_id}, projection={'bal_uncleared': True}) or {}
+    total = 0
+    for group in db.rollups.aggregate([{'$match': {'account_id': account_id}},
+                                       {'$group': {'_id': None, 'total': {'$sum': '$sum'}}}]):
+        total = group['total']
+    return (account.get('bal_uncleared') or 0) - total
+
+def balance_before(account_id, transaction):
+    """
+    Account balance in cents just before a transaction, in register order
+    (date ascending, id descending within a date): the opening balance,
+    the checkpoint at the end of the previous month and the earlier rows
+    of the transaction's month
+    """
+    date = transaction['date']
+    balance = opening_balance(account_id) + checkpoint_balance(account_id, previous_month(date.strftime('%Y-%m')))
+    match = {'$and': [{'date': {'$gte': datetime(date.year, date.month, 1)}},
+                      {'$or': [{'date': {'$lt': date}}, {'date': date, 'id': {'$gt': transaction['id']}}]}]}
+    for group in transactions_for(account_id).aggregate([{'$match': match},
+                                                         {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}]):
+        balance += group['total']
+    return balance
+
+def adjust_checkpoints(deltas, journal_id=None):
+    """
+    Shift the stored checkpoints at or after each changed month by the change,
+    given {(account_id, month): amount in cents}. With a journal_id each
+    checkpoint is shifted at most once per journal entry. Every shift is
+    counted in 'writes' so checkpoint_balance can tell that a pending
+    checkpoint changed under it.
+    """
+    ops = []
+    for (account_id, month), amount in deltas.iteritems():
+        if not amount:
+            continue
+        spec = {'account_id': account_id, 'month': {'$gte': month}}
+        update = {'$inc': {'balance': amount, 'writes': 1}}
+        if journal_id != None:
+            spec, update = guard_journal(spec, update, journal_id)
+        ops.append(UpdateMany(spec, update))
+    if ops:
+        db.checkpoints.bulk_write(ops, ordered=False)
+
+def clear_checkpoints(account_id):
+    """
+    Drop an account's checkpoints; they are recomputed on demand
+    """
+    db.checkpoints.remove({'account_id': account_id})
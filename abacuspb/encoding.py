@@ -0,0 +1,76 @@
+import json
+from datetime import datetime, date
+from bson.objectid import ObjectId
+from abacuspb import app
+
+BACKENDS = ['orjson', 'rapidjson', 'ujson', 'json'] # Fastest first
+
+def to_json(obj):
+    """
+    Encode the non-JSON types found in documents: dates as YYYY-MM-DD
+    (with the time when there is one) and ObjectIds as strings
+    """
+    if isinstance(obj, datetime):
+        if obj.time() == datetime.min.time():
+            return obj.strftime('%Y-%m-%d')
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.strftime('%Y-%m-%d')
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError('%r is not JSON serializable' % obj)
+
+def plain_types(data):
+    """
+    Copy of data with the non-JSON types converted by to_json, for
+    encoders without a default hook
+    """
+    if isinstance(data, dict):
+        return dict((k, plain_types(v)) for k, v in data.iteritems())
+    if isinstance(data, (list, tuple)):
+        return [plain_types(v) for v in data]
+    if isinstance(data, (datetime, date, ObjectId)):
+        return to_json(data)
+    return data
+
+def stdlib_dumps(data):
+    return json.dumps(data, default=to_json)
+
+def load_backend(name):
+    """
+    dumps(data) function for a JSON library, or None when it is not installed
+    """
+    if name == 'json':
+        return stdlib_dumps
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    if name == 'orjson': # Route datetimes through to_json to keep the YYYY-MM-DD format
+        return lambda data: module.dumps(data, default=to_json, option=module.OPT_PASSTHROUGH_DATETIME)
+    if name == 'rapidjson':
+        return lambda data: module.dumps(data, default=to_json)
+    # ujson has no default hook (1.x even encodes datetimes as epoch seconds), so convert first
+    return lambda data: module.dumps(plain_types(data))
+
+def select_backend(name=None):
+    """
+    The configured JSON backend, or the fastest one installed
+    """
+    for candidate in ([name] if name else BACKENDS):
+        dumps = load_backend(candidate)
+        if dumps:
+            return candidate, dumps
+    raise ValueError('JSON encoder %s is not installed' % name)
+
+backend, fast_dumps = select_backend(app.config['JSON_ENCODER'])
+
+def encode_json(data):
+    """
+    Encode a response body with the selected backend. Falls back to the
+    stdlib encoder for anything the backend cannot encode by itself.
+    """
+    try:
+        return fast_dumps(data)
+    except (TypeError, ValueError, OverflowError):
+        return stdlib_dumps(data)
@@ -0,0 +1,166 @@
+import csv, re
+from datetime import datetime
+from abacuspb import app
+from abacuspb.cache import account_metadata, all_payees
+from abacuspb.resources.transactions import make_transaction, insert_transactions
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+CSV_COLUMNS = { # Transaction field -> accepted (lower case) CSV headers
+    'date': ['date', 'posted date', 'posting date', 'transaction date'],
+    'amount': ['amount'],
+    'debit': ['debit', 'withdrawal'],
+    'credit': ['credit', 'deposit'],
+    'payee': ['payee', 'description', 'name'],
+    'memo': ['memo', 'notes'],
+    'type': ['type', 'check number', 'check #', 'check']
+}
+
+CSV_DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%Y%m%d']
+
+def import_statement(account_id, fileobj, format, batch_size=None):
+    """
+    Import an OFX/QFX or CSV bank statement into an account.
+
+    The file is parsed as a stream and transactions are committed every
+    batch_size rows, so memory use is bounded by the batch size rather than
+    the statement size. Rows that fail validation are skipped and reported.
+    Rows already imported (same fingerprint) are counted as duplicates, so
+    re-importing a statement is a no-op.
+    Returns { 'imported': <count>, 'duplicates': <count>,
+              'skipped': [(row number, message), ...] }
+    """
+    if not account_metadata(account_id):
+        raise ValueError('Account does not exist')
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    if format in ['ofx', 'qfx']:
+        rows = iter_ofx(fileobj)
+    elif format == 'csv':
+        rows = iter_csv(fileobj)
+    else:
+        raise ValueError('Unsupported statement format: %s' % format)
+
+    payees = PayeeMatcher()
+    result = {'imported': 0, 'duplicates': 0, 'skipped': []}
+    batch = []
+    for number, row in enumerate(rows, 1):
+        row['payee'] = payees.match(row.get('payee'))
+        try:
+            batch.append(make_transaction(row))
+        except (ValueError, TypeError) as error:
+            result['skipped'].append((number, str(error)))
+            continue
+        if len(batch) == batch_size:
+            _commit(account_id, batch, result)
+            batch = []
+    if batch:
+        _commit(account_id, batch, result)
+    return result
+
+def _commit(account_id, batch, result):
+    duplicates = insert_transactions(account_id, batch)[1]
+    result['imported'] += len(batch) - duplicates
+    result['duplicates'] += duplicates
+
+def iter_ofx(fileobj, chunk_size=65536):
+    """
+    Yield one transaction dict per <STMTTRN> in an OFX/QFX file (SGML v1.x
+    or XML v2.x), reading the file in chunks
+    """
+    trn = None
+    for closing, tag, value in _ofx_tokens(fileobj, chunk_size):
+        if tag == 'STMTTRN':
+            if closing and trn != None:
+                yield _ofx_transaction(trn)
+                trn = None
+            elif not closing:
+                trn = {}
+        elif trn != None and not closing and value:
+            trn[tag] = value
+
+def _ofx_tokens(fileobj, chunk_size):
+    buf = ''
+    while True:
+        chunk = fileobj.read(chunk_size)
+        buf += chunk
+        pos = 0
+        while True:
+            m = OFX_TAG.search(buf, pos)
+            if not m or (chunk and m.end() == len(buf)):
+                break # Element value may continue in the next chunk
+            yield m.group(1) == '/', m.group(2).upper(), m.group(3).strip()
+            pos = m.end()
+        buf = buf[pos:]
+        if not chunk:
+            break
+
+def _ofx_transaction(trn):
+    posted = trn.get('DTPOSTED', '')[0:8]
+    return {
+        'date': '%s-%s-%s' % (posted[0:4], posted[4:6], posted[6:8]) if len(posted) == 8 else None,
+        'type': trn.get('CHECKNUM') or trn.get('TRNTYPE'),
+        'payee': trn.get('NAME') or trn.get('PAYEE'),
+        'amount': trn.get('TRNAMT', '').replace(',', '.') or None,
+        'memo': trn.get('MEMO', ''),
+        'reconciled': 'C', # It's on the bank statement, so it has cleared
+        'fitid': trn.get('FITID')
+    }
+
+def iter_csv(fileobj):
+    """
+    Yield one transaction dict per row of a CSV statement with a header row.
+    Amounts come from an 'amount' column or from 'debit'/'credit' columns.
+    """
+    reader = csv.reader(fileobj)
+    header = [h.strip().lower() for h in next(reader)]
+    columns = {}
+    for field, names in CSV_COLUMNS.iteritems():
+        for name in names:
+            if name in header:
+                columns[field] = header.index(name)
+                break
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        get = lambda field: row[columns[field]].strip() if field in columns and columns[field] < len(row) else ''
+        amount = get('amount').replace('$', '').replace(',', '')
+        if not amount and (get('debit') or get('credit')):
+            debit = get('debit').replace('$', '').replace(',', '').lstrip('-')
+            amount = '-' + debit if debit else get('credit').replace('$', '').replace(',', '')
+        yield {
+            'date': _csv_date(get('date')),
+            'type': get('type'),
+            'payee': get('payee'),
+            'amount': amount or None,
+            'memo': get('memo'),
+            'reconciled': 'C'
+        }
+
+def _csv_date(value):
+    for fmt in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    return None
+
+
+class PayeeMatcher(object):
+    """
+    Maps statement payee names onto existing payees (case and whitespace
+    insensitive), loading the payees once per import
+    """
+    def __init__(self):
+        self.names = {}
+        for payee in all_payees():
+            self.names[self.normalize(payee['name'])] = payee['name']
+
+    @staticmethod
+    def normalize(name):
+        return ' '.join(name.lower().split())
+
+    def match(self, name):
+        if not name:
+            return name
+        return self.names.get(self.normalize(name), name)
@@ -0,0 +1,45 @@
+import pymongo
+from pymongo.errors import OperationFailure
+from abacuspb import app, db
+from abacuspb.storage import SINGLE
+
+TEXT_INDEX = [('payee', pymongo.TEXT), ('memo', pymongo.TEXT)] # Transaction search; split memos are not indexed
+
+def ensure_indexes():
+    """
+    Create the indexes used by the API queries (no-op if they already exist)
+    """
+    db.accounts.create_index('id', unique=True)
+    for collection in ['payees', 'categories']:
+        try:
+            db[collection].create_index('name', unique=True)
+        except OperationFailure: # Names duplicated before the index existed
+            app.logger.error('Unique index on %s.name not created: the collection has duplicate names. '
+                             'Run "python manage.py dedupe-names" to fix them.' % collection)
+    db.checkpoints.create_index([('account_id', pymongo.ASCENDING), ('month', pymongo.ASCENDING)], unique=True)
+    db.schedules.create_index('id', unique=True)
+    db.schedules.create_index('next_date') # Due occurrences
+    db.budgets.create_index([('category_id', pymongo.ASCENDING), ('month', pymongo.ASCENDING)], unique=True)
+    db.rollups.create_index([('account_id', pymongo.ASCENDING), ('month', pymongo.ASCENDING), ('category', pymongo.ASCENDING)], unique=True)
+    if app.config['TRANSACTION_LAYOUT'] == SINGLE:
+        db.transactions.create_index([('account_id', pymongo.ASCENDING), ('id', pymongo.ASCENDING)], unique=True)
+        db.transactions.create_index([('account_id', pymongo.ASCENDING), ('date', pymongo.DESCENDING), ('id', pymongo.ASCENDING)])
+        db.transactions.create_index('fingerprint', unique=True, sparse=True)
+        db.transactions.create_index([('date', pymongo.DESCENDING)]) # Cross-account reports
+        db.transactions.create_index(TEXT_INDEX, name='payee_memo_text')
+        db.transactions.create_index([('account_id', pymongo.ASCENDING), ('splits.cat_or_acct_id', pymongo.ASCENDING)])
+    else:
+        for account in db.accounts.find(projection={'id': True}):
+            ensure_account_indexes(account['id'])
+
+def ensure_account_indexes(account_id):
+    """
+    Create the indexes for a single account's transactions collection
+    """
+    if app.config['TRANSACTION_LAYOUT'] == SINGLE:
+        return # Covered by the shared collection's indexes
+    db[account_id].create_index('id', unique=True)
+    db[account_id].create_index([('date', pymongo.DESCENDING), ('id', pymongo.ASCENDING)])
+    db[account_id].create_index('fingerprint', unique=True, sparse=True) # Duplicate detection
+    db[account_id].create_index(TEXT_INDEX, name='payee_memo_text')
+    db[account_id].create_index('splits.cat_or_acct_id', sparse=True) # Multikey: one entry per split
@@ -0,0 +1,165 @@
+import os, socket, threading, time
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from abacuspb import app, db
+from abacuspb.storage import transactions_for, insert_missing
+from abacuspb.balances import apply_balance_delta
+from abacuspb.rollups import merge_rollup_deltas, apply_rollup_deltas
+
+class Journal(object):
+    """
+    Write-ahead journal for one logical write that spans several documents
+    (a transaction, its mirrored transfer, both accounts' balances and the
+    rollups).
+    
+    Operations are collected first, then commit() stores them in db.journal
+    before applying them in order and deletes the entry once all of them
+    have been applied, recording its progress on the entry as it goes. An
+    entry left behind by a crash is finished by replay_journal(), on
+    startup and then periodically, from the first operation not recorded
+    as applied. Every operation is idempotent, so the one interrupted by
+    the crash can safely be applied again: inserts only insert when the id
+    is missing, and the $inc updates of balances, rollups and checkpoints
+    record the entry id on the documents they change.
+    """
+    def __init__(self):
+        self.ops = []
+    
+    def insert(self, account_id, transaction):
+        self.ops.append({'op': 'insert', 'account_id': account_id, 'doc': _without_id(transaction)})
+    
+    def insert_many(self, account_id, transactions):
+        self.ops.append({'op': 'insert_many', 'account_id': account_id, 'docs': map(_without_id, transactions)})
+    
+    def replace(self, account_id, transaction):
+        self.ops.append({'op': 'replace', 'account_id': account_id, 'doc': _without_id(transaction)})
+    
+    def set(self, account_id, trans_id, fields):
+        self.ops.append({'op': 'set', 'account_id': account_id, 'id': trans_id, 'fields': fields})
+    
+    def remove(self, account_id, trans_id):
+        self.ops.append({'op': 'remove', 'account_id': account_id, 'id': trans_id})
+    
+    def balance(self, account_id, delta):
+        self.ops.append({'op': 'balance', 'account_id': account_id, 'delta': delta})
+    
+    def rollups(self, changes):
+        """
+        Queue (rollup key, delta) pairs as produced by rollup_key/rollup_delta
+        """
+        deltas = merge_rollup_deltas(changes)
+        self.ops.append({'op': 'rollups',
+                         'rows': [{'account_id': account_id, 'category': category, 'month': month, 'delta': delta}
+                                  for (account_id, category, month), delta in deltas.iteritems()]})
+    
+    def commit(self):
+        """
+        Journal and apply the operations. Returns the new balances of each
+        'balance' operation, in order. Raises DuplicateKeyError (and writes
+        nothing) when the first operation inserts a duplicate transaction,
+        or for insert_many, when any of its transactions is a duplicate.
+        """
+        entry_id = db.journal.insert_one({'ops': self.ops, 'created': datetime.utcnow()}).inserted_id
+        return apply_entry(entry_id, self.ops)
+
+def apply_entry(entry_id, ops, start=0):
+    """
+    Apply a journal entry's operations from index start on, recording the
+    progress on the entry after each one, and delete the entry
+    """
+    results = []
+    for index, op in enumerate(ops):
+        if index < start: # Applied before the crash
+            continue
+        try:
+            result = _apply(entry_id, op)
+        except DuplicateKeyError:
+            if index == 0: # Nothing applied yet: abandon the entry
+                db.journal.delete_one({'_id': entry_id})
+            raise
+        if op['op'] == 'balance':
+            results.append(result)
+        if index < len(ops) - 1:
+            db.journal.update_one({'_id': entry_id}, {'$set': {'applied': index + 1}})
+    db.journal.delete_one({'_id': entry_id})
+    return results
+
+def _apply(entry_id, op):
+    if op['op'] == 'insert':
+        transactions_for(op['account_id']).update({'id': op['doc']['id']}, {'$setOnInsert': op['doc']}, upsert=True)
+    elif op['op'] == 'insert_many':
+        try:
+            insert_missing(op['account_id'], op['docs'])
+        except BulkWriteError as error:
+            if any(e['code'] != 11000 for e in error.details['writeErrors']):
+                raise
+            # Lost a race with identical transactions: take back the rest of the batch
+            transactions_for(op['account_id']).remove({'id': {'$in': [doc['id'] for doc in op['docs']]}})
+            raise DuplicateKeyError('Duplicate transaction in batch', 11000)
+    elif op['op'] == 'replace':
+        transactions_for(op['account_id']).update({'id': op['doc']['id']}, op['doc'])
+    elif op['op'] == 'set':
+        transactions_for(op['account_id']).update({'id': op['id']}, {'$set': op['fields']})
+    elif op['op'] == 'remove':
+        transactions_for(op['account_id']).remove({'id': op['id']})
+    elif op['op'] == 'balance':
+        return apply_balance_delta(op['account_id'], op['delta'], entry_id)
+    elif op['op'] == 'rollups':
+        apply_rollup_deltas(dict(((row['account_id'], row['category'], row['month']), row['delta']) for row in op['rows']),
+                            entry_id)
+    else:
+        raise ValueError('Unknown journal operation: %s' % op['op'])
+
+def replay_journal(grace=None):
+    """
+    Finish the writes left in the journal, oldest first. Only entries older
+    than JOURNAL_REPLAY_GRACE seconds are replayed (younger ones are most
+    likely still being applied by their request), and each one is claimed
+    first so that concurrent replayers never apply the same entry; a claim
+    lapses after the same grace period, in case its replayer died. Replay
+    resumes after the last operation recorded as applied. Returns the
+    number of entries replayed.
+    """
+    if grace == None:
+        grace = app.config['JOURNAL_REPLAY_GRACE']
+    owner = '%s:%d' % (socket.gethostname(), os.getpid())
+    replayed = 0
+    while True:
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=grace)
+        entry = db.journal.find_one_and_update({'created': {'$lte': cutoff},
+                                                '$or': [{'replaying': {'$exists': False}}, {'replaying.at': {'$lte': cutoff}}]},
+                                               {'$set': {'replaying': {'owner': owner, 'at': now}}},
+                                               sort=[('_id', 1)])
+        if entry == None:
+            return replayed
+        try:
+            apply_entry(entry['_id'], entry['ops'], entry.get('applied', 0))
+        except DuplicateKeyError:
+            pass # Lost a race with an identical transaction; abandoned
+        except Exception:
+            app.logger.exception('Journal entry %s could not be replayed' % entry['_id'])
+            continue # Claimed until the grace period lapses, so not retried in this run
+        replayed += 1
+
+def start_replayer():
+    """
+    Replay the journal every JOURNAL_REPLAY_INTERVAL seconds in a
+    background thread, so entries left by a crashed worker are finished
+    without a restart
+    """
+    def run():
+        while True:
+            time.sleep(app.config['JOURNAL_REPLAY_INTERVAL'])
+            try:
+                replay_journal()
+            except Exception:
+                app.logger.exception('Journal replay failed')
+    replayer = threading.Thread(target=run, name='journal-replay')
+    replayer.daemon = True
+    replayer.start()
+
+def _without_id(transaction):
+    doc = dict(transaction)
+    doc.pop('_id', None)
+    return doc
@@ -0,0 +1,129 @@
+import re
+from pymongo import ReplaceOne, UpdateOne
+from abacuspb import db
+from abacuspb.storage import AccountTransactions, transactions_for
+from abacuspb.money import to_cents
+from abacuspb.versions import bump_version
+
+BALANCE_FIELDS = ['bal_uncleared', 'bal_cleared', 'bal_reconciled']
+
+def migrate_to_single_collection(drop=False, batch_size=1000):
+    """
+    Copy every per-account transactions collection into the shared
+    'transactions' collection. Safe to re-run: documents are upserted on
+    (account_id, id). Returns the number of documents copied per account.
+    """
+    copied = {}
+    for account in db.accounts.find(projection={'id': True}):
+        account_id = account['id']
+        target = AccountTransactions(account_id)
+        ops = []
+        copied[account_id] = 0
+        for doc in db[account_id].find():
+            doc = target._stamp(doc)
+            ops.append(ReplaceOne({'account_id': account_id, 'id': doc['id']}, doc, upsert=True))
+            if len(ops) == batch_size:
+                db.transactions.bulk_write(ops, ordered=False)
+                copied[account_id] += len(ops)
+                ops = []
+        if ops:
+            db.transactions.bulk_write(ops, ordered=False)
+            copied[account_id] += len(ops)
+        if drop:
+            db[account_id].drop()
+    return copied
+
+def migrate_balances_to_cents():
+    """
+    Convert account balances stored as float dollars to integer cents.
+    Only documents still holding doubles are touched, so re-running is safe.
+    Returns the number of accounts converted.
+    """
+    converted = 0
+    for account in db.accounts.find({'$or': [{f: {'$type': 'double'}} for f in BALANCE_FIELDS]}):
+        db.accounts.update_one({'_id': account['_id']},
+                               {'$set': dict((f, to_cents(account.get(f) or 0)) for f in BALANCE_FIELDS
+                                             if not isinstance(account.get(f), (int, long)))})
+        converted += 1
+    if converted:
+        bump_version('accounts')
+    return converted
+
+def migrate_amounts_to_cents(batch_size=1000):
+    """
+    Convert transaction amounts stored as float dollars to integer cents in
+    every account. Returns the number of transactions converted.
+    """
+    converted = 0
+    for account in db.accounts.find(projection={'id': True}):
+        collection = transactions_for(account['id'])
+        ops = []
+        for tran in collection.find({'amount': {'$type': 'double'}}, projection={'amount': True}):
+            ops.append(UpdateOne({'_id': tran['_id']}, {'$set': {'amount': to_cents(tran['amount'])}}))
+            if len(ops) == batch_size:
+                converted += collection.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            converted += collection.bulk_write(ops, ordered=False).modified_count
+    return converted
+
+def backfill_fingerprints(batch_size=1000):
+    """
+    Fingerprint existing non-transfer transactions so they take part in
+    duplicate detection. Documents that duplicate an already fingerprinted
+    one are left alone and reported as (account_id, id, duplicate of id).
+    Returns (number fingerprinted, duplicates).
+    """
+    from abacuspb.resources.transactions import transaction_fingerprint
+    fingerprinted = 0
+    duplicates = []
+    for account in db.accounts.find(projection={'id': True}):
+        account_id = account['id']
+        collection = transactions_for(account_id)
+        seen = dict((doc['fingerprint'], doc['id']) for doc in
+                    collection.find({'fingerprint': {'$exists': True}}, projection={'fingerprint': True, 'id': True}))
+        ops = []
+        for tran in collection.find({'fingerprint': {'$exists': False}, 'cat_or_acct_id': {'$not': re.compile('^acct_')}}):
+            fingerprint = transaction_fingerprint(account_id, tran)
+            if fingerprint in seen:
+                duplicates.append((account_id, tran['id'], seen[fingerprint]))
+                continue
+            seen[fingerprint] = tran['id']
+            ops.append(UpdateOne({'_id': tran['_id']}, {'$set': {'fingerprint': fingerprint}}))
+            if len(ops) == batch_size:
+                fingerprinted += collection.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            fingerprinted += collection.bulk_write(ops, ordered=False).modified_count
+    return fingerprinted, duplicates
+
+def dedupe_names():
+    """
+    Make payee and category names unique so their unique indexes can be
+    built. Transactions refer to payees by name, so duplicate payees are
+    deleted (the oldest is kept); categories are referenced by id, so
+    duplicates are renamed to 'Name (2)', 'Name (3)', ... instead.
+    Returns the changes as (collection, id, old name, new name or None).
+    """
+    changes = []
+    for collection in ['payees', 'categories']:
+        fixed = len(changes)
+        groups = db[collection].aggregate([{'$group': {'_id': '$name', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+                                           {'$match': {'count': {'$gt': 1}}}])
+        for group in groups:
+            name = group['_id']
+            number = 1
+            for doc in db[collection].find({'_id': {'$in': group['ids']}}, sort=[('_id', 1)])[1:]:
+                if collection == 'payees':
+                    db.payees.delete_one({'_id': doc['_id']})
+                    changes.append((collection, doc['id'], name, None))
+                    continue
+                number += 1
+                while db.categories.find({'name': '%s (%d)' % (name, number)}).count():
+                    number += 1
+                new_name = '%s (%d)' % (name, number)
+                db.categories.update_one({'_id': doc['_id']}, {'$set': {'name': new_name}})
+                changes.append((collection, doc['id'], name, new_name))
+        if len(changes) > fixed:
+            bump_version(collection)
+    return changes
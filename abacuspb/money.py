@@ -0,0 +1,22 @@
+from decimal import Decimal, ROUND_HALF_UP
+from flask.ext.restful import fields
+
+def to_cents(amount):
+    """
+    Convert a dollar amount (float, string or Decimal) to integer cents
+    """
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_dollars(cents):
+    """
+    Convert integer cents to a dollar amount for output
+    """
+    return cents / 100.0
+
+
+class Money(fields.Raw):
+    """
+    Marshal an amount stored as integer cents as a dollar value
+    """
+    def format(self, value):
+        return to_dollars(value)
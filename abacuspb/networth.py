@@ -0,0 +1,97 @@
+import bisect
+from datetime import datetime, date, timedelta
+from abacuspb import db
+from abacuspb.storage import transactions_for
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # Balances are accumulated in pure Python instead
+
+INTERVALS = ['day', 'week', 'month']
+
+def period_ends(start, end, interval):
+    """
+    Last day of each day, week (Monday to Sunday) or month from start to
+    end; the final period is cut short at end
+    """
+    if interval == 'day':
+        return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    ends = []
+    if interval == 'week':
+        day = start + timedelta(days=6 - start.weekday())
+        while day < end:
+            ends.append(day)
+            day += timedelta(days=7)
+    else:
+        day = start
+        while True:
+            next_month = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+            day = next_month - timedelta(days=1)
+            if day >= end:
+                break
+            ends.append(day)
+            day = next_month
+    ends.append(end)
+    return ends
+
+def daily_totals(account_id, start):
+    """
+    (day ordinal, cents) sums of the account's transactions dated start or later
+    """
+    groups = transactions_for(account_id).aggregate([
+        {'$match': {'date': {'$gte': datetime(start.year, start.month, start.day)}}},
+        {'$group': {'_id': '$date', 'amount': {'$sum': '$amount'}}}])
+    return [(group['_id'].toordinal(), group['amount']) for group in groups]
+
+def networth_series(start, end, interval):
+    """
+    Every account's balance at the end of each period from start to end.
+
+    Balances are anchored to the stored bal_uncleared: the balance at a
+    period's end is the current balance less everything dated after it,
+    so only transactions from start on are read. Returns the period end
+    dates, the accounts, their balance rows and the per-period totals
+    (amounts in cents).
+    """
+    ends = period_ends(start, end, interval)
+    accounts = list(db.accounts.find(projection={'_id': False, 'id': True, 'name': True, 'bal_uncleared': True},
+                                     sort=[('name', 1)]))
+    anchors = [account.get('bal_uncleared') or 0 for account in accounts]
+    deltas = [daily_totals(account['id'], start) for account in accounts]
+    balances = numpy_balances if numpy else python_balances
+    rows, totals = balances([day.toordinal() for day in ends], anchors, deltas)
+    return ends, accounts, rows, totals
+
+def numpy_balances(ends, anchors, deltas):
+    """
+    Bucket the daily deltas into periods, with a last bucket for anything
+    after the final period, and take reverse cumulative sums for every
+    account at once
+    """
+    buckets = numpy.zeros((len(anchors), len(ends) + 1), dtype=numpy.int64)
+    for row, days in enumerate(deltas):
+        if days:
+            ordinals, amounts = zip(*days)
+            numpy.add.at(buckets[row], numpy.searchsorted(ends, ordinals), amounts)
+    later = numpy.cumsum(buckets[:, ::-1], axis=1)[:, ::-1] # later[:, i] = sum of buckets i onwards
+    rows = numpy.array(anchors, dtype=numpy.int64).reshape(-1, 1) - later[:, 1:]
+    return rows.tolist(), rows.sum(axis=0).tolist()
+
+def python_balances(ends, anchors, deltas):
+    """
+    Same as numpy_balances, one account and period at a time
+    """
+    rows = []
+    for anchor, days in zip(anchors, deltas):
+        buckets = [0] * (len(ends) + 1)
+        for day, amount in days:
+            buckets[bisect.bisect_left(ends, day)] += amount
+        row = [0] * len(ends)
+        balance = anchor
+        for i in range(len(ends) - 1, -1, -1):
+            balance -= buckets[i + 1]
+            row[i] = balance
+        rows.append(row)
+    totals = [sum(column) for column in zip(*rows)] if rows else [0] * len(ends)
+    return rows, totals
@@ -0,0 +1,157 @@
+import bisect, threading, time
+from abacuspb import app, db
+from abacuspb.storage import aggregate_all
+
+def normalize(name):
+    return ' '.join((name or '').lower().split())
+
+class PayeeIndex(object):
+    """
+    In-memory prefix index over payee names for type-ahead search.
+    
+    Every word of a name is a sorted key (so 'lion' finds 'Food Lion'), and
+    a search is a bisect to the first key with the prefix followed by a scan
+    of the matching keys. Matches are ranked by how many transactions use
+    the payee. The index is built from db.payees on first use and kept up
+    to date by the payee write paths. Once it is PAYEE_INDEX_TTL seconds
+    old, a search starts a rebuild in a background thread (one at a time)
+    to pick up new usage counts and writes from other processes; searches
+    keep using the current snapshot, and writes made while the rebuild
+    runs are applied again to the new one.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock() # One build at a time
+        self.built = None
+        self.refreshing = False
+        self.pending = None # (payee id, name or None when removed) written during a build
+        self.keys = [] # Sorted (key, payee id)
+        self.names = {} # payee id -> name
+        self.counts = {} # normalized payee name -> number of transactions
+    
+    def load(self):
+        """
+        ({payee id: name}, {normalized name: use count}) read from the database
+        """
+        counts = {}
+        for group in aggregate_all([{'$group': {'_id': '$payee', 'count': {'$sum': 1}}}]):
+            key = normalize(group['_id'])
+            counts[key] = counts.get(key, 0) + group['count']
+        names = dict((p['id'], p['name']) for p in db.payees.find(projection={'_id': False, 'id': True, 'name': True}))
+        return names, counts
+    
+    def build(self):
+        """
+        Read the payees and usage counts and swap in a new snapshot, with
+        the writes made in the meantime applied to it
+        """
+        with self.build_lock:
+            self._build()
+    
+    def _build(self):
+        with self.lock:
+            self.pending = []
+        try:
+            names, counts = self.load()
+            keys = sorted(key for id, name in names.iteritems() for key in self.index_keys(id, name))
+        except Exception:
+            with self.lock:
+                self.pending = None
+            raise
+        with self.lock:
+            self.keys, self.names, self.counts = keys, names, counts
+            for id, name in self.pending:
+                self._remove(id)
+                if name != None:
+                    self._add(id, name)
+            self.pending = None
+            self.built = time.time()
+    
+    def refresh(self):
+        """
+        Rebuild in the background; a failed rebuild is retried after
+        another PAYEE_INDEX_TTL seconds
+        """
+        try:
+            self.build()
+        except Exception:
+            app.logger.exception('Payee index rebuild failed')
+            with self.lock:
+                self.built = time.time()
+        finally:
+            with self.lock:
+                self.refreshing = False
+    
+    def reset(self):
+        """
+        Drop the index; the next search builds it again
+        """
+        with self.build_lock:
+            with self.lock:
+                self.built = None
+                self.keys, self.names, self.counts = [], {}, {}
+    
+    @staticmethod
+    def index_keys(id, name):
+        words = normalize(name).split(' ')
+        return [(' '.join(words[i:]), id) for i in range(len(words)) if words[i]]
+    
+    def search(self, prefix, limit):
+        """
+        Up to limit (payee id, name, use count) whose name or one of its
+        words starts with prefix, most used first
+        """
+        if self.built == None:
+            with self.build_lock: # The first search builds the index, concurrent ones wait for it
+                if self.built == None:
+                    self._build()
+        prefix = normalize(prefix)
+        with self.lock:
+            ids = set()
+            for index in xrange(bisect.bisect_left(self.keys, (prefix,)), len(self.keys)): # No copy of the tail
+                key, id = self.keys[index]
+                if not key.startswith(prefix):
+                    break
+                ids.add(id)
+            matches = [(id, self.names[id], self.counts.get(normalize(self.names[id]), 0)) for id in ids if id in self.names]
+            stale = self.built != None and not self.refreshing and time.time() - self.built > app.config['PAYEE_INDEX_TTL']
+            if stale:
+                self.refreshing = True
+        if stale:
+            refresher = threading.Thread(target=self.refresh, name='payee-index-refresh')
+            refresher.daemon = True
+            refresher.start()
+        matches.sort(key=lambda m: (-m[2], m[1].lower()))
+        return matches[:limit]
+    
+    def add(self, id, name):
+        """
+        Index a new payee, or re-index a renamed one
+        """
+        with self.lock:
+            self._remove(id)
+            self._add(id, name)
+            if self.pending != None:
+                self.pending.append((id, name))
+    
+    def remove(self, id):
+        with self.lock:
+            self._remove(id)
+            if self.pending != None:
+                self.pending.append((id, None))
+    
+    def _add(self, id, name):
+        self.names[id] = name
+        for key in self.index_keys(id, name):
+            bisect.insort(self.keys, key)
+    
+    def _remove(self, id):
+        name = self.names.pop(id, None)
+        if name == None:
+            return
+        for key in self.index_keys(id, name):
+            index = bisect.bisect_left(self.keys, key)
+            if index < len(self.keys) and self.keys[index] == key:
+                del self.keys[index]
+
+payee_index = PayeeIndex()
@@ -0,0 +1,100 @@
+from multiprocessing.pool import ThreadPool
+from abacuspb import app, db
+from abacuspb.storage import transactions_for
+from abacuspb.balances import BALANCE_FIELDS
+from abacuspb.versions import bump_version
+
+RECONCILE_RETRIES = 3 # Attempts to repair an account that is being written to
+
+BALANCE_GROUP = {'$group': {
+    '_id': None,
+    'bal_uncleared': {'$sum': '$amount'},
+    'bal_cleared': {'$sum': {'$cond': [{'$or': [{'$eq': ['$reconciled', 'C']}, {'$eq': ['$reconciled', 'R']}]}, '$amount', 0]}},
+    'bal_reconciled': {'$sum': {'$cond': [{'$eq': ['$reconciled', 'R']}, '$amount', 0]}}
+}}
+
+def computed_balances(account_id):
+    """
+    The three balances of an account in cents, recomputed from its
+    transactions with a single aggregation
+    """
+    balances = dict((field, 0) for field in BALANCE_FIELDS)
+    for group in transactions_for(account_id).aggregate([BALANCE_GROUP]):
+        for field in BALANCE_FIELDS:
+            balances[field] = group[field]
+    return balances
+
+def verify_account(account, repair=False):
+    """
+    Compare an account's stored balances with its opening balances plus
+    its transactions. Returns None when they agree, otherwise
+    { 'id', 'stored', 'computed', 'repaired' } (cents).
+    
+    With repair=True the computed balances are written with a
+    compare-and-set on the stored balances they were compared with, and
+    only while no journaled write to the account is in flight (its
+    transaction may already be counted while its balance $inc is still to
+    come). When a write lands in between, the balances are read and
+    computed again, up to RECONCILE_RETRIES times. Accounts without a
+    recorded opening balance are never repaired: their difference may be
+    the opening balance (see record_opening_balances).
+    """
+    for attempt in range(RECONCILE_RETRIES):
+        if attempt:
+            account = db.accounts.find_one({'id': account['id']}, projection=['id', 'opening'] + BALANCE_FIELDS)
+            if account == None: # Deleted meanwhile
+                return None
+        stored = dict((field, account.get(field, 0)) for field in BALANCE_FIELDS)
+        opening = account.get('opening') or {}
+        computed = computed_balances(account['id'])
+        computed = dict((field, computed[field] + opening.get(field, 0)) for field in BALANCE_FIELDS)
+        if stored == computed:
+            return None
+        mismatch = { 'id': account['id'], 'stored': stored, 'computed': computed, 'repaired': False }
+        if not repair or 'opening' not in account:
+            return mismatch
+        if db.journal.find_one({'ops.account_id': account['id']}, projection={'_id': True}):
+            continue
+        if db.accounts.update_one(dict(stored, id=account['id']), {'$set': computed}).matched_count:
+            bump_version('accounts')
+            mismatch['repaired'] = True
+            return mismatch
+    return mismatch # Still being written to; left for the next check
+
+def record_opening_balances():
+    """
+    Record the opening balances of accounts created before they were
+    tracked: whatever the stored balances hold beyond the transactions.
+    Run this once, before any repair, on balances believed to be right.
+    Accounts with a journaled write in flight are skipped; re-run for them.
+    Returns (number recorded, ids skipped).
+    """
+    recorded = 0
+    skipped = []
+    for account in db.accounts.find({'opening': {'$exists': False}}, projection=['id'] + BALANCE_FIELDS):
+        stored = dict((field, account.get(field, 0)) for field in BALANCE_FIELDS)
+        computed = computed_balances(account['id'])
+        opening = dict((field, stored[field] - computed[field]) for field in BALANCE_FIELDS)
+        if db.journal.find_one({'ops.account_id': account['id']}, projection={'_id': True}) or \
+           not db.accounts.update_one(dict(stored, id=account['id'], opening={'$exists': False}),
+                                      {'$set': {'opening': opening}}).matched_count:
+            skipped.append(account['id'])
+            continue
+        recorded += 1
+    return recorded, skipped
+
+def verify_balances(repair=False, workers=None):
+    """
+    Check every account's balances in parallel (one aggregation per account
+    on a thread pool) and return the list of mismatches from verify_account
+    """
+    accounts = list(db.accounts.find(projection=['id', 'opening'] + BALANCE_FIELDS))
+    if not accounts:
+        return []
+    pool = ThreadPool(min(workers or app.config['RECONCILE_WORKERS'], len(accounts)))
+    try:
+        results = pool.map(lambda account: verify_account(account, repair), accounts)
+    finally:
+        pool.close()
+        pool.join()
+    return sorted([result for result in results if result], key=lambda result: result['id'])
@@ -1,15 +1,25 @@
 from flask import abort
-from flask.ext.restful import Resource, reqparse, fields, marshal
+from flask.ext.restful import Resource, reqparse, fields
+from pymongo import ReturnDocument
 from abacuspb import db
+from abacuspb.indexes import ensure_account_indexes
+from abacuspb.storage import transactions_for
+from abacuspb.money import Money, to_cents
+from abacuspb.marshalling import Marshaller
+from abacuspb.versions import conditional, bump_version
+from abacuspb.cache import invalidate
+from abacuspb.checkpoints import clear_checkpoints
+
+BALANCE_RETRIES = 3 # Attempts to set balances while the account is being written to
 
 account_fields = { # Request validator
     'name': fields.String,
     'type': fields.String,
     'bank_name': fields.String,
     'account_num': fields.String,
-    'bal_uncleared': fields.Float,
-    'bal_cleared': fields.Float,
-    'bal_reconciled': fields.Float,
+    'bal_uncleared': Money, # Stored as integer cents
+    'bal_cleared': Money,
+    'bal_reconciled': Money,
     #'last_stmt_date': fields.DateTime,
     #'credit_limit': fields.Float,
     #'purchase_price': fields.Float,
@@ -18,36 +28,34 @@ account_fields = { # Request validator
     'uri': fields.Url('account')
 }
 
+account_marshaller = Marshaller(account_fields)
+
+account_list_parser = reqparse.RequestParser()
+account_list_parser.add_argument('name', type=str, required=True, help='No account name provided', location='json')
+account_list_parser.add_argument('type', type=str, required=True, help='No account type provided', location='json')
+account_list_parser.add_argument('bank_name', type=str, default="", location='json')
+account_list_parser.add_argument('account_num', type=str, default="", location='json')
+account_list_parser.add_argument('bal_uncleared', type=float, location='json')
+account_list_parser.add_argument('bal_cleared', type=float, location='json')
+account_list_parser.add_argument('bal_reconciled', type=float, location='json')
+account_list_parser.add_argument('budget_monitored', type=bool, default=False, location='json')
+
 class AccountListAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('name', type=str, required=True, help='No account name provided', location='json')
-        self.reqparse.add_argument('type', type=str, required=True, help='No account type provided', location='json')
-        self.reqparse.add_argument('bank_name', type=str, default="", location='json')
-        self.reqparse.add_argument('account_num', type=str, default="", location='json')
-        self.reqparse.add_argument('bal_uncleared', type=float, location='json')
-        self.reqparse.add_argument('bal_cleared', type=float, location='json')
-        self.reqparse.add_argument('bal_reconciled', type=float, location='json')
-        self.reqparse.add_argument('budget_monitored', type=bool, default=False, location='json')
-        super(AccountListAPI, self).__init__()
-    
+    @conditional('accounts')
     def get(self):
         """
         Get all accounts
         """
-        accounts = []
-        accts = db.accounts.find()
-        if accts.count() == 0:
+        accounts = list(db.accounts.find())
+        if not accounts:
             abort(404)
-        for account in accts:
-            accounts.append(account)
-        return { 'accounts': map(lambda t: marshal(t, account_fields), accounts) }
+        return { 'accounts': account_marshaller.many(accounts) }
     
     def post(self):
         """
         Create a new account
         """
-        args = self.reqparse.parse_args()
+        args = account_list_parser.parse_args()
         # Check if account id already exists
         id = 'acct_' + args['name'].translate(None,"'!@#$%^&*()-_=+[{]}\|;:,<.>/?`~\"").lower().replace(" ","")
         if db.accounts.find({'id': id}).count() != 0:
@@ -59,28 +67,30 @@ class AccountListAPI(Resource):
             'type': args['type'],
             'bank_name': args['bank_name'],
             'account_num': args['account_num'],
-            'bal_uncleared': 0.0,
-            'bal_cleared': 0.0,
-            'bal_reconciled': 0.0,
+            'bal_uncleared': 0,
+            'bal_cleared': 0,
+            'bal_reconciled': 0,
+            'opening': {'bal_uncleared': 0, 'bal_cleared': 0, 'bal_reconciled': 0}, # Balance not explained by transactions
             'budget_monitored': args['budget_monitored']
         }
         db.accounts.insert(account)
-        return { 'account': marshal(account, account_fields) }, 201
+        ensure_account_indexes(id)
+        invalidate('accounts', id)
+        bump_version('accounts')
+        return { 'account': account_marshaller(account) }, 201
 
 
+account_parser = reqparse.RequestParser()
+account_parser.add_argument('name', type=str, location='json')
+account_parser.add_argument('type', type=str, location='json')
+account_parser.add_argument('bank_name', type=str, location='json')
+account_parser.add_argument('account_num', type=str, location='json')
+account_parser.add_argument('bal_uncleared', type=float, location='json')
+account_parser.add_argument('bal_cleared', type=float, location='json')
+account_parser.add_argument('bal_reconciled', type=float, location='json')
+account_parser.add_argument('budget_monitored', type=bool, location='json')
+
 class AccountAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('name', type=str, location='json')
-        self.reqparse.add_argument('type', type=str, location='json')
-        self.reqparse.add_argument('bank_name', type=str, location='json')
-        self.reqparse.add_argument('account_num', type=str, location='json')
-        self.reqparse.add_argument('bal_uncleared', type=float, location='json')
-        self.reqparse.add_argument('bal_cleared', type=float, location='json')
-        self.reqparse.add_argument('bal_reconciled', type=float, location='json')
-        self.reqparse.add_argument('budget_monitored', type=bool, location='json')
-        super(AccountAPI, self).__init__()
-    
     def get(self, id):
         """
         Get single account by id
@@ -88,22 +98,40 @@ class AccountAPI(Resource):
         account = db.accounts.find({'id':id})
         if account.count() == 0:
             abort(404)
-        return { 'account': marshal(account[0], account_fields) }
+        return { 'account': account_marshaller(account[0]) }
     
     def put(self, id):
         """
-        Update single account by id
+        Update single account by id. Balances set here are corrections that
+        transactions do not explain, so the recorded opening balance moves
+        with them (compare-and-set on the balances it was adjusted from).
         """
-        account = db.accounts.find({'id':id})
-        if account.count() == 0:
+        args = account_parser.parse_args()
+        changes = dict((k, to_cents(v) if k.startswith('bal_') else v) for k, v in args.iteritems() if v != None)
+        balances = [k for k in changes if k.startswith('bal_')]
+        for attempt in range(BALANCE_RETRIES):
+            spec = {'id':id}
+            update = {'$set': changes} # Only the supplied fields, so concurrent balance updates are kept
+            if balances:
+                account = db.accounts.find_one({'id':id}, projection=['opening'] + balances)
+                if account == None:
+                    abort(404)
+                spec.update((k, account.get(k)) for k in balances)
+                if 'opening' in account:
+                    update['$inc'] = dict(('opening.' + k, changes[k] - (account.get(k) or 0)) for k in balances)
+            if changes:
+                account = db.accounts.find_one_and_update(spec, update, return_document=ReturnDocument.AFTER)
+            else:
+                account = db.accounts.find_one(spec)
+            if account != None or not balances:
+                break
+        if account == None:
+            if balances and db.accounts.find({'id':id}).count() != 0:
+                return { 'message': 'Account is being updated, try again', 'status': 409 }, 409
             abort(404)
-        account = account[0]
-        args = self.reqparse.parse_args()
-        for k, v in args.iteritems():
-            if v != None:
-                account[k] = v
-        db.accounts.update({'id':id}, account)
-        return { 'account': marshal(account, account_fields) }
+        invalidate('accounts', id)
+        bump_version('accounts')
+        return { 'account': account_marshaller(account) }
     
     def delete(self, id):
         """
@@ -111,6 +139,11 @@ class AccountAPI(Resource):
         """
         if not db.accounts.remove({'id':id})['n']:
             abort(404)
-        # Remove associated transactions collection for account
-        db[id].drop()
+        # Remove associated transactions collection, rollups, checkpoints and schedules for account
+        transactions_for(id).drop()
+        db.rollups.remove({'account_id': id})
+        clear_checkpoints(id)
+        db.schedules.remove({'account_id': id})
+        invalidate('accounts', id)
+        bump_version('accounts')
         return { 'result': True }
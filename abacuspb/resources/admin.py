@@ -0,0 +1,36 @@
+from flask.ext.restful import Resource, reqparse
+from abacuspb.reconcile import verify_balances, BALANCE_FIELDS
+from abacuspb.money import to_dollars
+from abacuspb.cache import cache_stats
+
+balance_check_parser = reqparse.RequestParser()
+balance_check_parser.add_argument('repair', type=bool, default=False, location='json')
+
+class BalanceCheckAPI(Resource):
+    def get(self):
+        """
+        Recompute every account's balances from its transactions and report
+        the accounts whose stored balances differ
+        """
+        return { 'accounts': map(balance_mismatch, verify_balances()) }
+    
+    def post(self):
+        """
+        Same as GET; with { "repair": true } the stored balances of the
+        reported accounts are corrected where possible ('repaired' per account)
+        """
+        args = balance_check_parser.parse_args()
+        return { 'accounts': map(balance_mismatch, verify_balances(repair=args['repair'])) }
+
+class CacheStatsAPI(Resource):
+    def get(self):
+        """
+        Hit/miss counters and sizes of the in-process metadata caches
+        """
+        return { 'caches': cache_stats() }
+
+def balance_mismatch(result):
+    return { 'uri': '/api/accounts/' + result['id'],
+             'stored': dict((field, to_dollars(result['stored'][field])) for field in BALANCE_FIELDS),
+             'computed': dict((field, to_dollars(result['computed'][field])) for field in BALANCE_FIELDS),
+             'repaired': result['repaired'] }
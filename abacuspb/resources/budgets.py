@@ -0,0 +1,59 @@
+from flask import abort
+from flask.ext.restful import Resource, reqparse
+from datetime import datetime
+from abacuspb import db
+from abacuspb.money import to_cents, to_dollars
+from abacuspb.budgets import budget_report
+
+def valid_month(month):
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return False
+    return len(month) == 7
+
+class BudgetAPI(Resource):
+    def get(self, month):
+        """
+        Budget vs. actual for a month (YYYY-MM) for every budget tracked
+        category, across all budget monitored accounts. Actuals come from
+        the monthly rollups kept up to date by the transaction writes.
+        """
+        if not valid_month(month):
+            return { 'message': 'Month must be in YYYY-MM format', 'status': 400 }, 400
+        accounts, rows = budget_report(month)
+        total = dict((k, to_dollars(sum(row[k] for row in rows))) for k in ['budget', 'actual', 'remaining'])
+        for row in rows:
+            for k in ['budget', 'actual', 'remaining']:
+                row[k] = to_dollars(row[k])
+        return { 'budget': { 'month': month, 'accounts': accounts, 'categories': rows, 'total': total } }
+
+
+budget_parser = reqparse.RequestParser()
+budget_parser.add_argument('amount', type=to_cents, required=True, help='No budget amount provided', location='json')
+
+class BudgetCategoryAPI(Resource):
+    def put(self, month, category_id):
+        """
+        Set a category's monthly budget from this month (YYYY-MM) on
+        """
+        if not valid_month(month):
+            return { 'message': 'Month must be in YYYY-MM format', 'status': 400 }, 400
+        category = db.categories.find_one({'id': category_id})
+        if category == None:
+            abort(404)
+        if not category.get('budget_tracked'):
+            return { 'message': 'Category is not budget tracked', 'status': 400 }, 400
+        args = budget_parser.parse_args()
+        db.budgets.update({'category_id': category_id, 'month': month},
+                          {'$set': {'amount': args['amount']}}, upsert=True)
+        return { 'budget': { 'month': month, 'category_id': category_id, 'amount': to_dollars(args['amount']) } }
+    
+    def delete(self, month, category_id):
+        """
+        Remove the budget set for a category in this month; an earlier
+        month's budget, if any, applies again
+        """
+        if not db.budgets.remove({'category_id': category_id, 'month': month})['n']:
+            abort(404)
+        return { 'result': True }
@@ -1,7 +1,11 @@
 from flask import abort
-from flask.ext.restful import Resource, reqparse, fields, marshal
+from flask.ext.restful import Resource, reqparse, fields
 from bson.objectid import ObjectId
 from abacuspb import db
+from abacuspb.marshalling import Marshaller
+from abacuspb.versions import conditional, bump_version
+from abacuspb.cache import invalidate
+from pymongo.errors import DuplicateKeyError
 import pymongo
 
 category_fields = { # Request validator
@@ -11,31 +15,29 @@ category_fields = { # Request validator
     'uri': fields.Url('category')
 }
 
+category_marshaller = Marshaller(category_fields)
+
+category_list_parser = reqparse.RequestParser()
+category_list_parser.add_argument('name', type=str, required=True, location='json')
+category_list_parser.add_argument('parent_id', type=str, location='json')
+category_list_parser.add_argument('budget_tracked', type=bool, location='json')
+
 class CategoryListAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('name', type=str, required=True, location='json')
-        self.reqparse.add_argument('parent_id', type=str, location='json')
-        self.reqparse.add_argument('budget_tracked', type=bool, location='json')
-        super(CategoryListAPI, self).__init__()
-    
+    @conditional('categories')
     def get(self):
         """
         Get all categories
         """
-        categories = []
-        cats = db.categories.find(sort=[('name', pymongo.ASCENDING)])
-        if cats.count() == 0:
+        categories = list(db.categories.find(sort=[('name', pymongo.ASCENDING)]))
+        if not categories:
             abort(404)
-        for cat in cats:
-            categories.append(cat)
-        return { 'categories': map(lambda t: marshal(t, category_fields), categories) }
+        return { 'categories': category_marshaller.many(categories) }
     
     def post(self):
         """
         Create a new category/sub-category
         """
-        args = self.reqparse.parse_args()
+        args = category_list_parser.parse_args()
         # Check if category already exists
         if db.categories.find({'name': args['name']}).count() != 0:
             return { 'message': 'category already exists', 'status': 400 }, 400
@@ -50,18 +52,21 @@ class CategoryListAPI(Resource):
             'parent_id': args['parent_id'],
             'budget_tracked': args['budget_tracked']
         }
-        db.categories.insert(category)
-        return { 'category': marshal(category, category_fields) }, 201
+        try:
+            db.categories.insert(category)
+        except DuplicateKeyError: # Created by a concurrent request
+            return { 'message': 'category already exists', 'status': 400 }, 400
+        invalidate('categories', category['id'])
+        bump_version('categories')
+        return { 'category': category_marshaller(category) }, 201
 
 
+category_parser = reqparse.RequestParser()
+category_parser.add_argument('name', type=str, location='json')
+category_parser.add_argument('parent_id', type=str, location='json')
+category_parser.add_argument('budget_tracked', type=bool, location='json')
+
 class CategoryAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('name', type=str, location='json')
-        self.reqparse.add_argument('parent_id', type=str, location='json')
-        self.reqparse.add_argument('budget_tracked', type=bool, location='json')
-        super(CategoryAPI, self).__init__()
-    
     def get(self, id):
         """
         Get single category by id
@@ -69,7 +74,7 @@ class CategoryAPI(Resource):
         category = db.categories.find_one({'id':id})
         if category == None:
             abort(404)
-        return { 'category': marshal(category, category_fields) }
+        return { 'category': category_marshaller(category) }
     
     def put(self, id):
         """
@@ -78,12 +83,19 @@ class CategoryAPI(Resource):
         category = db.categories.find_one({'id':id})
         if category == None:
             abort(404)
-        args = self.reqparse.parse_args()
+        args = category_parser.parse_args()
+        if args['name'] != None and db.categories.find({'name': args['name'], 'id': {'$ne': id}}).count() != 0:
+            return { 'message': 'category already exists', 'status': 400 }, 400
         for k, v in args.iteritems():
             if v != None:
                 category[k] = v
-        db.categories.update({'id':id}, category)
-        return { 'category': marshal(category, category_fields) }
+        try:
+            db.categories.update({'id':id}, category)
+        except DuplicateKeyError:
+            return { 'message': 'category already exists', 'status': 400 }, 400
+        invalidate('categories', id)
+        bump_version('categories')
+        return { 'category': category_marshaller(category) }
     
     def delete(self, id):
         """
@@ -91,4 +103,7 @@ class CategoryAPI(Resource):
         """
         if not db.categories.remove({'id':id})['n']:
             abort(404)
+        db.budgets.remove({'category_id': id})
+        invalidate('categories', id)
+        bump_version('categories')
         return { 'result': True }
@@ -1,7 +1,12 @@
 from flask import abort
-from flask.ext.restful import Resource, reqparse, fields, marshal
+from flask.ext.restful import Resource, reqparse, fields
 from bson.objectid import ObjectId
 from abacuspb import db
+from abacuspb.marshalling import Marshaller
+from abacuspb.versions import conditional, bump_version
+from abacuspb.cache import invalidate
+from abacuspb.payee_index import payee_index
+from pymongo.errors import DuplicateKeyError
 import pymongo
 
 payee_fields = { # Request validator
@@ -9,29 +14,30 @@ payee_fields = { # Request validator
     'uri': fields.Url('payee')
 }
 
+payee_marshaller = Marshaller(payee_fields)
+
+payee_search_fields = dict(payee_fields, count=fields.Integer) # Transactions using the payee
+payee_search_marshaller = Marshaller(payee_search_fields)
+
+payee_list_parser = reqparse.RequestParser()
+payee_list_parser.add_argument('name', type=str, required=True, location='json')
+
 class PayeeListAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('name', type=str, required=True, location='json')
-        super(PayeeListAPI, self).__init__()
-    
+    @conditional('payees')
     def get(self):
         """
         Get all payees
         """
-        payees = []
-        pays = db.payees.find(sort=[('name', pymongo.ASCENDING)])
-        if pays.count() == 0:
+        payees = list(db.payees.find(sort=[('name', pymongo.ASCENDING)]))
+        if not payees:
             abort(404)
-        for pay in pays:
-            payees.append(pay)
-        return { 'payees': map(lambda t: marshal(t, payee_fields), payees) }
+        return { 'payees': payee_marshaller.many(payees) }
     
     def post(self):
         """
         Create a new payee
         """
-        args = self.reqparse.parse_args()
+        args = payee_list_parser.parse_args()
         # Check if payee already exists
         if db.payees.find({'name': args['name']}).count() != 0:
             return { 'message': 'Payee already exists', 'status': 400 }, 400
@@ -40,16 +46,20 @@ class PayeeListAPI(Resource):
             'id': str(ObjectId()),
             'name': args['name']
         }
-        db.payees.insert(payee)
-        return { 'payee': marshal(payee, payee_fields) }, 201
+        try:
+            db.payees.insert(payee)
+        except DuplicateKeyError: # Created by a concurrent request
+            return { 'message': 'Payee already exists', 'status': 400 }, 400
+        payee_index.add(payee['id'], payee['name'])
+        invalidate('payees', payee['id'])
+        bump_version('payees')
+        return { 'payee': payee_marshaller(payee) }, 201
+
 
+payee_parser = reqparse.RequestParser()
+payee_parser.add_argument('name', type=str, location='json')
 
 class PayeeAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('name', type=str, location='json')
-        super(PayeeAPI, self).__init__()
-    
     def get(self, id):
         """
         Get single payee by id
@@ -57,7 +67,7 @@ class PayeeAPI(Resource):
         payee = db.payees.find_one({'id':id})
         if payee == None:
             abort(404)
-        return { 'payee': marshal(payee, payee_fields) }
+        return { 'payee': payee_marshaller(payee) }
     
     def put(self, id):
         """
@@ -66,12 +76,20 @@ class PayeeAPI(Resource):
         payee = db.payees.find_one({'id':id})
         if payee == None:
             abort(404)
-        args = self.reqparse.parse_args()
+        args = payee_parser.parse_args()
+        if args['name'] != None and db.payees.find({'name': args['name'], 'id': {'$ne': id}}).count() != 0:
+            return { 'message': 'Payee already exists', 'status': 400 }, 400
         for k, v in args.iteritems():
             if v != None:
                 payee[k] = v
-        db.payees.update({'id':id}, payee)
-        return { 'payee': marshal(payee, payee_fields) }
+        try:
+            db.payees.update({'id':id}, payee)
+        except DuplicateKeyError:
+            return { 'message': 'Payee already exists', 'status': 400 }, 400
+        payee_index.add(id, payee['name'])
+        invalidate('payees', id)
+        bump_version('payees')
+        return { 'payee': payee_marshaller(payee) }
     
     def delete(self, id):
         """
@@ -79,4 +97,28 @@ class PayeeAPI(Resource):
         """
         if not db.payees.remove({'id':id})['n']:
             abort(404)
+        payee_index.remove(id)
+        invalidate('payees', id)
+        bump_version('payees')
         return { 'result': True }
+
+
+payee_search_parser = reqparse.RequestParser()
+payee_search_parser.add_argument('q', type=str, default='', location='args')
+payee_search_parser.add_argument('limit', type=int, default=10, location='args')
+
+class PayeeSearchAPI(Resource):
+    def get(self):
+        """
+        Type-ahead search: payees whose name, or a word in it, starts with
+        'q', most used first. Served from the in-memory prefix index.
+        
+        Query paramters:
+            1) 'q': prefix to match (case insensitive)
+            2) 'limit': maximum number of payees returned (default 10, at most 50)
+        """
+        args = payee_search_parser.parse_args()
+        limit = max(1, min(args['limit'], 50))
+        matches = payee_index.search(args['q'], limit)
+        return { 'payees': payee_search_marshaller.many({'id': id, 'name': name, 'count': count}
+                                                        for id, name, count in matches) }
@@ -0,0 +1,114 @@
+from flask.ext.restful import Resource, reqparse
+from datetime import datetime, date, timedelta
+from abacuspb.storage import aggregate_all
+from abacuspb.rollups import SPLIT_PARTS
+from abacuspb.networth import networth_series, INTERVALS
+from abacuspb.money import to_dollars
+from abacuspb.cache import all_categories
+import re
+
+UNCATEGORIZED = { 'id': '', 'name': 'Uncategorized', 'parent_id': None }
+
+spending_report_parser = reqparse.RequestParser()
+spending_report_parser.add_argument('from', type=str, location='args')
+spending_report_parser.add_argument('to', type=str, location='args')
+spending_report_parser.add_argument('groupBy', type=str, default='category', choices=['category', 'payee', 'month'], location='args')
+
+class SpendingReportAPI(Resource):
+    def get(self):
+        """
+        Spending totals across all accounts, aggregated in the database.
+        Split transactions count towards each split's category. Transfers
+        between accounts are not spending and are excluded.
+        
+        Optional query paramters:
+            1) 'from' & 'to' in YYYY-MM-DD format: limits the report to the date range
+            2) 'groupBy': 'category' (default, sub-categories rolled up into their parent), 'payee' or 'month'
+        """
+        args = spending_report_parser.parse_args()
+        match = {}
+        if args['from'] != None:
+            match['date'] = {'$gte': datetime.strptime(args['from'], '%Y-%m-%d')}
+        if args['to'] != None:
+            match.setdefault('date', {})['$lte'] = datetime.strptime(args['to'], '%Y-%m-%d')
+        key = {
+            'category': '$cat_or_acct_id',
+            'payee': '$payee',
+            'month': {'$dateToString': {'format': '%Y-%m', 'date': '$date'}}
+        }[args['groupBy']]
+        groups = aggregate_all([{'$match': match}] + SPLIT_PARTS +
+                               [{'$match': {'cat_or_acct_id': {'$not': re.compile('^acct_')}}},
+                                {'$group': {'_id': key, 'total': {'$sum': '$amount'}, 'count': {'$sum': 1}}}])
+        
+        if args['groupBy'] == 'category':
+            groups = rollup_categories(groups)
+        else:
+            groups = [{'key': g['_id'], 'name': g['_id'], 'total': g['total'], 'count': g['count']} for g in groups]
+        if args['groupBy'] == 'month':
+            groups.sort(key=lambda g: g['key'])
+        else:
+            groups.sort(key=lambda g: (g['total'], g['name']))
+        for group in groups:
+            group['total'] = to_dollars(group['total'])
+            for sub in group.get('subcategories', []):
+                sub['total'] = to_dollars(sub['total'])
+        return { 'report': { 'from': args['from'], 'to': args['to'], 'groupBy': args['groupBy'], 'groups': groups } }
+
+networth_parser = reqparse.RequestParser()
+networth_parser.add_argument('from', type=str, location='args')
+networth_parser.add_argument('to', type=str, location='args')
+networth_parser.add_argument('interval', type=str, default='month', choices=INTERVALS, location='args')
+
+class NetWorthAPI(Resource):
+    def get(self):
+        """
+        Net-worth time series: every account's balance, and the total across
+        accounts, at the end of each day, week or month in the date range.
+        
+        Optional query paramters:
+            1) 'from' & 'to' in YYYY-MM-DD format: date range (default the year up to today)
+            2) 'interval': 'day', 'week' or 'month' (default)
+        """
+        args = networth_parser.parse_args()
+        try:
+            end = datetime.strptime(args['to'], '%Y-%m-%d').date() if args['to'] else date.today()
+            start = datetime.strptime(args['from'], '%Y-%m-%d').date() if args['from'] else end - timedelta(days=365)
+        except ValueError:
+            return { 'message': 'Dates must be in YYYY-MM-DD format', 'status': 400 }, 400
+        if start > end:
+            return { 'message': 'from must not be after to', 'status': 400 }, 400
+        ends, accounts, rows, totals = networth_series(start, end, args['interval'])
+        return { 'networth': {
+            'from': start.strftime('%Y-%m-%d'),
+            'to': end.strftime('%Y-%m-%d'),
+            'interval': args['interval'],
+            'dates': [day.strftime('%Y-%m-%d') for day in ends],
+            'total': map(to_dollars, totals),
+            'accounts': [{'id': account['id'], 'name': account['name'], 'balances': map(to_dollars, row)}
+                         for account, row in zip(accounts, rows)] } }
+
+def rollup_categories(groups):
+    """
+    Fold per-category totals into their top-level category via parent_id,
+    listing the sub-categories that contributed
+    """
+    categories = dict((c['id'], c) for c in all_categories())
+    roots = {}
+    for group in groups:
+        category = categories.get(group['_id'] or '', UNCATEGORIZED)
+        root = category
+        seen = set([root['id']])
+        while root.get('parent_id') in categories and root['parent_id'] not in seen:
+            root = categories[root['parent_id']]
+            seen.add(root['id'])
+        if root['id'] not in roots:
+            roots[root['id']] = {'key': root['id'], 'name': root['name'], 'total': 0, 'count': 0, 'subcategories': []}
+        rollup = roots[root['id']]
+        rollup['total'] += group['total']
+        rollup['count'] += group['count']
+        if category is not root:
+            rollup['subcategories'].append({'key': category['id'], 'name': category['name'],
+                                            'total': group['total'], 'count': group['count']})
+    for rollup in roots.itervalues():
+        rollup['subcategories'].sort(key=lambda g: (g['total'], g['name']))
+    return roots.values()
@@ -0,0 +1,138 @@
+from flask import abort
+from flask.ext.restful import Resource, reqparse, fields
+from bson.objectid import ObjectId
+from datetime import datetime
+from abacuspb import db
+from abacuspb.money import Money, to_cents
+from abacuspb.marshalling import Marshaller, Date
+from abacuspb.cache import account_metadata
+from abacuspb.scheduler import FREQUENCIES, next_occurrence
+import pymongo
+
+schedule_fields = { # Request validator
+    'account_id': fields.String,
+    # Template transaction
+    'type': fields.String,
+    'payee': fields.String,
+    'amount': Money, # Stored as integer cents
+    'memo': fields.String,
+    'cat_or_acct_id': fields.String,
+    # Recurrence rule: every 'interval' days/weeks/months/years from 'start'
+    'freq': fields.String, # 'daily' | 'weekly' | 'monthly' | 'yearly'
+    'interval': fields.Integer,
+    'start': Date,
+    'until': Date, # Last possible date, optional
+    'count': fields.Integer, # Number of occurrences, optional
+    'next_date': Date, # Next occurrence to be created, null once the schedule has ended
+    'uri': fields.Url('schedule')
+}
+
+schedule_marshaller = Marshaller(schedule_fields)
+
+RULE_FIELDS = ['freq', 'interval', 'start', 'until', 'count']
+
+def validate_schedule(schedule):
+    """
+    Error response for an invalid schedule, or None
+    """
+    if not account_metadata(schedule['account_id']):
+        return { 'message': 'Account does not exist', 'status': 400 }, 400
+    if schedule['cat_or_acct_id'][0:5] == 'acct_' and not account_metadata(schedule['cat_or_acct_id']):
+        return { 'message': 'Transfer account does not exist', 'status': 400 }, 400
+    if schedule['interval'] < 1 or (schedule.get('count') != None and schedule['count'] < 1):
+        return { 'message': 'interval and count must be at least 1', 'status': 400 }, 400
+    if schedule.get('until') != None and schedule['until'] < schedule['start']:
+        return { 'message': 'until must not be before start', 'status': 400 }, 400
+    return None
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+schedule_list_parser = reqparse.RequestParser()
+schedule_list_parser.add_argument('account_id', type=str, required=True, help='No account provided', location='json')
+schedule_list_parser.add_argument('type', type=str, location='json')
+schedule_list_parser.add_argument('payee', type=str, location='json')
+schedule_list_parser.add_argument('amount', type=to_cents, required=True, help='No amount provided', location='json')
+schedule_list_parser.add_argument('memo', type=str, location='json')
+schedule_list_parser.add_argument('cat_or_acct_id', type=str, default='', location='json')
+schedule_list_parser.add_argument('freq', type=str, required=True, choices=FREQUENCIES, location='json')
+schedule_list_parser.add_argument('interval', type=int, default=1, location='json')
+schedule_list_parser.add_argument('start', type=parse_date, required=True, help='start must be in YYYY-MM-DD format', location='json')
+schedule_list_parser.add_argument('until', type=parse_date, location='json')
+schedule_list_parser.add_argument('count', type=int, location='json')
+
+class ScheduleListAPI(Resource):
+    def get(self):
+        """
+        Get all recurring transaction schedules
+        """
+        schedules = list(db.schedules.find(sort=[('next_date', pymongo.ASCENDING), ('payee', pymongo.ASCENDING)]))
+        if not schedules:
+            abort(404)
+        return { 'schedules': schedule_marshaller.many(schedules) }
+    
+    def post(self):
+        """
+        Create a recurring transaction schedule. Occurrences are created by
+        the scheduler (manage.py run-scheduler), including any already due.
+        """
+        args = schedule_list_parser.parse_args()
+        schedule = dict(args, id=str(ObjectId()), last_date=None)
+        error = validate_schedule(schedule)
+        if error:
+            return error
+        schedule['next_index'], schedule['next_date'] = next_occurrence(schedule)
+        db.schedules.insert(schedule)
+        return { 'schedule': schedule_marshaller(schedule) }, 201
+
+
+schedule_parser = reqparse.RequestParser()
+schedule_parser.add_argument('type', type=str, location='json')
+schedule_parser.add_argument('payee', type=str, location='json')
+schedule_parser.add_argument('amount', type=to_cents, location='json')
+schedule_parser.add_argument('memo', type=str, location='json')
+schedule_parser.add_argument('cat_or_acct_id', type=str, location='json')
+schedule_parser.add_argument('freq', type=str, choices=FREQUENCIES, location='json')
+schedule_parser.add_argument('interval', type=int, location='json')
+schedule_parser.add_argument('start', type=parse_date, location='json')
+schedule_parser.add_argument('until', type=parse_date, location='json')
+schedule_parser.add_argument('count', type=int, location='json')
+
+class ScheduleAPI(Resource):
+    def get(self, id):
+        """
+        Get single schedule by id
+        """
+        schedule = db.schedules.find_one({'id':id})
+        if schedule == None:
+            abort(404)
+        return { 'schedule': schedule_marshaller(schedule) }
+    
+    def put(self, id):
+        """
+        Update single schedule by id. Template changes apply to occurrences
+        not created yet; after a rule change the schedule resumes with the
+        new rule's first occurrence after the last one created.
+        """
+        schedule = db.schedules.find_one({'id':id})
+        if schedule == None:
+            abort(404)
+        args = schedule_parser.parse_args()
+        for k, v in args.iteritems():
+            if v != None:
+                schedule[k] = v
+        error = validate_schedule(schedule)
+        if error:
+            return error
+        if any(args[k] != None for k in RULE_FIELDS):
+            schedule['next_index'], schedule['next_date'] = next_occurrence(schedule)
+        db.schedules.update({'id':id}, schedule)
+        return { 'schedule': schedule_marshaller(schedule) }
+    
+    def delete(self, id):
+        """
+        Delete single schedule by id; transactions already created are kept
+        """
+        if not db.schedules.remove({'id':id})['n']:
+            abort(404)
+        return { 'result': True }
@@ -0,0 +1,75 @@
+from flask.ext.restful import Resource, reqparse, fields
+from datetime import datetime
+from abacuspb import app
+from abacuspb.money import to_cents
+from abacuspb.marshalling import Marshaller
+from abacuspb.cache import account_metadata
+from abacuspb.search import search_transactions, encode_search_cursor, decode_search_cursor
+from abacuspb.resources.transactions import transaction_fields
+
+transaction_search_fields = dict(transaction_fields, account_id=fields.String)
+transaction_search_marshaller = Marshaller(transaction_search_fields)
+
+transaction_search_parser = reqparse.RequestParser()
+transaction_search_parser.add_argument('q', type=str, default='', location='args')
+transaction_search_parser.add_argument('account', type=str, action='append', location='args')
+transaction_search_parser.add_argument('category', type=str, location='args')
+transaction_search_parser.add_argument('fromDate', type=str, location='args')
+transaction_search_parser.add_argument('toDate', type=str, location='args')
+transaction_search_parser.add_argument('minAmount', type=to_cents, location='args')
+transaction_search_parser.add_argument('maxAmount', type=to_cents, location='args')
+transaction_search_parser.add_argument('pageSize', type=int, location='args')
+transaction_search_parser.add_argument('after', type=str, location='args')
+
+class TransactionSearchAPI(Resource):
+    def get(self):
+        """
+        Full-text search of transaction payees and memos across accounts,
+        newest first. Matching uses the text index on payee and memo (split
+        memos are not indexed), so words match whole (stemmed) words,
+        "quoted phrases" match exactly and -word excludes a word.
+        
+        Query paramters:
+            1) 'q': search text (required)
+            2) 'account': account id to search, may be repeated (default all accounts)
+            3) 'category': category or transfer account id, of the transaction or one of its splits
+            4) 'fromDate' & 'toDate' in YYYY-MM-DD format: limits the search to the date range
+            5) 'minAmount' & 'maxAmount': limits the search to the amount range (signed dollars)
+            6) 'pageSize': number of transactions per page (default 60)
+            7) 'after': opaque cursor from a previous response's 'next'
+        """
+        args = transaction_search_parser.parse_args()
+        if not args['q'].strip():
+            return { 'message': 'No search text provided', 'status': 400 }, 400
+        page_size = args['pageSize'] or app.config['TRANSACTIONS_PAGE_SIZE']
+        page_size = max(1, min(page_size, app.config['TRANSACTIONS_MAX_PAGE_SIZE']))
+        for account_id in args['account'] or []:
+            if not account_metadata(account_id):
+                return { 'message': 'Account does not exist', 'status': 400 }, 400
+        query = {}
+        if args['category'] != None:
+            query['$or'] = [{'cat_or_acct_id': args['category']}, {'splits.cat_or_acct_id': args['category']}]
+        if args['fromDate'] != None:
+            query['date'] = {'$gte': datetime.strptime(args['fromDate'], '%Y-%m-%d')}
+        if args['toDate'] != None:
+            query.setdefault('date', {})['$lte'] = datetime.strptime(args['toDate'], '%Y-%m-%d')
+        if args['minAmount'] != None:
+            query['amount'] = {'$gte': args['minAmount']}
+        if args['maxAmount'] != None:
+            query.setdefault('amount', {})['$lte'] = args['maxAmount']
+        after = None
+        if args['after']:
+            try:
+                after = decode_search_cursor(args['after'])
+            except ValueError:
+                return { 'message': 'Invalid cursor', 'status': 400 }, 400
+        
+        transactions = search_transactions(args['q'], args['account'], query, after, page_size)
+        next_cursor = None
+        if len(transactions) > page_size:
+            transactions = transactions[:page_size]
+            next_cursor = encode_search_cursor(transactions[-1])
+        for tran in transactions:
+            tran['uri'] = '/api/transactions/' + tran['account_id'] + '/' + tran['id']
+        return { 'transactions': transaction_search_marshaller.many(transactions),
+                 'next': next_cursor }
@@ -1,322 +1,673 @@
-from flask import abort
-from flask.ext.restful import Resource, reqparse, fields, marshal
+from flask import abort, request, Response, stream_with_context
+from flask.ext.restful import Resource, reqparse, fields
 from bson.objectid import ObjectId
 from datetime import datetime, date, timedelta
-from abacuspb import db
-import pymongo
+from abacuspb import app, db
+from abacuspb.storage import transactions_for
+from abacuspb.money import Money, to_cents
+from abacuspb.marshalling import Marshaller, Date
+from abacuspb.balances import balance_delta
+from abacuspb.checkpoints import balance_before
+from abacuspb.rollups import rollup_changes
+from abacuspb.journal import Journal
+from abacuspb.encoding import encode_json
+from abacuspb.cache import account_metadata
+import pymongo, base64, json, hashlib
+from pymongo.errors import DuplicateKeyError
+
+split_fields = {
+    'cat_or_acct_id': fields.String,
+    'amount': Money,
+    'memo': fields.String
+}
 
 transaction_fields = { # Request validator
-    'date': fields.String,
+    'date': Date, # Stored as a datetime, output as YYYY-MM-DD
     'type': fields.String, # check num, EFT, etc.
     'payee': fields.String,
-    # TODO: need split -> consider fields.Nested
+    'splits': fields.List(fields.Nested(split_fields)), # Optional; amounts add up to 'amount'
     'reconciled': fields.String, # ' ' | 'C' | 'R'
-    'amount': fields.Float, # +/- dollar value
+    'amount': Money, # +/- value, stored as integer cents
     'memo': fields.String,
     #'uri': fields.Url('transaction') # TODO: need to fix this? LOW PRIORITY (workaround in place)
-    'cat_or_acct_id': fields.String,
+    'cat_or_acct_id': fields.String, # '' for split transactions
     'uri': fields.String
 }
 
+transaction_list_fields = dict(transaction_fields, running_balance=Money)
+
+transaction_marshaller = Marshaller(transaction_fields)
+transaction_list_marshaller = Marshaller(transaction_list_fields)
+
+transaction_list_parser = reqparse.RequestParser()
+# Query parameters
+transaction_list_parser.add_argument('fromDate', type=str, location='args')
+transaction_list_parser.add_argument('toDate', type=str, location='args')
+transaction_list_parser.add_argument('pageSize', type=int, location='args')
+transaction_list_parser.add_argument('after', type=str, location='args')
+transaction_list_parser.add_argument('before', type=str, location='args')
+# JSON parameters
+transaction_list_parser.add_argument('date', type=str, location='json')
+transaction_list_parser.add_argument('type', type=str, location='json')
+transaction_list_parser.add_argument('payee', type=str, location='json')
+transaction_list_parser.add_argument('reconciled', type=str, location='json')
+transaction_list_parser.add_argument('amount', type=to_cents, location='json')
+transaction_list_parser.add_argument('memo', type=str, location='json')
+transaction_list_parser.add_argument('cat_or_acct_id', type=str, default='', location='json')
+transaction_list_parser.add_argument('fitid', type=str, location='json') # Bank's transaction id, if known
+transaction_list_parser.add_argument('splits', type=dict, action='append', location='json') # [{cat_or_acct_id, amount, memo}]
+
 class TransactionListAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        # Query parameters
-        self.reqparse.add_argument('fromDate', type=str, location='args')
-        self.reqparse.add_argument('toDate', type=str, location='args')
-        # JSON parameters
-        self.reqparse.add_argument('date', type=str, location='json')
-        self.reqparse.add_argument('type', type=str, location='json')
-        self.reqparse.add_argument('payee', type=str, location='json')
-        self.reqparse.add_argument('reconciled', type=str, location='json')
-        self.reqparse.add_argument('amount', type=float, location='json')
-        self.reqparse.add_argument('memo', type=str, location='json')
-        self.reqparse.add_argument('cat_or_acct_id', type=str, default='', location='json')
-        super(TransactionListAPI, self).__init__()
-    
     def get(self, account_id):
         """
-        Returns last 60 transactions for the account.
+        Returns a page of transactions for the account, newest first, each
+        with the account's running balance after that transaction.
         
         Optional query paramters:
             1) 'fromDate' & 'toDate' in YYYY-MM-DD format: returns transactions within the date range
-            2) 'fromDate' in YYYY-MM-DD format: returns all transactions since fromDate  
+            2) 'fromDate' in YYYY-MM-DD format: returns all transactions since fromDate
+            3) 'pageSize': number of transactions per page (default 60)
+            4) 'after' | 'before': opaque cursor from a previous response's 'next' | 'prev'
         """
-        args = self.reqparse.parse_args()
+        args = transaction_list_parser.parse_args()
+        page_size = args['pageSize'] or app.config['TRANSACTIONS_PAGE_SIZE']
+        page_size = max(1, min(page_size, app.config['TRANSACTIONS_MAX_PAGE_SIZE']))
+        query = {}
         if args['fromDate'] != None and args['toDate'] != None:
             fdate = datetime.strptime(args['fromDate'], '%Y-%m-%d')
             tdate = datetime.strptime(args['toDate'], '%Y-%m-%d')
-            trans = db[account_id].find({'date': {'$gte': fdate, '$lte': tdate}}, sort=[('date', pymongo.DESCENDING)])
+            query['date'] = {'$gte': fdate, '$lte': tdate}
         elif args['fromDate'] != None:
             fdate = datetime.strptime(args['fromDate'], '%Y-%m-%d')
-            trans = db[account_id].find({'date': {'$gte': fdate}}, sort=[('date', pymongo.DESCENDING)])
-        else: # Default to get last 60 transactions
-            trans = db[account_id].find(sort=[('date', pymongo.DESCENDING)], limit=60)
+            query['date'] = {'$gte': fdate}
         
-        if trans.count() == 0:
+        # Keyset pagination on (date DESC, id ASC); 'before' walks the index backwards
+        sort = [('date', pymongo.DESCENDING), ('id', pymongo.ASCENDING)]
+        cursor = args['after'] or args['before']
+        if cursor:
+            try:
+                cdate, cid = decode_cursor(cursor)
+            except ValueError:
+                return { 'message': 'Invalid cursor', 'status': 400 }, 400
+            if args['after']:
+                keyset = [{'date': {'$lt': cdate}}, {'date': cdate, 'id': {'$gt': cid}}]
+            else:
+                keyset = [{'date': {'$gt': cdate}}, {'date': cdate, 'id': {'$lt': cid}}]
+                sort = [('date', pymongo.ASCENDING), ('id', pymongo.DESCENDING)]
+            query = {'$and': [query, {'$or': keyset}]}
+        
+        transactions = list(transactions_for(account_id).find(query, sort=sort, limit=page_size + 1))
+        has_more = len(transactions) > page_size
+        transactions = transactions[:page_size]
+        if args['before']:
+            transactions.reverse()
+        if not transactions:
             abort(404)
-        transactions = []
-        for tran in trans:
-            tran['date'] = tran['date'].strftime('%Y-%m-%d')
+        
+        next_cursor = prev_cursor = None
+        if has_more or args['before']:
+            next_cursor = encode_cursor(transactions[-1])
+        if (has_more and args['before']) or args['after']:
+            prev_cursor = encode_cursor(transactions[0])
+        # Running balance: walk the page forward from the balance before its oldest row
+        balance = balance_before(account_id, transactions[-1])
+        for tran in reversed(transactions):
+            balance += tran['amount']
+            tran['running_balance'] = balance
+        for tran in transactions:
             tran['uri'] = '/api/transactions/' + account_id + '/' + tran['id']
-            transactions.append(tran)
-        return { 'transactions': map(lambda t: marshal(t, transaction_fields), transactions)}
+        return { 'transactions': transaction_list_marshaller.many(transactions),
+                 'next': next_cursor,
+                 'prev': prev_cursor }
     
     def post(self, account_id):
         """
         Create a new transaction
         """
         # Check if originating account exists
-        account = db.accounts.find_one({'id': account_id})
-        if not account:
+        if not account_metadata(account_id):
             return { 'message': 'Account does not exist', 'status': 400 }, 400
-        args = self.reqparse.parse_args()
+        args = transaction_list_parser.parse_args()
         transaction = {
             'id': str(ObjectId()),
             'date': datetime.strptime(args['date'],'%Y-%m-%d'),
             'type': args['type'],
             'payee': args['payee'],
-            # TODO: need split
             'reconciled': args['reconciled'],
             'amount': args['amount'],
             'memo': args['memo'],
             'cat_or_acct_id': args['cat_or_acct_id']
         }
-        return_accts = []
+        if args['splits']:
+            try:
+                transaction['splits'] = make_splits(args['splits'], args['amount'])
+            except ValueError as error:
+                return { 'message': str(error), 'status': 400 }, 400
+            transaction['amount'] = sum(split['amount'] for split in transaction['splits'])
+            transaction['cat_or_acct_id'] = ''
+        # Check if transfer accounts exist before writing anything
+        transfers = transfer_amounts(transaction)
+        for transfer_id, amount in transfers:
+            if not account_metadata(transfer_id):
+                return { 'message': 'Transfer account does not exist', 'status': 400 }, 400
+        if args['fitid']:
+            transaction['fitid'] = args['fitid']
+        transaction['fingerprint'] = transaction_fingerprint(account_id, transaction)
         
-        # Originating account: 1) insert transaction, 2) calculate new balances
-        db[account_id].insert(transaction)
-        updated_originating_acct = update_account_balances('CREATE_TRANS', account, transaction)
-        return_accts.append(updated_originating_acct)
+        # Originating account: 1) insert transaction (once), 2) calculate new balances
+        # Transfer accounts: 3) insert mirrored transaction, 4) calculate new balances
+        # All of it is applied as one journaled write
+        duplicate = transactions_for(account_id).find_one({'fingerprint': transaction['fingerprint']})
+        if not duplicate:
+            journal = Journal()
+            journal.insert(account_id, transaction)
+            journal.balance(account_id, account_balance_delta('CREATE_TRANS', transaction))
+            rollups = rollup_changes('CREATE_TRANS', account_id, transaction)
+            for transfer_id, amount in transfers:
+                transfer_transaction = make_transfer_transaction(transaction, account_id, amount)
+                journal.insert(transfer_id, transfer_transaction)
+                journal.balance(transfer_id, account_balance_delta('CREATE_TRANS', transfer_transaction))
+                rollups += rollup_changes('CREATE_TRANS', transfer_id, transfer_transaction)
+            journal.rollups(rollups)
+            try:
+                return_accts = journal.commit()
+            except DuplicateKeyError: # Lost a race with an identical post
+                duplicate = transactions_for(account_id).find_one({'fingerprint': transaction['fingerprint']})
+        if duplicate:
+            duplicate['uri'] = '/api/transactions/' + account_id + '/' + duplicate['id']
+            return { 'transaction': transaction_marshaller(duplicate),
+                     'accounts': [],
+                     'duplicate': True }
         
-        # Transfer account: 1) Check if transfer trans, 2) insert trans, 3) calculate new balances
-        if transaction['cat_or_acct_id'][0:5] == 'acct_':
-            # Check if transfer account exists
-            transfer_account = db.accounts.find_one({'id': transaction['cat_or_acct_id']})
-            if not transfer_account:
-                return { 'message': 'Transfer account does not exist', 'status': 400 }, 400
-            transfer_transaction = transaction.copy() # Transaction ID stays same
-            transfer_transaction['reconciled'] = '' # Don't assume we know this type
-            transfer_transaction['amount'] = - transaction['amount']
-            transfer_transaction['cat_or_acct_id'] = account_id # Set to originating account
-            db[transaction['cat_or_acct_id']].insert(transfer_transaction)
-            updated_transfer_acct = update_account_balances('CREATE_TRANS', transfer_account, transfer_transaction)
-            return_accts.append(updated_transfer_acct)
-         
-        transaction['date'] = args['date']
         transaction['uri'] = '/api/transactions/' + account_id + '/' + transaction['id']
         
-        return { 'transaction': marshal(transaction, transaction_fields),
+        return { 'transaction': transaction_marshaller(transaction),
                  'accounts': return_accts }, 201
     
-#     def update_balances_on_post(self, account_id, amount, reconciled):
-#         account = db.accounts.find_one({'id': account_id})
-#         # update bal_uncleared (every transaction mods this)
-#         bal_unclr = round(account['bal_uncleared'] + amount, 2)
-#         db.accounts.update({'id': account_id}, {'$set': {'bal_uncleared': bal_unclr}})
-#         bal_clr = account['bal_cleared']
-#         bal_rec = account['bal_reconciled']
-#         if reconciled in ['C', 'R']:
-#             # update bal_cleared (only cleared and reconciled transactions mod this)
-#             bal_clr = round(account['bal_cleared'] + amount, 2)
-#             db.accounts.update({'id': account_id}, {'$set': {'bal_cleared': bal_clr}})
-#         if reconciled == 'R':
-#             # update bal_reconciled (only reconciled transactions mod this)
-#             bal_rec = round(account['bal_reconciled'] + amount, 2)
-#             db.accounts.update({'id': account_id}, {'$set': {'bal_reconciled': bal_rec}})
-#             
-#         return { 'uri': '/api/accounts/' + account_id, 'bal_uncleared': bal_unclr,
-#                  'bal_cleared': bal_clr, 'bal_reconciled': bal_rec }
+transaction_export_parser = reqparse.RequestParser()
+transaction_export_parser.add_argument('fromDate', type=str, location='args')
+transaction_export_parser.add_argument('toDate', type=str, location='args')
+transaction_export_parser.add_argument('format', type=str, default='ndjson', choices=['ndjson', 'json'], location='args')
+
+class TransactionExportAPI(Resource):
+    def get(self, account_id):
+        """
+        Stream every transaction for the account, newest first.
+        
+        Rows are read from the database cursor and written to the response
+        one at a time, so memory use does not grow with the export size.
+        
+        Optional query paramters:
+            1) 'fromDate' & 'toDate' in YYYY-MM-DD format: limits the export to the date range
+            2) 'format': 'ndjson' (default, one transaction per line) or 'json'
+        """
+        args = transaction_export_parser.parse_args()
+        query = {}
+        if args['fromDate'] != None:
+            query['date'] = {'$gte': datetime.strptime(args['fromDate'], '%Y-%m-%d')}
+        if args['toDate'] != None:
+            query.setdefault('date', {})['$lte'] = datetime.strptime(args['toDate'], '%Y-%m-%d')
+        trans = transactions_for(account_id).find(query, sort=[('date', pymongo.DESCENDING), ('id', pymongo.ASCENDING)],
+                                    batch_size=app.config['TRANSACTIONS_EXPORT_BATCH_SIZE'])
+        
+        def rows():
+            for tran in trans:
+                tran['uri'] = '/api/transactions/' + account_id + '/' + tran['id']
+                yield encode_json(transaction_marshaller(tran))
+        
+        if args['format'] == 'ndjson':
+            def generate():
+                for row in rows():
+                    yield row + '\n'
+            mimetype = 'application/x-ndjson'
+        else:
+            def generate():
+                yield '{"transactions": ['
+                sep = ''
+                for row in rows():
+                    yield sep + row
+                    sep = ', '
+                yield ']}'
+            mimetype = 'application/json'
+        return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+class TransactionBulkAPI(Resource):
+    def post(self, account_id):
+        """
+        Create many transactions at once.
+        
+        The body is a JSON array of transactions, or one transaction per line
+        with Content-Type application/x-ndjson. Every transaction is validated
+        before anything is written; the batch is then written as one
+        journaled write with one bulk insert per account collection
+        (mirrored transfers included) and each affected account's balances
+        updated once.
+        """
+        if not account_metadata(account_id):
+            return { 'message': 'Account does not exist', 'status': 400 }, 400
+        try:
+            if request.mimetype == 'application/x-ndjson':
+                items = [json.loads(line) for line in request.stream if line.strip()]
+            else:
+                items = request.get_json(force=True)
+        except ValueError:
+            return { 'message': 'Malformed request body', 'status': 400 }, 400
+        if not isinstance(items, list) or not items:
+            return { 'message': 'Expected a non-empty list of transactions', 'status': 400 }, 400
+        
+        # Validate everything before writing anything
+        transactions = []
+        errors = []
+        for index, item in enumerate(items):
+            try:
+                transactions.append(make_transaction(item))
+            except (ValueError, TypeError) as error:
+                errors.append({'index': index, 'message': str(error)})
+        if errors:
+            return { 'message': 'Invalid transactions', 'errors': errors, 'status': 400 }, 400
+        transfer_ids = set(transfer_id for t in transactions for transfer_id, amount in transfer_amounts(t))
+        missing = sorted(id for id in transfer_ids if not account_metadata(id))
+        if missing:
+            return { 'message': 'Transfer account does not exist',
+                     'accounts': missing, 'status': 400 }, 400
+        
+        written, duplicates = insert_transactions(account_id, transactions)
+        return { 'count': len(transactions) - duplicates,
+                 'duplicates': duplicates,
+                 'accounts': written }, 201
+
+
+transaction_parser = reqparse.RequestParser()
+transaction_parser.add_argument('date', type=str, location='json')
+transaction_parser.add_argument('type', type=str, location='json')
+transaction_parser.add_argument('payee', type=str, location='json')
+transaction_parser.add_argument('splits', type=dict, action='append', location='json') # Replaces the splits
+transaction_parser.add_argument('reconciled', type=str, location='json')
+transaction_parser.add_argument('amount', type=to_cents, location='json')
+transaction_parser.add_argument('memo', type=str, location='json')
+transaction_parser.add_argument('cat_or_acct_id', type=str, location='json')
 
 class TransactionAPI(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('date', type=str, location='json')
-        self.reqparse.add_argument('type', type=str, location='json')
-        self.reqparse.add_argument('payee', type=str, location='json')
-        # need: category/account split
-        self.reqparse.add_argument('reconciled', type=str, location='json')
-        self.reqparse.add_argument('amount', type=float, location='json')
-        self.reqparse.add_argument('memo', type=str, location='json')
-        self.reqparse.add_argument('cat_or_acct_id', type=str, location='json')
-        super(TransactionAPI, self).__init__()
-    
     def get(self, account_id, trans_id):
         """
         Return a single transaction
         """
-        transaction = db[account_id].find({'id':trans_id})
+        transaction = transactions_for(account_id).find({'id':trans_id})
         if transaction.count() == 0:
             abort(404)
         trans = transaction[0]
-        trans['date'] = str(trans['date'])
         trans['uri'] = '/api/transactions/' + account_id + '/' + trans_id
-        return { 'transaction': marshal(trans, transaction_fields) }
+        return { 'transaction': transaction_marshaller(trans) }
     
     def put(self, account_id, trans_id):
         """
         Update a single transaction
         """
-        old_transaction = db[account_id].find_one({'id':trans_id})
+        old_transaction = transactions_for(account_id).find_one({'id':trans_id})
         if old_transaction == None:
             abort(404)
         new_transaction = old_transaction.copy()
         
-        args = self.reqparse.parse_args()
+        args = transaction_parser.parse_args()
+        transfer_changes = {}
         for k, v in args.iteritems():
             if v != None:
                 if k == 'date': new_transaction[k] = datetime.strptime(v,'%Y-%m-%d')
+                elif k == 'splits': continue # Validated below
                 else:
                     new_transaction[k] = v
                     # Check if transfer transaction for 'payee' and 'memo' only
                     if old_transaction['cat_or_acct_id'][0:5] == 'acct_' and (k == 'payee' or k == 'memo'):
-                        db[old_transaction['cat_or_acct_id']].update({'id':trans_id}, {'$set': {k:v}})
-        db[account_id].update({'id':trans_id}, new_transaction)
-        new_transaction['date'] = new_transaction['date'].strftime('%Y-%m-%d')
-        new_transaction['uri'] = '/api/transactions/' + account_id + '/' + trans_id
+                        transfer_changes[k] = v
+        # The mirror of a split transaction only owns its reconciled state
+        origin_id = split_origin(old_transaction)
+        if origin_id and (args['splits'] or any(new_transaction[k] != old_transaction.get(k) for k in new_transaction if k != 'reconciled')):
+            return { 'message': 'Edit the split transaction in ' + origin_id, 'status': 400 }, 400
+        # New splits replace the old ones and set the amount; a new category
+        # or account turns a split transaction back into a plain one (a
+        # split transaction's own cat_or_acct_id is '', so '' keeps the splits)
+        if args['splits']:
+            try:
+                new_transaction['splits'] = make_splits(args['splits'], args['amount'])
+            except ValueError as error:
+                return { 'message': str(error), 'status': 400 }, 400
+            new_transaction['amount'] = sum(split['amount'] for split in new_transaction['splits'])
+            new_transaction['cat_or_acct_id'] = ''
+        elif args['cat_or_acct_id']:
+            new_transaction.pop('splits', None)
+        elif new_transaction.get('splits') and new_transaction['amount'] != sum(split['amount'] for split in new_transaction['splits']):
+            return { 'message': 'Split amounts must add up to the transaction amount', 'status': 400 }, 400
+        split = bool(old_transaction.get('splits') or new_transaction.get('splits'))
+        new_transaction['fingerprint'] = transaction_fingerprint(account_id, new_transaction)
+        if new_transaction['fingerprint'] != old_transaction.get('fingerprint') and \
+                transactions_for(account_id).find_one({'fingerprint': new_transaction['fingerprint']}, projection={'id': True}):
+            return { 'message': 'An identical transaction already exists', 'status': 409 }, 409
+        old_transfer_id = old_transaction['cat_or_acct_id']
+        new_transfer_id = new_transaction['cat_or_acct_id']
+        # Check everything the write depends on before writing anything
+        old_transfers = dict(transfer_amounts(old_transaction))
+        for transfer_id, amount in transfer_amounts(new_transaction):
+            if transfer_id not in old_transfers and not account_metadata(transfer_id):
+                return { 'message': 'Transfer account does not exist', 'status': 400 }, 400
+        transfer_trans = None
+        if not split and old_transfer_id[0:5] == 'acct_' and (new_transfer_id != old_transfer_id or old_transaction['amount'] != new_transaction['amount']):
+            transfer_trans = transactions_for(old_transfer_id).find_one({'id': trans_id})
+            if not transfer_trans and new_transfer_id != old_transfer_id:
+                abort(404)
         
-        return_accts = []
+        journal = Journal()
+        if transfer_changes and not split:
+            journal.set(old_transfer_id, trans_id, transfer_changes)
+        journal.replace(account_id, new_transaction)
         
         # Originating account
         if (old_transaction['amount'] != new_transaction['amount']) or (old_transaction['reconciled'] != new_transaction['reconciled']):
-            account = db.accounts.find_one({'id': account_id})
-            update_account_balances('DELETE_TRANS', account, old_transaction)
-            account = db.accounts.find_one({'id': account_id})
-            updated_originating_acct = update_account_balances('CREATE_TRANS', account, new_transaction)
-            return_accts.append(updated_originating_acct)
+            journal.balance(account_id, account_balance_delta('UPDATE_TRANS', new_transaction, old_transaction))
+        rollups = rollup_changes('UPDATE_TRANS', account_id, new_transaction, old_transaction) # Date or category may have moved
 
         # Transfer account
-        if old_transaction['cat_or_acct_id'][0:5] == 'acct_':
-            if new_transaction['cat_or_acct_id'][0:5] != 'acct_':
-                print 'Account -> Category'
+        if split:
+            # Split transactions can transfer to several accounts: mirrors are rewritten as a whole
+            rollups += update_split_transfers(journal, account_id, old_transaction, new_transaction)
+        elif old_transfer_id[0:5] == 'acct_':
+            if new_transfer_id[0:5] != 'acct_':
                 # Account -> Category
-                transfer_trans = db[old_transaction['cat_or_acct_id']].find_one({'id': trans_id})
-                # Delete transfer transaction
-                if not db[old_transaction['cat_or_acct_id']].remove({'id': trans_id})['n']:
-                    abort(404)
-                # Update transfer account balances only
-                transfer_account = db.accounts.find_one({'id': old_transaction['cat_or_acct_id']})
-                updated_transfer_acct = update_account_balances('DELETE_TRANS', transfer_account, transfer_trans)
-                return_accts.append(updated_transfer_acct)
+                # Delete transfer transaction, update transfer account balances only
+                journal.remove(old_transfer_id, trans_id)
+                journal.balance(old_transfer_id, account_balance_delta('DELETE_TRANS', transfer_trans))
+                rollups += rollup_changes('DELETE_TRANS', old_transfer_id, transfer_trans)
                 
-            elif old_transaction['cat_or_acct_id'] != new_transaction['cat_or_acct_id']:
-                print 'Account -> Account'
+            elif old_transfer_id != new_transfer_id:
                 # Account -> Account
-                transfer_trans = db[old_transaction['cat_or_acct_id']].find_one({'id': trans_id})
-                # Delete original transfer transaction
-                if not db[old_transaction['cat_or_acct_id']].remove({'id': trans_id})['n']:
-                    abort(404)
-                # Update original transfer account balances
-                old_transfer_account = db.accounts.find_one({'id': old_transaction['cat_or_acct_id']})
-                updated_old_transfer_acct = update_account_balances('DELETE_TRANS', old_transfer_account, transfer_trans)
-                return_accts.append(updated_old_transfer_acct)
-                
-                # Check if new transfer account exists
-                new_transfer_account = db.accounts.find_one({'id': new_transaction['cat_or_acct_id']})
-                if not new_transfer_account:
-                    return { 'message': 'Transfer account does not exist', 'status': 400 }, 400
-                # Create new transfer transaction
-                transfer_transaction = new_transaction.copy() # Transaction ID stays same
-                transfer_transaction['reconciled'] = '' # Don't assume we know this type
-                transfer_transaction['amount'] = - new_transaction['amount']
-                transfer_transaction['cat_or_acct_id'] = account_id # Set to originating account
-                db[new_transaction['cat_or_acct_id']].insert(transfer_transaction)
-                # Update new transfer account balances
-                updated_new_transfer_acct = update_account_balances('CREATE_TRANS', new_transfer_account, transfer_transaction)
-                return_accts.append(updated_new_transfer_acct)
+                # Delete original transfer transaction, update original transfer account balances
+                journal.remove(old_transfer_id, trans_id)
+                journal.balance(old_transfer_id, account_balance_delta('DELETE_TRANS', transfer_trans))
+                rollups += rollup_changes('DELETE_TRANS', old_transfer_id, transfer_trans)
+                # Create new transfer transaction, update new transfer account balances
+                transfer_transaction = make_transfer_transaction(new_transaction, account_id)
+                journal.insert(new_transfer_id, transfer_transaction)
+                journal.balance(new_transfer_id, account_balance_delta('CREATE_TRANS', transfer_transaction))
+                rollups += rollup_changes('CREATE_TRANS', new_transfer_id, transfer_transaction)
             
-            elif old_transaction['amount'] != new_transaction['amount']:
-                print 'Account stays same, amount changes'
+            elif old_transaction['amount'] != new_transaction['amount'] and transfer_trans:
                 # Account stays the same, amount changes
                 # Update transfer transaction's amount (opposite of originating transaction amount)
-                db[new_transaction['cat_or_acct_id']].update({'id': trans_id}, {'$set': {'amount': -new_transaction['amount']}})
-                # Update transfer account balances
-                transfer_account = db.accounts.find_one({'id': new_transaction['cat_or_acct_id']})
-                update_account_balances('DELETE_TRANS', transfer_account, old_transaction)
-                transfer_account = db.accounts.find_one({'id': new_transaction['cat_or_acct_id']})
-                updated_transfer_acct = update_account_balances('CREATE_TRANS', transfer_account, new_transaction)
-                return_accts.append(updated_transfer_acct)
-            
-            else:
-                pass
+                journal.set(new_transfer_id, trans_id, {'amount': -new_transaction['amount']})
+                # Update transfer account balances from the mirror's own amount and reconciled state
+                new_transfer_trans = dict(transfer_trans, amount=-new_transaction['amount'])
+                journal.balance(new_transfer_id, account_balance_delta('UPDATE_TRANS', new_transfer_trans, transfer_trans))
+                rollups += rollup_changes('UPDATE_TRANS', new_transfer_id, new_transfer_trans, transfer_trans)
                 
-        elif new_transaction['cat_or_acct_id'][0:5] == 'acct_':
-            print 'Category -> Account'
+        elif new_transfer_id[0:5] == 'acct_':
             # Category -> Account
-            # Check if transfer account exists
-            transfer_account = db.accounts.find_one({'id': new_transaction['cat_or_acct_id']})
-            if not transfer_account:
-                return { 'message': 'Transfer account does not exist', 'status': 400 }, 400
-            # Create new transfer transaction
-            transfer_transaction = new_transaction.copy() # Transaction ID stays same
-            transfer_transaction['reconciled'] = '' # Don't assume we know this type
-            transfer_transaction['amount'] = - new_transaction['amount']
-            transfer_transaction['cat_or_acct_id'] = account_id # Set to originating account
-            db[new_transaction['cat_or_acct_id']].insert(transfer_transaction)
-            # Update new transfer account balances
-            updated_transfer_acct = update_account_balances('CREATE_TRANS', transfer_account, transfer_transaction)
-            return_accts.append(updated_transfer_acct)
+            # Create new transfer transaction, update new transfer account balances
+            transfer_transaction = make_transfer_transaction(new_transaction, account_id)
+            journal.insert(new_transfer_id, transfer_transaction)
+            journal.balance(new_transfer_id, account_balance_delta('CREATE_TRANS', transfer_transaction))
+            rollups += rollup_changes('CREATE_TRANS', new_transfer_id, transfer_transaction)
         
-        return { 'transaction': marshal(new_transaction, transaction_fields),
+        journal.rollups(rollups)
+        return_accts = journal.commit()
+        
+        new_transaction['uri'] = '/api/transactions/' + account_id + '/' + trans_id
+        return { 'transaction': transaction_marshaller(new_transaction),
                  'accounts': return_accts }    
     
     def delete(self, account_id, trans_id):
         """
         Delete a single transaction
         """
-        return_accts = []
-        
         # Originating transaction
-        account = db.accounts.find_one({'id': account_id})
-        transaction = db[account_id].find_one({'id':trans_id})
-        if not db[account_id].remove({'id':trans_id})['n']:
+        transaction = transactions_for(account_id).find_one({'id':trans_id})
+        if not transaction:
             abort(404)
-        updated_originating_acct = update_account_balances('DELETE_TRANS', account, transaction)
-        return_accts.append(updated_originating_acct)
+        origin_id = split_origin(transaction)
+        if origin_id: # Would leave the split transaction and its other mirrors behind
+            return { 'message': 'Edit the split transaction in ' + origin_id, 'status': 400 }, 400
+        journal = Journal()
+        journal.remove(account_id, trans_id)
+        journal.balance(account_id, account_balance_delta('DELETE_TRANS', transaction))
+        rollups = rollup_changes('DELETE_TRANS', account_id, transaction)
         
-        # Transfer transaction
-        if transaction['cat_or_acct_id'][0:5] == 'acct_':
-            transfer_account = db.accounts.find_one({'id': transaction['cat_or_acct_id']})
-            transfer_transaction = db[transaction['cat_or_acct_id']].find_one({'id': trans_id})
-            if not db[transaction['cat_or_acct_id']].remove({'id':trans_id})['n']:
+        # Transfer transactions
+        for transfer_id, amount in transfer_amounts(transaction):
+            transfer_transaction = transactions_for(transfer_id).find_one({'id': trans_id})
+            if not transfer_transaction:
                 abort(404)
-            updated_transfer_acct = update_account_balances('DELETE_TRANS', transfer_account, transfer_transaction)
-            return_accts.append(updated_transfer_acct)
+            journal.remove(transfer_id, trans_id)
+            journal.balance(transfer_id, account_balance_delta('DELETE_TRANS', transfer_transaction))
+            rollups += rollup_changes('DELETE_TRANS', transfer_id, transfer_transaction)
         
-        return { 'accounts': return_accts }
+        journal.rollups(rollups)
+        return { 'accounts': journal.commit() }
 
-def update_account_balances(action, account, transaction, old_transaction = None):
-    bal_unclr = account['bal_uncleared']
-    bal_clr = account['bal_cleared']
-    bal_rec = account['bal_reconciled']
-    
-    if action == 'CREATE_TRANS':
-        bal_unclr = round(bal_unclr + transaction['amount'], 2)
-        if transaction['reconciled'] in ['C', 'R']:
-            bal_clr = round(bal_clr + transaction['amount'], 2)
-        if transaction['reconciled'] == 'R':
-            bal_rec = round(bal_rec + transaction['amount'], 2)    
-    
-    elif action == 'DELETE_TRANS':
-        if transaction['reconciled'] == '':
-            bal_unclr = round( account['bal_uncleared'] - transaction['amount'], 2)
-        elif transaction['reconciled'] == 'C':
-            bal_unclr = round( account['bal_uncleared'] - transaction['amount'], 2)
-            bal_clr = round( account['bal_cleared'] - transaction['amount'], 2)
-        elif transaction['reconciled'] == 'R':
-            bal_unclr = round( account['bal_uncleared'] - transaction['amount'], 2)
-            bal_clr = round( account['bal_cleared'] - transaction['amount'], 2)
-            bal_rec = round( account['bal_reconciled'] - transaction['amount'], 2)
+def insert_transactions(account_id, transactions):
+    """
+    Insert new transactions for an account along with their mirrored
+    transfers as one journaled write: one bulk insert per target
+    collection, one balance update per affected account and one bulk
+    write for the monthly rollups, so a crash part way through is
+    finished by the journal replay. Transactions whose fingerprint already
+    exists in the account (or repeats within the batch) are skipped.
+    Returns (updated account balances, number of duplicates skipped).
+    """
+    for transaction in transactions:
+        transaction['fingerprint'] = transaction_fingerprint(account_id, transaction)
+    while True:
+        unique = {}
+        for transaction in transactions:
+            unique.setdefault(transaction['fingerprint'], transaction)
+        existing = transactions_for(account_id).find({'fingerprint': {'$in': unique.keys()}}, projection={'fingerprint': True})
+        for doc in existing:
+            del unique[doc['fingerprint']]
+        new_transactions = [t for t in transactions if unique.get(t['fingerprint']) is t]
+        
+        targets = [account_id]
+        by_account = {account_id: new_transactions}
+        for transaction in new_transactions:
+            for transfer_id, amount in transfer_amounts(transaction):
+                if transfer_id not in by_account:
+                    targets.append(transfer_id)
+                    by_account[transfer_id] = []
+                by_account[transfer_id].append(make_transfer_transaction(transaction, account_id, amount))
         
-    else:
+        journal = Journal()
+        for target_id in targets:
+            if by_account[target_id]:
+                journal.insert_many(target_id, by_account[target_id])
+        rollups = []
+        for target_id in targets:
+            delta = {'bal_uncleared': 0, 'bal_cleared': 0, 'bal_reconciled': 0}
+            for doc in by_account[target_id]:
+                for k, v in balance_delta(doc).iteritems():
+                    delta[k] += v
+                rollups += rollup_changes('CREATE_TRANS', target_id, doc)
+            journal.balance(target_id, delta)
+        journal.rollups(rollups)
+        try:
+            return journal.commit(), len(transactions) - len(new_transactions)
+        except DuplicateKeyError:
+            pass # Lost a race with a concurrent import of the same rows: skip them and try again
+
+def make_transaction(data):
+    """
+    Build a new transaction document from request data (amount in dollars).
+    Raises ValueError when a field is missing or malformed.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Transaction must be an object')
+    if data.get('date') == None or (data.get('amount') == None and not data.get('splits')):
+        raise ValueError('Transaction requires date and amount')
+    if data.get('reconciled') not in [None, '', 'C', 'R']:
+        raise ValueError('Invalid reconciled value')
+    try:
+        amount = to_cents(data['amount']) if data.get('amount') != None else None
+    except ArithmeticError:
+        raise ValueError('Invalid amount')
+    transaction = {
+        'id': str(ObjectId()),
+        'date': datetime.strptime(data['date'], '%Y-%m-%d'),
+        'type': data.get('type'),
+        'payee': data.get('payee'),
+        'reconciled': data.get('reconciled'),
+        'amount': amount,
+        'memo': data.get('memo'),
+        'cat_or_acct_id': data.get('cat_or_acct_id') or ''
+    }
+    if data.get('splits'):
+        transaction['splits'] = make_splits(data['splits'], amount)
+        transaction['amount'] = sum(split['amount'] for split in transaction['splits'])
+        transaction['cat_or_acct_id'] = ''
+    if data.get('fitid'):
+        transaction['fitid'] = str(data['fitid'])
+    return transaction
+
+def make_splits(items, amount=None):
+    """
+    Split sub-documents from request data (amounts in dollars). When the
+    transaction amount (cents) is given the splits must add up to it.
+    Raises ValueError when a split is missing or malformed.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('splits must be a non-empty list')
+    splits = []
+    for item in items:
+        if not isinstance(item, dict) or item.get('amount') == None:
+            raise ValueError('Every split requires an amount')
+        try:
+            split_amount = to_cents(item['amount'])
+        except ArithmeticError:
+            raise ValueError('Invalid split amount')
+        splits.append({'cat_or_acct_id': item.get('cat_or_acct_id') or '',
+                       'amount': split_amount,
+                       'memo': item.get('memo') or ''})
+    if amount != None and amount != sum(split['amount'] for split in splits):
+        raise ValueError('Split amounts must add up to the transaction amount')
+    return splits
+
+def transfer_amounts(transaction):
+    """
+    (account id, amount) of each account a transaction transfers to: its
+    cat_or_acct_id, or for a split transaction the total of the splits to
+    each account, in the order the accounts first appear
+    """
+    if not transaction.get('splits'):
+        if transaction['cat_or_acct_id'][0:5] == 'acct_':
+            return [(transaction['cat_or_acct_id'], transaction['amount'])]
+        return []
+    totals = {}
+    order = []
+    for split in transaction['splits']:
+        if split['cat_or_acct_id'][0:5] == 'acct_':
+            if split['cat_or_acct_id'] not in totals:
+                order.append(split['cat_or_acct_id'])
+                totals[split['cat_or_acct_id']] = 0
+            totals[split['cat_or_acct_id']] += split['amount']
+    return [(transfer_id, totals[transfer_id]) for transfer_id in order]
+
+def split_origin(transaction):
+    """
+    Account holding the split transaction a transaction is the transfer
+    mirror of, or None when it is not such a mirror
+    """
+    transfer_id = transaction['cat_or_acct_id']
+    if transaction.get('splits') or transfer_id[0:5] != 'acct_':
         return None
-    
-    db.accounts.update({'id': account['id']},
-                       {'$set': {'bal_uncleared': bal_unclr,
-                                 'bal_cleared': bal_clr,
-                                 'bal_reconciled': bal_rec}})
+    if transactions_for(transfer_id).find_one({'id': transaction['id'], 'splits.0': {'$exists': True}}, projection={'_id': True}):
+        return transfer_id
+    return None
+
+def transaction_fingerprint(account_id, transaction):
+    """
+    Identity of a transaction for duplicate detection: account, date,
+    amount, normalized payee and the bank's FITID when present
+    """
+    payee = ''.join(c for c in (transaction.get('payee') or '').lower() if c.isalnum())
+    key = '|'.join([account_id,
+                    transaction['date'].strftime('%Y-%m-%d'),
+                    str(transaction['amount']),
+                    payee,
+                    transaction.get('fitid') or ''])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def make_transfer_transaction(transaction, account_id, amount=None):
+    """
+    Mirror of a transfer transaction for the account it transfers to. For
+    a split transaction amount is the part transferred to that account.
+    """
+    transfer_transaction = transaction.copy() # Transaction ID stays same
+    transfer_transaction.pop('_id', None)
+    transfer_transaction.pop('fitid', None) # The bank id belongs to the originating account
+    transfer_transaction.pop('fingerprint', None) # Mirrors are never imported on their own
+    transfer_transaction.pop('splits', None) # Mirrors are plain transfers
+    transfer_transaction['reconciled'] = '' # Don't assume we know this type
+    transfer_transaction['amount'] = - (transaction['amount'] if amount == None else amount)
+    transfer_transaction['cat_or_acct_id'] = account_id # Set to originating account
+    return transfer_transaction
 
-    return { 'uri': '/api/accounts/' + account['id'],
-             'bal_uncleared': bal_unclr,
-             'bal_cleared': bal_clr,
-             'bal_reconciled': bal_rec }
+def update_split_transfers(journal, account_id, old_transaction, new_transaction):
+    """
+    Queue the mirrored transfer changes for an update involving a split
+    transaction: mirrors in accounts no longer transferred to are removed,
+    new ones inserted and the others rewritten (keeping their reconciled
+    state). Returns the rollup changes.
+    """
+    old_transfers = transfer_amounts(old_transaction)
+    new_transfers = dict(transfer_amounts(new_transaction))
+    rollups = []
+    for transfer_id, amount in old_transfers:
+        old_mirror = transactions_for(transfer_id).find_one({'id': old_transaction['id']})
+        if not old_mirror:
+            continue
+        if transfer_id in new_transfers:
+            mirror = make_transfer_transaction(new_transaction, account_id, new_transfers.pop(transfer_id))
+            mirror['reconciled'] = old_mirror['reconciled']
+            journal.replace(transfer_id, mirror)
+            journal.balance(transfer_id, account_balance_delta('UPDATE_TRANS', mirror, old_mirror))
+            rollups += rollup_changes('UPDATE_TRANS', transfer_id, mirror, old_mirror)
+        else:
+            journal.remove(transfer_id, old_transaction['id'])
+            journal.balance(transfer_id, account_balance_delta('DELETE_TRANS', old_mirror))
+            rollups += rollup_changes('DELETE_TRANS', transfer_id, old_mirror)
+    for transfer_id, amount in transfer_amounts(new_transaction):
+        if transfer_id in new_transfers:
+            mirror = make_transfer_transaction(new_transaction, account_id, amount)
+            journal.insert(transfer_id, mirror)
+            journal.balance(transfer_id, account_balance_delta('CREATE_TRANS', mirror))
+            rollups += rollup_changes('CREATE_TRANS', transfer_id, mirror)
+    return rollups
+
+def encode_cursor(transaction):
+    """
+    Opaque pagination cursor for a transaction's (date, id) sort key
+    """
+    key = transaction['date'].strftime('%Y-%m-%d') + '|' + transaction['id']
+    return base64.urlsafe_b64encode(key)
+
+def decode_cursor(cursor):
+    """
+    Inverse of encode_cursor; raises ValueError on a malformed cursor
+    """
+    try:
+        key = base64.urlsafe_b64decode(str(cursor))
+    except TypeError:
+        raise ValueError('Invalid cursor')
+    date_str, sep, id = key.partition('|')
+    if not sep or not id:
+        raise ValueError('Invalid cursor')
+    return datetime.strptime(date_str, '%Y-%m-%d'), id
+
+def account_balance_delta(action, transaction, old_transaction = None):
+    """
+    Change in an account's balances (cents) for a transaction change:
+    'CREATE_TRANS', 'DELETE_TRANS' or 'UPDATE_TRANS'
+    """
+    if action == 'CREATE_TRANS':
+        return balance_delta(transaction)
+    if action == 'DELETE_TRANS':
+        return balance_delta(transaction, -1)
+    delta = balance_delta(transaction)
+    for k, v in balance_delta(old_transaction, -1).iteritems():
+        delta[k] += v
+    return delta
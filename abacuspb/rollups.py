@@ -0,0 +1,133 @@
+from pymongo import UpdateOne
+from abacuspb import db
+from abacuspb.storage import transactions_for, account_ids, guard_journal
+from abacuspb.checkpoints import adjust_checkpoints, clear_checkpoints
+
+def rollup_key(account_id, transaction):
+    """
+    Rollup row a transaction belongs to: (account, category, month)
+    """
+    return (account_id, transaction['cat_or_acct_id'], transaction['date'].strftime('%Y-%m'))
+
+def split_parts(transaction):
+    """
+    The parts of a transaction that land in separate rollup rows: the
+    transaction itself, or one copy per split with the split's category
+    and amount
+    """
+    if not transaction.get('splits'):
+        return [transaction]
+    return [dict(transaction, cat_or_acct_id=split['cat_or_acct_id'], amount=split['amount'])
+            for split in transaction['splits']]
+
+def rollup_delta(transaction, sign=1):
+    """
+    Change in a rollup row's sums caused by a transaction (sign=-1 to reverse it)
+    """
+    amount = sign * transaction['amount']
+    return { 'sum': amount,
+             'count': sign,
+             'cleared_sum': amount if transaction['reconciled'] in ['C', 'R'] else 0,
+             'reconciled_sum': amount if transaction['reconciled'] == 'R' else 0 }
+
+def update_rollups(action, account_id, transaction, old_transaction = None):
+    """
+    Apply a transaction change to the monthly rollups, mirroring
+    account_balance_delta: 'CREATE_TRANS', 'DELETE_TRANS' or 'UPDATE_TRANS'
+    """
+    apply_rollup_deltas(merge_rollup_deltas(rollup_changes(action, account_id, transaction, old_transaction)))
+
+def rollup_changes(action, account_id, transaction, old_transaction = None):
+    """
+    (rollup key, delta) pairs for a transaction change, see update_rollups
+    """
+    changes = []
+    if action in ['CREATE_TRANS', 'UPDATE_TRANS']:
+        changes += [(rollup_key(account_id, part), rollup_delta(part)) for part in split_parts(transaction)]
+    if action == 'DELETE_TRANS':
+        changes += [(rollup_key(account_id, part), rollup_delta(part, -1)) for part in split_parts(transaction)]
+    if action == 'UPDATE_TRANS':
+        changes += [(rollup_key(account_id, part), rollup_delta(part, -1)) for part in split_parts(old_transaction)]
+    return changes
+
+def merge_rollup_deltas(changes):
+    """
+    Combine (key, delta) pairs into one delta per rollup row
+    """
+    merged = {}
+    for key, delta in changes:
+        if key not in merged:
+            merged[key] = dict(delta)
+        else:
+            for k, v in delta.iteritems():
+                merged[key][k] += v
+    return merged
+
+def apply_rollup_deltas(deltas, journal_id=None):
+    """
+    Upsert a {(account_id, category, month): delta} map into db.rollups and
+    shift the running-balance checkpoints of the affected months.
+    
+    With a journal_id each row is changed at most once per journal entry
+    (see guard_journal): the row is created if missing, then the $inc
+    only matches rows that have not recorded the entry yet.
+    """
+    ops = []
+    for (account_id, category, month), delta in deltas.iteritems():
+        if not any(delta.values()):
+            continue
+        key = {'account_id': account_id, 'category': category, 'month': month}
+        if journal_id == None:
+            ops.append(UpdateOne(key, {'$inc': delta}, upsert=True))
+        else:
+            ops.append(UpdateOne(key, {'$setOnInsert': dict((k, 0) for k in delta)}, upsert=True))
+            ops.append(UpdateOne(*guard_journal(key, {'$inc': delta}, journal_id)))
+    if ops:
+        db.rollups.bulk_write(ops, ordered=journal_id != None)
+    balances = {}
+    for (account_id, category, month), delta in deltas.iteritems():
+        balances[(account_id, month)] = balances.get((account_id, month), 0) + delta['sum']
+    adjust_checkpoints(balances, journal_id)
+
+def rebuild_rollups(account_id=None):
+    """
+    Recompute rollups from scratch for one account (or all accounts) with one
+    aggregation per account. Returns the number of rollup rows written.
+    """
+    written = 0
+    for target_id in ([account_id] if account_id else account_ids()):
+        rows = []
+        for group in transactions_for(target_id).aggregate(SPLIT_PARTS + [ROLLUP_GROUP]):
+            rows.append({ 'account_id': target_id,
+                          'category': group['_id']['category'],
+                          'month': group['_id']['month'],
+                          'sum': group['sum'],
+                          'count': group['count'],
+                          'cleared_sum': group['cleared_sum'],
+                          'reconciled_sum': group['reconciled_sum'] })
+        db.rollups.remove({'account_id': target_id})
+        clear_checkpoints(target_id)
+        if rows:
+            db.rollups.insert_many(rows)
+        written += len(rows)
+    return written
+
+# Aggregation stages giving one row per split_parts() part, with the
+# fields used by ROLLUP_GROUP and the reports
+SPLIT_PARTS = [
+    {'$project': {'date': True, 'payee': True, 'reconciled': True,
+                  'parts': {'$cond': [{'$gt': [{'$size': {'$ifNull': ['$splits', []]}}, 0]},
+                                      '$splits',
+                                      [{'cat_or_acct_id': '$cat_or_acct_id', 'amount': '$amount'}]]}}},
+    {'$unwind': '$parts'},
+    {'$project': {'date': True, 'payee': True, 'reconciled': True,
+                  'cat_or_acct_id': '$parts.cat_or_acct_id', 'amount': '$parts.amount'}}
+]
+
+ROLLUP_GROUP = {'$group': {
+    '_id': {'category': '$cat_or_acct_id', 'month': {'$dateToString': {'format': '%Y-%m', 'date': '$date'}}},
+    'sum': {'$sum': '$amount'},
+    'count': {'$sum': 1},
+    'cleared_sum': {'$sum': {'$cond': [{'$or': [{'$eq': ['$reconciled', 'C']}, {'$eq': ['$reconciled', 'R']}]}, '$amount', 0]}},
+    'reconciled_sum': {'$sum': {'$cond': [{'$eq': ['$reconciled', 'R']}, '$amount', 0]}}
+}}
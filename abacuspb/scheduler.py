@@ -0,0 +1,115 @@
+from datetime import datetime, date, timedelta
+from abacuspb import app, db
+from abacuspb.money import to_dollars
+from abacuspb.cache import account_metadata
+from abacuspb.resources.transactions import make_transaction, insert_transactions
+
+FREQUENCIES = ['daily', 'weekly', 'monthly', 'yearly']
+TEMPLATE_FIELDS = ['type', 'payee', 'amount', 'memo', 'cat_or_acct_id']
+
+def add_months(day, months):
+    """
+    Same day of the month, months later; clamped to the end of shorter months
+    """
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    last = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return datetime(year, month, min(day.day, last))
+
+def occurrence(schedule, n):
+    """
+    Date of a schedule's nth occurrence, counting the start date as 0.
+    Always computed from the start so month-end dates do not drift.
+    """
+    step = schedule['interval'] * n
+    if schedule['freq'] == 'daily':
+        return schedule['start'] + timedelta(days=step)
+    if schedule['freq'] == 'weekly':
+        return schedule['start'] + timedelta(weeks=step)
+    if schedule['freq'] == 'monthly':
+        return add_months(schedule['start'], step)
+    return add_months(schedule['start'], 12 * step)
+
+def occurrences(schedule, first=0):
+    """
+    (n, date) of every occurrence from the nth on, until the schedule's
+    'until' date or 'count' is reached (forever if neither is set)
+    """
+    n = first
+    while schedule.get('count') == None or n < schedule['count']:
+        day = occurrence(schedule, n)
+        if schedule.get('until') != None and day > schedule['until']:
+            return
+        yield n, day
+        n += 1
+
+def next_occurrence(schedule):
+    """
+    (n, date) of the first occurrence after the schedule's last
+    materialized one, or (None, None) once the schedule has ended. Used
+    when a schedule is created or its rule changes.
+    """
+    for n, day in occurrences(schedule):
+        if schedule.get('last_date') == None or day > schedule['last_date']:
+            return n, day
+    return None, None
+
+def schedule_transaction(schedule, day):
+    """
+    New transaction for one occurrence. The FITID names the schedule and
+    date, so the fingerprint check skips occurrences already materialized.
+    """
+    data = dict((k, schedule.get(k)) for k in TEMPLATE_FIELDS)
+    data['amount'] = to_dollars(schedule['amount'])
+    data['date'] = day.strftime('%Y-%m-%d')
+    data['reconciled'] = ''
+    data['fitid'] = schedule['id'] + ':' + data['date']
+    return make_transaction(data)
+
+def materialize_due(today=None, batch_size=None):
+    """
+    Create the transactions of every schedule occurrence due on or before
+    today, catching up on any missed runs.
+    
+    Occurrences are collected across schedules and written per account
+    with insert_transactions (mirrored transfers, balances and rollups
+    included), batch_size transactions at a time, each batch as one
+    journaled write. Each schedule is then advanced past its last
+    occurrence. A crash in between is harmless: a batch cut short is
+    finished by the journal replay (on startup or manage.py
+    replay-journal), and the next run regenerates the same FITIDs, which
+    are skipped as duplicates. Schedules whose account or transfer
+    account no longer exists are left due and reported.
+    Returns { 'created': <count>, 'duplicates': <count>, 'skipped': [schedule ids] }
+    """
+    today = today or date.today()
+    through = datetime(today.year, today.month, today.day)
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    result = {'created': 0, 'duplicates': 0, 'skipped': []}
+    pending = {} # account id -> transactions
+    advances = []
+    for schedule in db.schedules.find({'next_date': {'$lte': through}}):
+        transfer = schedule['cat_or_acct_id'] if schedule['cat_or_acct_id'][0:5] == 'acct_' else None
+        if not account_metadata(schedule['account_id']) or (transfer and not account_metadata(transfer)):
+            result['skipped'].append(schedule['id'])
+            continue
+        next_index, next_date, last_date = None, None, schedule.get('last_date')
+        for n, day in occurrences(schedule, schedule['next_index']):
+            if day > through:
+                next_index, next_date = n, day
+                break
+            pending.setdefault(schedule['account_id'], []).append(schedule_transaction(schedule, day))
+            last_date = day
+        advances.append((schedule, next_index, next_date, last_date))
+    
+    for account_id, transactions in pending.iteritems():
+        for start in range(0, len(transactions), batch_size):
+            batch = transactions[start:start + batch_size]
+            duplicates = insert_transactions(account_id, batch)[1]
+            result['created'] += len(batch) - duplicates
+            result['duplicates'] += duplicates
+    for schedule, next_index, next_date, last_date in advances:
+        # Only advance from the position read above, in case another run got there first
+        db.schedules.update({'id': schedule['id'], 'next_index': schedule['next_index']},
+                            {'$set': {'next_index': next_index, 'next_date': next_date, 'last_date': last_date}})
+    return result
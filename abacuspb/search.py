@@ -0,0 +1,72 @@
+import base64
+from datetime import datetime
+from abacuspb import app, db
+from abacuspb.storage import SINGLE, account_ids
+
+def search_transactions(text, accounts=None, query=None, after=None, limit=60):
+    """
+    Up to limit + 1 transactions matching the search text in their payee or
+    memo (not the memos of their splits), newest first, each stamped with
+    its 'account_id'.
+    
+    Matching is done by the text index; accounts limits the search to those
+    account ids, query adds further conditions (date, amount) and after is
+    a (date, id, account_id) sort key from decode_search_cursor to resume
+    from. Results are ordered on (date DESC, id ASC, account_id ASC), which
+    is unique even for the two halves of a transfer.
+    """
+    query = dict(query or {})
+    query['$text'] = {'$search': text}
+    sort = [('date', -1), ('id', 1)]
+    if app.config['TRANSACTION_LAYOUT'] == SINGLE:
+        if accounts:
+            query['account_id'] = {'$in': list(accounts)}
+        if after:
+            query = {'$and': [query, {'$or': search_keyset(after)}]}
+        hits = list(db.transactions.find(query, sort=sort + [('account_id', 1)], limit=limit + 1))
+    else:
+        # One text query per account collection, merged on the sort key
+        hits = []
+        for account_id in (accounts or account_ids()):
+            account_query = query
+            if after:
+                account_query = {'$and': [query, {'$or': search_keyset(after, account_id)}]}
+            for tran in db[account_id].find(account_query, sort=sort, limit=limit + 1):
+                tran['account_id'] = account_id
+                hits.append(tran)
+        hits.sort(key=lambda t: (t['id'], t['account_id']))
+        hits.sort(key=lambda t: t['date'], reverse=True)
+    return hits[:limit + 1]
+
+def search_keyset(after, account_id=None):
+    """
+    $or clauses selecting the transactions that sort after the key; in the
+    per-account layout account_id is the collection being queried
+    """
+    cdate, cid, caccount = after
+    keyset = [{'date': {'$lt': cdate}}, {'date': cdate, 'id': {'$gt': cid}}]
+    if account_id == None:
+        keyset.append({'date': cdate, 'id': cid, 'account_id': {'$gt': caccount}})
+    elif account_id > caccount:
+        keyset.append({'date': cdate, 'id': cid})
+    return keyset
+
+def encode_search_cursor(transaction):
+    """
+    Opaque pagination cursor for a search hit's (date, id, account_id) sort key
+    """
+    key = '|'.join([transaction['date'].strftime('%Y-%m-%d'), transaction['id'], transaction['account_id']])
+    return base64.urlsafe_b64encode(key)
+
+def decode_search_cursor(cursor):
+    """
+    Inverse of encode_search_cursor; raises ValueError on a malformed cursor
+    """
+    try:
+        key = base64.urlsafe_b64decode(str(cursor))
+    except TypeError:
+        raise ValueError('Invalid cursor')
+    parts = key.split('|')
+    if len(parts) != 3 or not all(parts):
+        raise ValueError('Invalid cursor')
+    return datetime.strptime(parts[0], '%Y-%m-%d'), parts[1], parts[2]
@@ -1 +1,23 @@
 MONGO_DBNAME = 'abacuspb'
+
+# Transaction storage: 'per_account' (one collection per account) or 'single'
+# (one 'transactions' collection keyed by account_id). Use manage.py
+# migrate-layout to move existing data before switching to 'single'.
+TRANSACTION_LAYOUT = 'per_account'
+
+TRANSACTIONS_PAGE_SIZE = 60
+TRANSACTIONS_MAX_PAGE_SIZE = 500
+TRANSACTIONS_EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+RECONCILE_WORKERS = 8 # Accounts verified in parallel by manage.py verify-balances
+CACHE_SIZE = 1024 # Entries per metadata cache (accounts, payees, categories)
+CACHE_TTL = 60 # Seconds; bounds staleness when another process writes
+SCHEDULER_INTERVAL = 3600 # Seconds between runs of manage.py run-scheduler
+PAYEE_INDEX_TTL = 300 # Seconds between rebuilds of the payee search index
+JOURNAL_APPLIED_IDS = 100 # Journal entry ids remembered per balance/rollup document for replay
+JOURNAL_REPLAY_GRACE = 60 # Seconds before an unfinished journal entry is considered abandoned and replayed
+JOURNAL_REPLAY_INTERVAL = 60 # Seconds between background journal replays
+
+# JSON library for API responses: 'orjson', 'rapidjson', 'ujson' or 'json';
+# None uses the fastest one installed
+JSON_ENCODER = None
@@ -0,0 +1,126 @@
+from pymongo import UpdateOne
+from abacuspb import app, db
+
+PER_ACCOUNT = 'per_account' # One collection per account, named by account id
+SINGLE = 'single' # One 'transactions' collection partitioned by account_id
+
+def transactions_for(account_id):
+    """
+    Return the transactions collection for an account in the configured layout
+    """
+    if app.config['TRANSACTION_LAYOUT'] == SINGLE:
+        return AccountTransactions(account_id)
+    return db[account_id]
+
+def account_ids():
+    """
+    Ids of every account that owns transactions
+    """
+    return [account['id'] for account in db.accounts.find(projection={'id': True})]
+
+def aggregate_all(pipeline):
+    """
+    Run an aggregation over every account's transactions and return the
+    resulting groups. The pipeline must end in a $group whose accumulators
+    are all $sum: in the per-account layout it runs once per collection and
+    groups with the same _id are merged by adding their fields.
+    """
+    if app.config['TRANSACTION_LAYOUT'] == SINGLE:
+        return list(db.transactions.aggregate(pipeline))
+    merged = {}
+    for account_id in account_ids():
+        for group in db[account_id].aggregate(pipeline):
+            key = repr(group['_id'])
+            if key not in merged:
+                merged[key] = group
+            else:
+                for k, v in group.iteritems():
+                    if k != '_id':
+                        merged[key][k] += v
+    return merged.values()
+
+def insert_missing(account_id, documents):
+    """
+    Insert an account's transactions whose id is not stored yet, with one
+    bulk write of upserts, so inserting the same documents again is a
+    no-op. Raises BulkWriteError when a document is rejected (e.g. a
+    duplicate fingerprint).
+    """
+    if not documents:
+        return None
+    collection = transactions_for(account_id)
+    if isinstance(collection, AccountTransactions):
+        ops = [UpdateOne({'account_id': account_id, 'id': doc['id']}, {'$setOnInsert': collection._stamp(doc)}, upsert=True)
+               for doc in documents]
+    else:
+        ops = [UpdateOne({'id': doc['id']}, {'$setOnInsert': doc}, upsert=True) for doc in documents]
+    return collection.bulk_write(ops, ordered=False)
+
+def guard_journal(spec, update, journal_id):
+    """
+    Make an update apply at most once per journal entry: it only matches
+    documents that have not recorded journal_id yet and records it in the
+    same atomic update (keeping the last JOURNAL_APPLIED_IDS ids)
+    """
+    spec = dict(spec, journal={'$ne': journal_id})
+    update = dict(update)
+    update['$push'] = {'journal': {'$each': [journal_id], '$slice': -app.config['JOURNAL_APPLIED_IDS']}}
+    return spec, update
+
+
+class AccountTransactions(object):
+    """
+    One account's slice of the shared 'transactions' collection.
+
+    Mirrors the subset of the pymongo Collection API used by the resources,
+    scoping every query to the account and stamping 'account_id' on writes.
+    """
+    def __init__(self, account_id, collection=None):
+        self.account_id = account_id
+        self.collection = collection if collection is not None else db.transactions
+
+    def _scope(self, spec):
+        spec = dict(spec or {})
+        spec['account_id'] = self.account_id
+        return spec
+
+    def _stamp(self, doc):
+        doc = dict(doc)
+        doc.pop('_id', None) # Mirrored transfers are copies of another account's document
+        doc['account_id'] = self.account_id
+        return doc
+
+    def find(self, spec=None, *args, **kwargs):
+        return self.collection.find(self._scope(spec), *args, **kwargs)
+
+    def find_one(self, spec=None, *args, **kwargs):
+        return self.collection.find_one(self._scope(spec), *args, **kwargs)
+
+    def insert(self, doc_or_docs, *args, **kwargs):
+        if isinstance(doc_or_docs, dict):
+            return self.collection.insert(self._stamp(doc_or_docs), *args, **kwargs)
+        return self.collection.insert([self._stamp(doc) for doc in doc_or_docs], *args, **kwargs)
+
+    def insert_many(self, documents, *args, **kwargs):
+        return self.collection.insert_many([self._stamp(doc) for doc in documents], *args, **kwargs)
+
+    def update(self, spec, document, *args, **kwargs):
+        if not any(k.startswith('$') for k in document):
+            document = dict(document, account_id=self.account_id) # Full document replacement
+        return self.collection.update(self._scope(spec), document, *args, **kwargs)
+
+    def find_one_and_update(self, spec, update, *args, **kwargs):
+        return self.collection.find_one_and_update(self._scope(spec), update, *args, **kwargs)
+
+    def remove(self, spec=None, *args, **kwargs):
+        return self.collection.remove(self._scope(spec), *args, **kwargs)
+
+    def bulk_write(self, requests, *args, **kwargs):
+        # Requests are passed through as-is: callers filter on _id or stamped documents
+        return self.collection.bulk_write(requests, *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        return self.collection.aggregate([{'$match': {'account_id': self.account_id}}] + list(pipeline), *args, **kwargs)
+
+    def drop(self):
+        self.collection.remove({'account_id': self.account_id})
@@ -0,0 +1,54 @@
+from datetime import datetime
+from functools import wraps
+from flask import request, Response
+from flask.ext.restful.utils import unpack
+from werkzeug.http import http_date, quote_etag
+from abacuspb import db
+
+def bump_version(name):
+    """
+    Record a change to a collection served by a conditional GET
+    """
+    db.versions.update_one({'_id': name}, {'$inc': {'version': 1}, '$set': {'modified': datetime.utcnow()}},
+                           upsert=True)
+
+def collection_version(name):
+    """
+    (entity tag, last modified time) of a collection's current version
+    """
+    version = db.versions.find_one({'_id': name}) or {'version': 0, 'modified': datetime(1970, 1, 1)}
+    return '%s-%d' % (name, version['version']), version['modified']
+
+def conditional(name):
+    """
+    Decorate a GET handler whose response depends only on the named
+    collection: answer If-None-Match / If-Modified-Since with 304 from the
+    version counter alone, without running the handler, and tag 200
+    responses with ETag and Last-Modified.
+    
+    HTTP dates only have whole seconds, so Last-Modified is only sent, and
+    If-Modified-Since only answered, once the second of the last change
+    has passed: until then another change could land in the same second
+    and look unmodified. The ETag is exact either way.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag, modified = collection_version(name)
+            settled = modified < datetime.utcnow().replace(microsecond=0)
+            modified = modified.replace(microsecond=0)
+            headers = {'ETag': quote_etag(etag)}
+            if settled:
+                headers['Last-Modified'] = http_date(modified)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = settled and request.if_modified_since != None and modified <= request.if_modified_since
+            if not_modified:
+                return Response(status=304, headers=headers)
+            data, code, extra = unpack(f(*args, **kwargs))
+            if code == 200:
+                extra = dict(extra or {}, **headers)
+            return data, code, extra
+        return wrapper
+    return decorator
@@ -0,0 +1,33 @@
+"""
+List-endpoint serialization: flask-restful marshal() per row vs the
+compiled Marshaller, for accounts (with fields.Url) and transactions.
+
+Usage: python benchmarks/marshalling.py [rows]
+No database is needed.
+"""
+import sys, os, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from flask.ext.restful import marshal
+from abacuspb import app
+from abacuspb.marshalling import Marshaller
+from abacuspb.resources.accounts import account_fields
+from abacuspb.resources.transactions import transaction_list_fields
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    accounts = [{'id': 'acct_%d' % i, 'name': 'Account %d' % i, 'type': 'Checking', 'bank_name': 'Bank',
+                 'account_num': str(i), 'bal_uncleared': i, 'bal_cleared': i, 'bal_reconciled': i} for i in range(rows)]
+    transactions = [{'id': '%024x' % i, 'date': '2014-08-10', 'type': 'EFT', 'payee': 'Giant', 'reconciled': 'C',
+                     'amount': -5208, 'memo': '', 'cat_or_acct_id': 'groceries', 'running_balance': i,
+                     'uri': '/api/transactions/acct_checking/%024x' % i} for i in range(rows)]
+    print '%-14s %10s %10s %8s' % ('%d rows' % rows, 'marshal', 'compiled', 'speedup')
+    with app.test_request_context('/'):
+        for name, field_spec, docs in [('accounts', account_fields, accounts),
+                                       ('transactions', transaction_list_fields, transactions)]:
+            marshaller = Marshaller(field_spec)
+            before = min(timeit.repeat(lambda: [marshal(doc, field_spec) for doc in docs], number=1, repeat=3))
+            after = min(timeit.repeat(lambda: marshaller.many(docs), number=1, repeat=3))
+            print '%-14s %8.1fms %8.1fms %7.1fx' % (name, before * 1000, after * 1000, before / after)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Net-worth series: bucketing daily deltas and accumulating balances with
+NumPy vs the pure Python fallback, for a daily series over many accounts.
+
+Usage: python benchmarks/networth.py [accounts] [years]
+No database is needed.
+"""
+import sys, os, random, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from datetime import date, timedelta
+from abacuspb import networth
+
+def main():
+    accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    end = date(2014, 12, 31)
+    ends = [day.toordinal() for day in networth.period_ends(end - timedelta(days=365 * years), end, 'day')]
+    anchors = [random.randint(-10 ** 6, 10 ** 6) for i in range(accounts)]
+    deltas = [[(day, random.randint(-10 ** 5, 10 ** 5)) for day in ends if random.random() < 0.8] for i in range(accounts)]
+    print '%d accounts, %d days' % (accounts, len(ends))
+    python = min(timeit.repeat(lambda: networth.python_balances(ends, anchors, deltas), number=1, repeat=3))
+    print '%-8s %8.1fms' % ('python', python * 1000)
+    if networth.numpy:
+        vectorized = min(timeit.repeat(lambda: networth.numpy_balances(ends, anchors, deltas), number=1, repeat=3))
+        print '%-8s %8.1fms %7.1fx' % ('numpy', vectorized * 1000, python / vectorized)
+    else:
+        print 'numpy not installed'
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Per-request cost of request parsing: building a RequestParser in every
+Resource.__init__ (the old behaviour) vs the shared module-level parsers.
+
+Usage: python benchmarks/request_parsers.py [iterations]
+No database is needed; requests are simulated with test_request_context.
+"""
+import sys, os, json, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from flask.ext.restful import reqparse
+from abacuspb import app
+from abacuspb.resources.accounts import account_list_parser
+from abacuspb.resources.transactions import transaction_list_parser, transaction_parser
+
+CASES = [
+    ('POST /api/accounts', account_list_parser, {'name': 'Checking', 'type': 'Checking'}),
+    ('POST /api/transactions/<id>', transaction_list_parser,
+     {'date': '2014-08-10', 'type': 'EFT', 'payee': 'Giant', 'reconciled': '', 'amount': -52.08, 'memo': ''}),
+    ('PUT /api/transactions/<id>/<id>', transaction_parser, {'amount': -50.00})
+]
+
+def rebuild(parser):
+    """
+    What every request used to do: a new parser with new arguments
+    """
+    fresh = reqparse.RequestParser()
+    for arg in parser.args:
+        fresh.add_argument(arg.name, type=arg.type, location=arg.location, default=arg.default,
+                           required=arg.required, choices=arg.choices, help=arg.help)
+    return fresh
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print '%-34s %12s %12s %8s' % ('request', 'per-request', 'shared', 'saved')
+    for name, parser, body in CASES:
+        with app.test_request_context('/', method='POST', data=json.dumps(body), content_type='application/json'):
+            before = min(timeit.repeat(lambda: rebuild(parser).parse_args(), number=iterations, repeat=3))
+            after = min(timeit.repeat(lambda: parser.parse_args(), number=iterations, repeat=3))
+        print '%-34s %10.1fus %10.1fus %7.0f%%' % (name, before / iterations * 1e6, after / iterations * 1e6,
+                                                   (before - after) / before * 100)
+
+if __name__ == '__main__':
+    main()
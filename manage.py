@@ -0,0 +1,144 @@
+import argparse
+from abacuspb import app
+
+def migrate_layout(args):
+    from abacuspb.migrations import migrate_to_single_collection
+    from abacuspb.indexes import ensure_indexes
+    from abacuspb.storage import SINGLE
+    copied = migrate_to_single_collection(drop=args.drop)
+    for account_id, count in sorted(copied.items()):
+        print '%s: %d transactions' % (account_id, count)
+    app.config['TRANSACTION_LAYOUT'] = SINGLE
+    ensure_indexes()
+    print "Done. Set TRANSACTION_LAYOUT = 'single' in settings.py"
+
+def migrate_money(args):
+    from abacuspb.migrations import migrate_balances_to_cents, migrate_amounts_to_cents
+    print '%d account balances converted to cents' % migrate_balances_to_cents()
+    print '%d transaction amounts converted to cents' % migrate_amounts_to_cents()
+
+def fingerprint(args):
+    from abacuspb.migrations import backfill_fingerprints
+    fingerprinted, duplicates = backfill_fingerprints()
+    for account_id, id, original_id in duplicates:
+        print '%s: %s duplicates %s' % (account_id, id, original_id)
+    print '%d transactions fingerprinted, %d duplicates found' % (fingerprinted, len(duplicates))
+
+def dedupe_names(args):
+    from abacuspb.migrations import dedupe_names
+    from abacuspb.indexes import ensure_indexes
+    changes = dedupe_names()
+    for collection, id, name, new_name in changes:
+        if new_name:
+            print '%s %s: renamed %s to %s' % (collection, id, name, new_name)
+        else:
+            print '%s %s: deleted duplicate of %s' % (collection, id, name)
+    ensure_indexes()
+    print '%d duplicate names fixed' % len(changes)
+
+def rebuild_rollups(args):
+    from abacuspb.rollups import rebuild_rollups
+    print '%d rollup rows written' % rebuild_rollups(args.account_id)
+
+def replay_journal(args):
+    from abacuspb.journal import replay_journal
+    print '%d journal entries replayed' % replay_journal(grace=args.grace)
+
+def verify_balances(args):
+    from abacuspb.reconcile import verify_balances, BALANCE_FIELDS
+    mismatches = verify_balances(repair=args.repair, workers=args.workers)
+    for result in mismatches:
+        print '%s: %s%s' % (result['id'], ', '.join('%s %d != %d' % (field, result['stored'][field], result['computed'][field])
+                                                   for field in BALANCE_FIELDS if result['stored'][field] != result['computed'][field]),
+                            ' (repaired)' if result['repaired'] else '')
+    print '%d accounts with wrong balances%s' % (len(mismatches),
+                                                 ', %d repaired' % sum(1 for result in mismatches if result['repaired']) if args.repair else '')
+
+def record_openings(args):
+    from abacuspb.reconcile import record_opening_balances
+    recorded, skipped = record_opening_balances()
+    for id in skipped:
+        print 'Skipped %s: being written to, run again' % id
+    print '%d opening balances recorded' % recorded
+
+def materialize_schedules(args):
+    from abacuspb.scheduler import materialize_due
+    result = materialize_due()
+    for id in result['skipped']:
+        print 'Skipped schedule %s: account does not exist' % id
+    print '%d scheduled transactions created (%d duplicates skipped)' % (result['created'], result['duplicates'])
+
+def run_scheduler(args):
+    import time
+    from datetime import datetime
+    from abacuspb.scheduler import materialize_due
+    interval = args.interval or app.config['SCHEDULER_INTERVAL']
+    while True:
+        try:
+            result = materialize_due()
+            print '%s: %d scheduled transactions created' % (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), result['created'])
+        except Exception:
+            app.logger.exception('Scheduler run failed; retrying in %d seconds' % interval)
+        time.sleep(interval)
+
+def import_statement(args):
+    from abacuspb.importer import import_statement
+    format = args.format or args.file.rsplit('.', 1)[-1].lower()
+    with open(args.file, 'rb') as fileobj:
+        result = import_statement(args.account_id, fileobj, format, batch_size=args.batch_size)
+    for number, message in result['skipped']:
+        print 'Skipped row %d: %s' % (number, message)
+    print '%d transactions imported into %s (%d duplicates skipped)' % (result['imported'], args.account_id, result['duplicates'])
+
+def main():
+    parser = argparse.ArgumentParser(description='AbacusPB maintenance commands')
+    commands = parser.add_subparsers()
+    
+    cmd = commands.add_parser('migrate-layout', help='Move per-account collections into one transactions collection')
+    cmd.add_argument('--drop', action='store_true', help='Drop each per-account collection after copying it')
+    cmd.set_defaults(func=migrate_layout)
+    
+    cmd = commands.add_parser('migrate-money', help='Convert stored dollar amounts to integer cents')
+    cmd.set_defaults(func=migrate_money)
+    
+    cmd = commands.add_parser('fingerprint', help='Fingerprint existing transactions and report duplicates')
+    cmd.set_defaults(func=fingerprint)
+    
+    cmd = commands.add_parser('dedupe-names', help='Make payee and category names unique and create their indexes')
+    cmd.set_defaults(func=dedupe_names)
+    
+    cmd = commands.add_parser('rebuild-rollups', help='Recompute monthly rollups from the transactions')
+    cmd.add_argument('account_id', nargs='?', help='Only rebuild this account')
+    cmd.set_defaults(func=rebuild_rollups)
+    
+    cmd = commands.add_parser('replay-journal', help='Finish transaction writes interrupted by a crash')
+    cmd.add_argument('--grace', type=int, help='Only replay entries older than this many seconds (0 when no server is running)')
+    cmd.set_defaults(func=replay_journal)
+    
+    cmd = commands.add_parser('verify-balances', help='Recompute account balances from the transactions and report differences')
+    cmd.add_argument('--repair', action='store_true', help='Correct the stored balances that differ (accounts with a recorded opening balance)')
+    cmd.add_argument('--workers', type=int, help='Accounts checked in parallel')
+    cmd.set_defaults(func=verify_balances)
+    
+    cmd = commands.add_parser('record-openings', help='Record the opening balance of accounts created before it was tracked')
+    cmd.set_defaults(func=record_openings)
+    
+    cmd = commands.add_parser('materialize-schedules', help='Create the transactions of every due recurring schedule')
+    cmd.set_defaults(func=materialize_schedules)
+    
+    cmd = commands.add_parser('run-scheduler', help='Run materialize-schedules in a loop')
+    cmd.add_argument('--interval', type=int, help='Seconds between runs')
+    cmd.set_defaults(func=run_scheduler)
+    
+    cmd = commands.add_parser('import', help='Import an OFX/QFX or CSV bank statement')
+    cmd.add_argument('account_id', help='Account to import into, e.g. acct_checking')
+    cmd.add_argument('file', help='Statement file')
+    cmd.add_argument('--format', choices=['ofx', 'qfx', 'csv'], help='Statement format (default: file extension)')
+    cmd.add_argument('--batch-size', type=int, help='Transactions committed per batch')
+    cmd.set_defaults(func=import_statement)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
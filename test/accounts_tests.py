@@ -1,4 +1,5 @@
 import unittest, abacuspb, json
+from abacuspb.cache import clear_caches
 from test import test_data
 from datetime import datetime
 
@@ -8,6 +9,7 @@ class AccountsAPI_TestCase(unittest.TestCase):
     
     def setUp(self):
         self.app = abacuspb.app.test_client()
+        clear_caches()
         db.accounts.drop()
         
     def tearDown(self):
@@ -35,6 +37,16 @@ class AccountsAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['account']['uri'], '/api/accounts/acct_testaccountname')
         self.assertIsNotNone(db.accounts.find_one())
         
+    def test_AccountListAPI_Post_CreatesIndexes(self):
+        rv = self.app.post('/api/accounts',
+                           data=json.dumps(test_data.account),
+                           content_type='application/json')
+        self.assertEqual(rv.status_code, 201)
+        indexes = db['acct_testaccountname'].index_information()
+        self.assertTrue(indexes['id_1']['unique'])
+        self.assertIn('date_-1_id_1', indexes)
+        db['acct_testaccountname'].drop()
+        
     def test_AccountListAPI_Post_EntryExists(self):
         db.accounts.insert(test_data.db_account)
         rv = self.app.post('/api/accounts',
@@ -56,6 +68,14 @@ class AccountsAPI_TestCase(unittest.TestCase):
         self.assertEqual(rv.status_code, 200)
         self.assertEqual(obj['account']['uri'], '/api/accounts/acct_testaccountname')
         
+    def test_AccountAPI_Get_BalancesInDollars(self):
+        db.accounts.insert(test_data.db_account)
+        rv = self.app.get('/api/accounts/acct_testaccountname')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(obj['account']['bal_uncleared'], 2635.63)
+        self.assertEqual(obj['account']['bal_cleared'], -40.92)
+        self.assertEqual(obj['account']['bal_reconciled'], 1021.61)
+        
     def test_AccountAPI_Put_Empty(self):
         rv = self.app.put('/api/accounts/acct_testaccountname',
                           data=json.dumps(test_data.account_put),
@@ -73,6 +93,20 @@ class AccountsAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['account']['name'], 'Savings Account')
         self.assertEqual(obj['account']['type'], 'Savings')
     
+    def test_AccountAPI_Put_KeepsOtherFields(self):
+        db.accounts.insert(test_data.db_account)
+        db.accounts.update_one({'id': 'acct_testaccountname'}, {'$inc': {'bal_uncleared': 500}, '$push': {'journal': 'j1'}})
+        rv = self.app.put('/api/accounts/acct_testaccountname',
+                          data=json.dumps({ 'name': 'Renamed' }),
+                          content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        account = db.accounts.find_one({'id': 'acct_testaccountname'})
+        self.assertEqual(account['name'], 'Renamed')
+        self.assertEqual(account['bal_uncleared'], test_data.db_account['bal_uncleared'] + 500)
+        self.assertEqual(account['journal'], ['j1'])
+        self.assertEqual(obj['account']['bal_uncleared'], (test_data.db_account['bal_uncleared'] + 500) / 100.0)
+    
     def test_AccountAPI_Delete_Empty(self):
         rv = self.app.delete('/api/accounts/acct_testaccountname')
         obj = json.loads(rv.get_data())
@@ -0,0 +1,93 @@
+import unittest, abacuspb, json
+from abacuspb.rollups import rebuild_rollups
+from datetime import datetime
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class BudgetAPI_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.categories.drop()
+        db.budgets.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.accounts.insert([test_data.db_account, test_data.db_account_2]) # Only the first is budget monitored
+        db.categories.insert(test_data.db_categories + [
+            {'id': '53f69e77137a001e344259fc', 'name': 'Car Wash', 'budget_tracked': False,
+             'parent_id': '53f69e77137a001e344259fb'}]) # Counts towards Auto:Service
+        db['acct_testaccountname'].insert([
+            {'id': '1', 'date': datetime(2014,8,1), 'payee': 'Exxon', 'reconciled': '', 'amount': -4092, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259fa'}, # Auto:Gas
+            {'id': '2', 'date': datetime(2014,8,5), 'payee': 'Jiffy Lube', 'reconciled': '', 'amount': -3999, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259fb'}, # Auto:Service
+            {'id': '3', 'date': datetime(2014,8,9), 'payee': 'Splash', 'reconciled': '', 'amount': -1000, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259fc'}, # Auto:Service:Car Wash
+            {'id': '4', 'date': datetime(2014,9,2), 'payee': 'Exxon', 'reconciled': '', 'amount': -3500, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259fa'} # Next month
+        ])
+        db['acct_toaccountname'].insert([
+            {'id': '5', 'date': datetime(2014,8,20), 'payee': 'Olive Garden', 'reconciled': '', 'amount': -6512, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259f2'} # Not a monitored account
+        ])
+        rebuild_rollups()
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.categories.drop()
+        db.budgets.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def budget(self, month):
+        rv = self.app.get('/api/budgets/' + month)
+        self.assertEqual(rv.status_code, 200)
+        obj = json.loads(rv.get_data())['budget']
+        return obj, dict((row['name'], row) for row in obj['categories'])
+    
+    def test_BudgetAPI_GET_BudgetVsActual(self):
+        self.app.put('/api/budgets/2014-08/53f69e77137a001e344259fa', data=json.dumps({'amount': 100}), content_type='application/json')
+        self.app.put('/api/budgets/2014-08/53f69e77137a001e344259fb', data=json.dumps({'amount': 40}), content_type='application/json')
+        obj, rows = self.budget('2014-08')
+        self.assertEqual(obj['accounts'], ['acct_testaccountname'])
+        self.assertEqual(sorted(rows), ['Dining & Entertainment', 'Gas', 'Service', 'Tithe'])
+        self.assertEqual(rows['Gas'], {'id': '53f69e77137a001e344259fa', 'name': 'Gas',
+                                       'budget': 100.0, 'actual': -40.92, 'remaining': 59.08})
+        self.assertEqual(rows['Service']['actual'], -49.99) # Includes the untracked Car Wash
+        self.assertEqual(rows['Service']['remaining'], -9.99)
+        self.assertEqual(rows['Dining & Entertainment']['actual'], 0) # Unmonitored account
+        self.assertEqual(obj['total'], {'budget': 140.0, 'actual': -90.91, 'remaining': 49.09}) # Summed in cents
+    
+    def test_BudgetAPI_GET_CarriesBudgetForward(self):
+        self.app.put('/api/budgets/2014-08/53f69e77137a001e344259fa', data=json.dumps({'amount': 100}), content_type='application/json')
+        obj, rows = self.budget('2014-09')
+        self.assertEqual(rows['Gas']['budget'], 100.0)
+        self.assertEqual(rows['Gas']['actual'], -35.0)
+        self.app.put('/api/budgets/2014-09/53f69e77137a001e344259fa', data=json.dumps({'amount': 80}), content_type='application/json')
+        self.assertEqual(self.budget('2014-09')[1]['Gas']['budget'], 80.0)
+        self.assertEqual(self.budget('2014-08')[1]['Gas']['budget'], 100.0)
+        self.assertEqual(self.budget('2014-07')[1]['Gas']['budget'], 0)
+        rv = self.app.delete('/api/budgets/2014-09/53f69e77137a001e344259fa')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(self.budget('2014-09')[1]['Gas']['budget'], 100.0)
+    
+    def test_BudgetAPI_FollowsTransactionWrites(self):
+        rv = self.app.post('/api/transactions/acct_testaccountname', data=json.dumps({
+            'date': '2014-08-25', 'type': 'EFT', 'payee': 'Exxon', 'reconciled': '', 'amount': -20.00,
+            'memo': '', 'cat_or_acct_id': '53f69e77137a001e344259fa'}), content_type='application/json')
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(self.budget('2014-08')[1]['Gas']['actual'], -60.92)
+    
+    def test_BudgetCategoryAPI_BadRequests(self):
+        self.assertEqual(self.app.get('/api/budgets/August').status_code, 400)
+        rv = self.app.put('/api/budgets/2014-08/53f69e77137a001e344259f1', data=json.dumps({'amount': 50}), content_type='application/json')
+        self.assertEqual(rv.status_code, 400) # Auto is not budget tracked
+        rv = self.app.put('/api/budgets/2014-08/nosuchcategory', data=json.dumps({'amount': 50}), content_type='application/json')
+        self.assertEqual(rv.status_code, 404)
+        self.assertEqual(self.app.delete('/api/budgets/2014-08/53f69e77137a001e344259fa').status_code, 404)
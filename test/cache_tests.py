@@ -0,0 +1,99 @@
+import unittest, abacuspb, json, time
+from abacuspb.cache import LRUCache, clear_caches, account_metadata, all_payees
+from test import test_data
+
+db = abacuspb.db
+
+class LRUCache_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        self.loads = []
+        db.accounts.drop()
+        db.payees.drop()
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.payees.drop()
+    
+    def loader(self, value):
+        def load():
+            self.loads.append(value)
+            return value
+        return load
+    
+    def test_LRUCache_ReadThrough(self):
+        cache = LRUCache(10, 60)
+        self.assertEqual(cache.get('a', self.loader(1)), 1)
+        self.assertEqual(cache.get('a', self.loader(2)), 1)
+        self.assertEqual(self.loads, [1])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+    
+    def test_LRUCache_CachesMissingDocuments(self):
+        cache = LRUCache(10, 60)
+        self.assertIsNone(cache.get('a', self.loader(None)))
+        self.assertIsNone(cache.get('a', self.loader(1)))
+        self.assertEqual(self.loads, [None])
+    
+    def test_LRUCache_EvictsLeastRecentlyUsed(self):
+        cache = LRUCache(2, 60)
+        cache.get('a', self.loader(1))
+        cache.get('b', self.loader(2))
+        cache.get('a', self.loader(1)) # 'b' is now the oldest
+        cache.get('c', self.loader(3))
+        self.assertEqual(cache.stats()['size'], 2)
+        cache.get('b', self.loader(2))
+        self.assertEqual(self.loads, [1, 2, 3, 2])
+    
+    def test_LRUCache_Expires(self):
+        cache = LRUCache(10, 0.01)
+        cache.get('a', self.loader(1))
+        time.sleep(0.02)
+        cache.get('a', self.loader(1))
+        self.assertEqual(self.loads, [1, 1])
+    
+    def test_LRUCache_Invalidate(self):
+        cache = LRUCache(10, 60)
+        cache.get('a', self.loader(1))
+        cache.get('b', self.loader(2))
+        cache.invalidate('a')
+        cache.get('a', self.loader(3))
+        cache.get('b', self.loader(4))
+        self.assertEqual(self.loads, [1, 2, 3])
+        cache.invalidate()
+        self.assertEqual(cache.stats()['size'], 0)
+    
+    def test_LRUCache_InvalidateDuringLoad(self):
+        cache = LRUCache(10, 60)
+        def load():
+            cache.invalidate('a') # A write lands while the old value is read
+            return 1
+        self.assertEqual(cache.get('a', load), 1)
+        self.assertEqual(cache.get('a', self.loader(2)), 2) # The old value was not kept
+        def load_all():
+            cache.invalidate()
+            return 3
+        self.assertEqual(cache.get('b', load_all), 3)
+        self.assertEqual(cache.get('b', self.loader(4)), 4)
+    
+    def test_LRUCache_WritesInvalidate(self):
+        db.accounts.insert(test_data.db_account)
+        db.payees.insert({'id': '53f69e77137a001e344259e0', 'name': 'Giant'})
+        self.assertEqual(account_metadata('acct_testaccountname')['name'], 'Test Account Name')
+        self.assertEqual([p['name'] for p in all_payees()], ['Giant'])
+        self.app.put('/api/accounts/acct_testaccountname', data=json.dumps({'name': 'Renamed'}),
+                     content_type='application/json')
+        self.app.put('/api/payees/53f69e77137a001e344259e0', data=json.dumps({'name': 'Giant Eagle'}),
+                     content_type='application/json')
+        self.assertEqual(account_metadata('acct_testaccountname')['name'], 'Renamed')
+        self.assertEqual([p['name'] for p in all_payees()], ['Giant Eagle'])
+        self.assertEqual(abacuspb.cache.caches['accounts'].stats()['ttl'], abacuspb.app.config['CACHE_TTL'])
+    
+    def test_LRUCache_StatsEndpoint(self):
+        rv = self.app.get('/api/admin/cache')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(sorted(obj['caches'].keys()), ['accounts', 'categories', 'payees'])
+        self.assertIn('hits', obj['caches']['accounts'])
@@ -1,4 +1,5 @@
 import unittest, abacuspb, json
+from abacuspb.cache import clear_caches
 from test import test_data
 from datetime import datetime
 
@@ -8,6 +9,7 @@ class CategoriesAPI_TestCase(unittest.TestCase):
     
     def setUp(self):
         self.app = abacuspb.app.test_client()
+        clear_caches()
         db.categories.drop()
     
     def tearDown(self):
@@ -87,6 +89,16 @@ class CategoriesAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['category']['parent_id'], '1234567890')
         self.assertEqual(obj['category']['uri'], '/api/categories/53f69e77137a001e344259f2')
      
+    def test_CategoryAPI_PUT_NameAlreadyExists(self):
+        db.categories.insert(test_data.db_categories)
+        rv = self.app.put('/api/categories/53f69e77137a001e344259f2',
+                          data=json.dumps({ 'name': 'Auto' }),
+                          content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(obj['message'], 'category already exists')
+        self.assertEqual(db.categories.find_one({'id': '53f69e77137a001e344259f2'})['name'], 'Dining & Entertainment')
+     
     def test_CategoryAPI_DELETE_EmptyDb(self):
         rv = self.app.delete('/api/categories/53f69e77137a001e344259f2')
         obj = json.loads(rv.get_data())
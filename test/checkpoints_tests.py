@@ -0,0 +1,83 @@
+import unittest, abacuspb, json
+from abacuspb.checkpoints import checkpoint_balance
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class RunningBalance_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.rollups.drop()
+        db.checkpoints.drop()
+        db['acct_testaccountname'].drop()
+        db.accounts.insert(test_data.db_account)
+        self.app.post('/api/transactions/acct_testaccountname/bulk',
+                      data=json.dumps([dict(test_data.transaction, date='2014-06-15', amount=100.00),
+                                       dict(test_data.transaction, date='2014-07-01', amount=-20.00),
+                                       dict(test_data.transaction, date='2014-07-20', amount=-5.50),
+                                       dict(test_data.transaction, date='2014-08-02', amount=300.00)]),
+                      content_type='application/json')
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.rollups.drop()
+        db.checkpoints.drop()
+        db['acct_testaccountname'].drop()
+    
+    def balances(self, uri):
+        obj = json.loads(self.app.get(uri).get_data())
+        return obj, [(t['date'], t['running_balance']) for t in obj['transactions']]
+    
+    def test_RunningBalance_FirstPage(self):
+        obj, balances = self.balances('/api/transactions/acct_testaccountname')
+        # Anchored to the account balance: 2635.63 before the first transaction
+        self.assertEqual(balances, [('2014-08-02', 3010.13), ('2014-07-20', 2710.13),
+                                    ('2014-07-01', 2715.63), ('2014-06-15', 2735.63)])
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 301013)
+    
+    def test_RunningBalance_AcrossPages(self):
+        obj, first = self.balances('/api/transactions/acct_testaccountname?pageSize=2')
+        obj, second = self.balances('/api/transactions/acct_testaccountname?pageSize=2&after=' + obj['next'])
+        self.assertEqual(first, [('2014-08-02', 3010.13), ('2014-07-20', 2710.13)])
+        self.assertEqual(second, [('2014-07-01', 2715.63), ('2014-06-15', 2735.63)])
+    
+    def test_RunningBalance_SameDayOrder(self):
+        self.app.post('/api/transactions/acct_testaccountname',
+                      data=json.dumps(dict(test_data.transaction, date='2014-07-20', amount=-1.00, payee='Other')),
+                      content_type='application/json')
+        rows = json.loads(self.app.get('/api/transactions/acct_testaccountname').get_data())['transactions']
+        for newer, older in zip(rows, rows[1:]):
+            self.assertAlmostEqual(newer['running_balance'] - newer['amount'], older['running_balance'])
+        obj, last = self.balances('/api/transactions/acct_testaccountname?pageSize=2&after=' +
+                                  json.loads(self.app.get('/api/transactions/acct_testaccountname?pageSize=2')
+                                             .get_data())['next'])
+        self.assertEqual(last, [(r['date'], r['running_balance']) for r in rows[2:4]])
+    
+    def test_RunningBalance_CheckpointAdjustedOnWrite(self):
+        self.balances('/api/transactions/acct_testaccountname') # Stores the July checkpoint
+        self.assertEqual(db.checkpoints.find_one({'account_id': 'acct_testaccountname', 'month': '2014-07'})['balance'], 7450)
+        rv = self.app.post('/api/transactions/acct_testaccountname',
+                           data=json.dumps(dict(test_data.transaction, date='2014-05-01', amount=10.00, payee='Other')),
+                           content_type='application/json')
+        self.assertEqual(db.checkpoints.find_one({'account_id': 'acct_testaccountname', 'month': '2014-07'})['balance'], 8450)
+        obj, balances = self.balances('/api/transactions/acct_testaccountname')
+        self.assertEqual(balances[0], ('2014-08-02', 3020.13))
+        self.assertEqual(balances[-1], ('2014-05-01', 2645.63))
+        self.app.delete(json.loads(rv.get_data())['transaction']['uri'])
+        obj, balances = self.balances('/api/transactions/acct_testaccountname')
+        self.assertEqual(balances[0], ('2014-08-02', 3010.13))
+    
+    def test_RunningBalance_PendingCheckpointRecomputed(self):
+        # Left behind by a read that lost a race with a write
+        db.checkpoints.insert({'account_id': 'acct_testaccountname', 'month': '2014-07',
+                               'balance': -999, 'writes': 1, 'pending': True})
+        self.assertEqual(checkpoint_balance('acct_testaccountname', '2014-07'), 7450)
+        checkpoint = db.checkpoints.find_one({'account_id': 'acct_testaccountname', 'month': '2014-07'})
+        self.assertEqual(checkpoint['balance'], 7450)
+        self.assertNotIn('pending', checkpoint)
+        obj, balances = self.balances('/api/transactions/acct_testaccountname')
+        self.assertEqual(balances[0], ('2014-08-02', 3010.13))
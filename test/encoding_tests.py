@@ -0,0 +1,45 @@
+import unittest, abacuspb, json
+from datetime import datetime, date
+from bson.objectid import ObjectId
+from abacuspb.encoding import encode_json, select_backend, stdlib_dumps, load_backend, plain_types
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class Encoding_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db['acct_testaccountname'].drop()
+    
+    def tearDown(self):
+        db['acct_testaccountname'].drop()
+    
+    def test_Encoding_NativeTypes(self):
+        data = {'date': datetime(2014, 8, 10), 'day': date(2014, 8, 11), 'time': datetime(2014, 8, 10, 9, 30),
+                'id': ObjectId('53f69e77137a001e344259c7'), 'amount': -52.08}
+        self.assertEqual(json.loads(encode_json(data)), {'date': '2014-08-10', 'day': '2014-08-11',
+                                                         'time': '2014-08-10T09:30:00',
+                                                         'id': '53f69e77137a001e344259c7', 'amount': -52.08})
+        self.assertEqual(json.loads(stdlib_dumps(data)), json.loads(encode_json(data)))
+    
+    def test_Encoding_PlainTypes(self):
+        data = {'rows': [{'date': datetime(2014, 8, 10), 'id': ObjectId('53f69e77137a001e344259c7')}], 'count': 1}
+        self.assertEqual(plain_types(data), {'rows': [{'date': '2014-08-10', 'id': '53f69e77137a001e344259c7'}], 'count': 1})
+        for name in ['orjson', 'rapidjson', 'ujson']:
+            dumps = load_backend(name)
+            if dumps: # Every installed backend encodes dates like the stdlib one
+                self.assertEqual(json.loads(dumps(data)), json.loads(stdlib_dumps(data)))
+    
+    def test_Encoding_SelectBackend(self):
+        self.assertEqual(select_backend('json')[0], 'json')
+        self.assertIn(select_backend()[0], ['orjson', 'rapidjson', 'ujson', 'json'])
+        self.assertRaises(ValueError, select_backend, 'nosuchjson')
+    
+    def test_Encoding_TransactionDate(self):
+        db['acct_testaccountname'].insert(test_data.db_transactions)
+        rv = self.app.get('/api/transactions/acct_testaccountname/53f69e77137a001e344259c7')
+        self.assertEqual(rv.mimetype, 'application/json')
+        self.assertEqual(json.loads(rv.get_data())['transaction']['date'], '2014-07-31')
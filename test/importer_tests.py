@@ -0,0 +1,92 @@
+import unittest, abacuspb
+from StringIO import StringIO
+from abacuspb.importer import import_statement, iter_ofx, iter_csv
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+OFX = """OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20140810120000.000[-5:EST]
+<TRNAMT>-52.08
+<FITID>201408100001
+<NAME>GIANT  
+<MEMO>Groceries
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CHECK
+<DTPOSTED>20140812
+<TRNAMT>-100.00
+<FITID>201408120002
+<CHECKNUM>1042
+<NAME>Landlord
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+CSV = """Date,Description,Debit,Credit
+08/10/2014,Giant,52.08,
+08/18/2014,U.S. Government,,"2,649.52"
+not a date,Broken,1.00,
+"""
+
+class Importer_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        clear_caches()
+        db.accounts.drop()
+        db.payees.drop()
+        db['acct_testaccountname'].drop()
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.payees.drop()
+        db['acct_testaccountname'].drop()
+    
+    def test_IterOFX_SmallChunks(self):
+        rows = list(iter_ofx(StringIO(OFX), chunk_size=7))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['date'], '2014-08-10')
+        self.assertEqual(rows[0]['amount'], '-52.08')
+        self.assertEqual(rows[0]['fitid'], '201408100001')
+        self.assertEqual(rows[1]['type'], '1042')
+    
+    def test_IterCSV_DebitCreditColumns(self):
+        rows = list(iter_csv(StringIO(CSV)))
+        self.assertEqual(rows[0]['amount'], '-52.08')
+        self.assertEqual(rows[1]['amount'], '2649.52')
+        self.assertEqual(rows[1]['date'], '2014-08-18')
+        self.assertIsNone(rows[2]['date'])
+    
+    def test_ImportOFX_MatchesPayeesInBatches(self):
+        db.accounts.insert(test_data.db_account)
+        db.payees.insert({'id': '1', 'name': 'Giant'})
+        result = import_statement('acct_testaccountname', StringIO(OFX), 'ofx', batch_size=1)
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(db['acct_testaccountname'].find_one({'amount': -5208})['payee'], 'Giant')
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 263563 - 5208 - 10000)
+        self.assertEqual(db.accounts.find_one()['bal_cleared'], -4092 - 5208 - 10000)
+    
+    def test_ImportCSV_SkipsInvalidRows(self):
+        db.accounts.insert(test_data.db_account)
+        result = import_statement('acct_testaccountname', StringIO(CSV), 'csv')
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(result['skipped'][0][0], 3)
+        self.assertEqual(db['acct_testaccountname'].count(), 2)
+    
+    def test_Import_NoAccount(self):
+        self.assertRaises(ValueError, import_statement, 'acct_testaccountname', StringIO(CSV), 'csv')
+    
+    def test_ImportOFX_ReimportSkipsDuplicates(self):
+        db.accounts.insert(test_data.db_account)
+        import_statement('acct_testaccountname', StringIO(OFX), 'ofx')
+        result = import_statement('acct_testaccountname', StringIO(OFX), 'ofx')
+        self.assertEqual(result['imported'], 0)
+        self.assertEqual(result['duplicates'], 2)
+        self.assertEqual(db['acct_testaccountname'].count(), 2)
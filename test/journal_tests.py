@@ -0,0 +1,161 @@
+import unittest, abacuspb, json
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from abacuspb.journal import Journal, apply_entry, replay_journal, _apply
+from abacuspb.reconcile import verify_balances
+from abacuspb.resources.transactions import make_transaction, make_transfer_transaction, transaction_fingerprint, account_balance_delta
+from abacuspb.rollups import rollup_changes
+from abacuspb.indexes import ensure_account_indexes
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class Journal_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.rollups.drop()
+        db.checkpoints.drop()
+        db.journal.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        ensure_account_indexes('acct_testaccountname') # Duplicate detection relies on the fingerprint index
+        db.accounts.insert([dict(test_data.db_account, bal_uncleared=0, bal_cleared=0, bal_reconciled=0),
+                            dict(test_data.db_account_2, bal_uncleared=0, bal_cleared=0, bal_reconciled=0)])
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.rollups.drop()
+        db.checkpoints.drop()
+        db.journal.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def transfer_journal(self):
+        transaction = make_transaction(test_data.transaction_transfer)
+        transaction['fingerprint'] = transaction_fingerprint('acct_testaccountname', transaction)
+        transfer = make_transfer_transaction(transaction, 'acct_testaccountname')
+        journal = Journal()
+        journal.insert('acct_testaccountname', transaction)
+        journal.balance('acct_testaccountname', account_balance_delta('CREATE_TRANS', transaction))
+        journal.insert('acct_toaccountname', transfer)
+        journal.balance('acct_toaccountname', account_balance_delta('CREATE_TRANS', transfer))
+        journal.rollups(rollup_changes('CREATE_TRANS', 'acct_testaccountname', transaction) +
+                        rollup_changes('CREATE_TRANS', 'acct_toaccountname', transfer))
+        return journal
+    
+    def batch_journal(self, items):
+        transactions = map(make_transaction, items)
+        for transaction in transactions:
+            transaction['fingerprint'] = transaction_fingerprint('acct_testaccountname', transaction)
+        mirrors = [make_transfer_transaction(t, 'acct_testaccountname') for t in transactions
+                   if t['cat_or_acct_id'] == 'acct_toaccountname']
+        journal = Journal()
+        journal.insert_many('acct_testaccountname', transactions)
+        journal.insert_many('acct_toaccountname', mirrors)
+        rollups = []
+        for account_id, docs in [('acct_testaccountname', transactions), ('acct_toaccountname', mirrors)]:
+            for doc in docs:
+                journal.balance(account_id, account_balance_delta('CREATE_TRANS', doc))
+                rollups += rollup_changes('CREATE_TRANS', account_id, doc)
+        journal.rollups(rollups)
+        return journal
+    
+    def crash_after(self, journal, applied):
+        entry_id = db.journal.insert_one({'ops': journal.ops, 'created': datetime.utcnow()}).inserted_id
+        for op in journal.ops[:applied]:
+            _apply(entry_id, op)
+        return entry_id
+    
+    def rollup_sums(self):
+        return sorted((r['account_id'], r['sum'], r['count']) for r in db.rollups.find())
+    
+    def test_Journal_CommitAppliesAndClears(self):
+        accounts = self.transfer_journal().commit()
+        self.assertEqual([a['bal_uncleared'] for a in accounts], [-100.0, 100.0])
+        self.assertEqual(db.journal.count(), 0)
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
+        self.assertEqual(verify_balances(), [])
+    
+    def test_Journal_ReplayFinishesPartialWrite(self):
+        self.crash_after(self.transfer_journal(), 2) # Origin written, mirror missing
+        self.assertEqual(db['acct_toaccountname'].count(), 0)
+        self.assertEqual(replay_journal(grace=0), 1)
+        self.assertEqual(db.journal.count(), 0)
+        self.assertEqual(db['acct_testaccountname'].count(), 1)
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
+        self.assertEqual(verify_balances(), [])
+        self.assertEqual(self.rollup_sums(), [('acct_testaccountname', -10000, 1), ('acct_toaccountname', 10000, 1)])
+    
+    def test_Journal_ReplayIsIdempotent(self):
+        journal = self.transfer_journal()
+        entry_id = self.crash_after(journal, len(journal.ops)) # Everything applied, entry not deleted
+        apply_entry(entry_id, journal.ops)
+        self.assertEqual(verify_balances(), [])
+        self.assertEqual(self.rollup_sums(), [('acct_testaccountname', -10000, 1), ('acct_toaccountname', 10000, 1)])
+        self.assertEqual(db['acct_testaccountname'].count(), 1)
+    
+    def test_Journal_DuplicateAbandoned(self):
+        self.transfer_journal().commit()
+        self.assertRaises(DuplicateKeyError, self.transfer_journal().commit) # Same fingerprint, new id
+        self.assertEqual(db.journal.count(), 0)
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
+        self.assertEqual(verify_balances(), [])
+    
+    def test_Journal_DeleteTransferUsesJournal(self):
+        rv = self.app.post('/api/transactions/acct_testaccountname',
+                           data=json.dumps(test_data.transaction_transfer),
+                           content_type='application/json')
+        rv = self.app.delete(json.loads(rv.get_data())['transaction']['uri'])
+        obj = json.loads(rv.get_data())
+        self.assertEqual([a['bal_uncleared'] for a in obj['accounts']], [0.0, 0.0])
+        self.assertEqual(db.journal.count(), 0)
+        self.assertEqual(db['acct_toaccountname'].count(), 0)
+    
+    def test_Journal_InsertManyReplay(self):
+        journal = self.batch_journal([test_data.transaction, test_data.transaction_transfer])
+        entry_id = self.crash_after(journal, 1) # Batch inserted, mirrors and balances missing
+        self.assertEqual(replay_journal(grace=0), 1)
+        apply_entry(entry_id, journal.ops) # Replaying again changes nothing
+        self.assertEqual(db['acct_testaccountname'].count(), 2)
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
+        self.assertEqual(verify_balances(), [])
+        self.assertEqual(db.accounts.find_one({'id': 'acct_testaccountname'})['bal_uncleared'], -15208)
+    
+    def test_Journal_InsertManyDuplicateTakesBackBatch(self):
+        self.batch_journal([test_data.transaction]).commit()
+        journal = self.batch_journal([test_data.transaction_transfer, test_data.transaction])
+        self.assertRaises(DuplicateKeyError, journal.commit)
+        self.assertEqual(db.journal.count(), 0)
+        self.assertEqual(db['acct_testaccountname'].count(), 1)
+        self.assertEqual(db['acct_toaccountname'].count(), 0)
+        self.assertEqual(verify_balances(), [])
+    
+    def test_Journal_ReplayWaitsForGracePeriod(self):
+        self.crash_after(self.transfer_journal(), 2) # Possibly still being applied by its request
+        self.assertEqual(replay_journal(), 0)
+        self.assertEqual(db['acct_toaccountname'].count(), 0)
+        db.journal.update_many({}, {'$set': {'created': datetime.utcnow() - timedelta(seconds=abacuspb.app.config['JOURNAL_REPLAY_GRACE'] + 1)}})
+        self.assertEqual(replay_journal(), 1)
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
+    
+    def test_Journal_ReplaySkipsClaimedEntries(self):
+        entry_id = self.crash_after(self.transfer_journal(), 2)
+        db.journal.update_one({'_id': entry_id}, {'$set': {'created': datetime.utcnow() - timedelta(hours=1),
+                                                           'replaying': {'owner': 'other:1', 'at': datetime.utcnow()}}})
+        self.assertEqual(replay_journal(grace=60), 0)
+        db.journal.update_one({'_id': entry_id}, {'$set': {'replaying.at': datetime.utcnow() - timedelta(minutes=2)}})
+        self.assertEqual(replay_journal(grace=60), 1) # Claim lapsed: its replayer died
+        self.assertEqual(db.journal.count(), 0)
+    
+    def test_Journal_ReplayResumesAfterAppliedOps(self):
+        journal = self.transfer_journal()
+        entry_id = self.crash_after(journal, 2)
+        db.journal.update_one({'_id': entry_id}, {'$set': {'applied': 2}})
+        db['acct_testaccountname'].remove({}) # Deleted by a later write
+        self.assertEqual(replay_journal(grace=0), 1)
+        self.assertEqual(db['acct_testaccountname'].count(), 0) # Not resurrected
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
@@ -0,0 +1,35 @@
+import unittest, abacuspb
+from flask.ext.restful import marshal
+from abacuspb.marshalling import Marshaller
+from abacuspb.resources.accounts import account_fields
+from abacuspb.resources.categories import category_fields
+from abacuspb.resources.transactions import transaction_list_fields
+from test import test_data
+
+class Marshaller_TestCase(unittest.TestCase):
+    
+    def assertSameAsMarshal(self, field_spec, docs):
+        with abacuspb.app.test_request_context('/'):
+            expected = [dict(marshal(doc, field_spec)) for doc in docs]
+            self.assertEqual(Marshaller(field_spec).many(docs), expected)
+    
+    def test_Marshaller_Accounts(self):
+        self.assertSameAsMarshal(account_fields, [test_data.db_account, test_data.db_account_2,
+                                                  {'id': 'acct_empty', 'name': None}])
+    
+    def test_Marshaller_Categories(self):
+        self.assertSameAsMarshal(category_fields, [{'id': '53f69e77137a001e344259d0', 'name': 'Food',
+                                                    'parent_id': None, 'budget_tracked': True},
+                                                   {'id': '53f69e77137a001e344259d1', 'name': 'Groceries',
+                                                    'parent_id': '53f69e77137a001e344259d0'}])
+    
+    def test_Marshaller_Transactions(self):
+        docs = [dict(t, date='2014-08-10', uri='/api/transactions/acct_testaccountname/' + t['id'], running_balance=1234)
+                for t in test_data.db_transactions]
+        docs.append(dict(docs[0], cat_or_acct_id='', splits=[{'cat_or_acct_id': '1', 'amount': 100000, 'memo': 'Salary'},
+                                                             {'cat_or_acct_id': 'acct_savings', 'amount': 14506, 'memo': ''}]))
+        self.assertSameAsMarshal(transaction_list_fields, docs)
+    
+    def test_Marshaller_Single(self):
+        with abacuspb.app.test_request_context('/'):
+            self.assertEqual(Marshaller(account_fields)(test_data.db_account)['uri'], '/api/accounts/acct_testaccountname')
@@ -0,0 +1,65 @@
+import unittest, abacuspb, json
+from abacuspb import networth
+from datetime import datetime
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class NetWorthAPI_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.accounts.insert([dict(test_data.db_account, bal_uncleared=100000),
+                            dict(test_data.db_account_2, bal_uncleared=50000)])
+        db['acct_testaccountname'].insert([
+            {'id': '1', 'date': datetime(2014,7,15), 'payee': 'Giant', 'reconciled': '', 'amount': -2000, 'memo': '', 'cat_or_acct_id': '1'},
+            {'id': '2', 'date': datetime(2014,8,5), 'payee': 'Exxon', 'reconciled': '', 'amount': -4000, 'memo': '', 'cat_or_acct_id': '2'},
+            {'id': '3', 'date': datetime(2014,8,5), 'payee': 'Giant', 'reconciled': '', 'amount': -1000, 'memo': '', 'cat_or_acct_id': '1'},
+            {'id': '4', 'date': datetime(2014,9,2), 'payee': 'To Savings', 'reconciled': '', 'amount': -10000, 'memo': '', 'cat_or_acct_id': 'acct_toaccountname'}
+        ])
+        db['acct_toaccountname'].insert([
+            {'id': '4', 'date': datetime(2014,9,2), 'payee': 'To Savings', 'reconciled': '', 'amount': 10000, 'memo': '', 'cat_or_acct_id': 'acct_testaccountname'}
+        ])
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def test_NetWorthAPI_GET_Monthly(self):
+        rv = self.app.get('/api/networth?from=2014-07-01&to=2014-09-15')
+        self.assertEqual(rv.status_code, 200)
+        obj = json.loads(rv.get_data())['networth']
+        self.assertEqual(obj['dates'], ['2014-07-31', '2014-08-31', '2014-09-15'])
+        accounts = dict((a['id'], a['balances']) for a in obj['accounts'])
+        self.assertEqual(accounts['acct_testaccountname'], [1150.0, 1100.0, 1000.0])
+        self.assertEqual(accounts['acct_toaccountname'], [400.0, 400.0, 500.0])
+        self.assertEqual(obj['total'], [1550.0, 1500.0, 1500.0])
+    
+    def test_NetWorthAPI_GET_AnchoredToCurrentBalance(self):
+        # Transactions after 'to' are backed out of the stored balance
+        rv = self.app.get('/api/networth?from=2014-08-04&to=2014-08-12&interval=week')
+        obj = json.loads(rv.get_data())['networth']
+        self.assertEqual(obj['dates'], ['2014-08-10', '2014-08-12'])
+        self.assertEqual(obj['total'], [1500.0, 1500.0])
+        rv = self.app.get('/api/networth?from=2014-08-04&to=2014-08-06&interval=day')
+        obj = json.loads(rv.get_data())['networth']
+        self.assertEqual(obj['dates'], ['2014-08-04', '2014-08-05', '2014-08-06'])
+        self.assertEqual(obj['total'], [1550.0, 1500.0, 1500.0])
+    
+    def test_NetWorthAPI_GET_BadRequests(self):
+        self.assertEqual(self.app.get('/api/networth?from=2014-09-01&to=2014-08-01').status_code, 400)
+        self.assertEqual(self.app.get('/api/networth?from=08/01/2014').status_code, 400)
+        self.assertEqual(self.app.get('/api/networth?interval=year').status_code, 400)
+    
+    @unittest.skipIf(networth.numpy == None, 'NumPy is not installed')
+    def test_NumpyMatchesPurePython(self):
+        ends = [735446, 735450, 735460]
+        deltas = [[(735440, -500), (735446, 200), (735455, -75), (735470, 1000)], []]
+        self.assertEqual(networth.numpy_balances(ends, [10000, 250], deltas),
+                         networth.python_balances(ends, [10000, 250], deltas))
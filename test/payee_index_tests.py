@@ -0,0 +1,84 @@
+import unittest, abacuspb, json, time
+from abacuspb.payee_index import PayeeIndex, payee_index
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class PayeeIndex_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        payee_index.reset() # Fixtures write the payees directly
+        self.ttl = abacuspb.app.config['PAYEE_INDEX_TTL']
+        db.accounts.drop()
+        db.payees.drop()
+        db['acct_testaccountname'].drop()
+        db.accounts.insert(test_data.db_account)
+        db.payees.insert([{'id': '1', 'name': 'Giant'}, {'id': '2', 'name': 'Food Lion'},
+                          {'id': '3', 'name': 'Giant Eagle'}, {'id': '4', 'name': 'Safeway'}])
+        db['acct_testaccountname'].insert([dict(t, payee=payee) for t, payee in
+                                           zip(test_data.db_transactions, ['Giant Eagle', 'Giant Eagle', 'giant eagle', 'Food Lion'])])
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.payees.drop()
+        db['acct_testaccountname'].drop()
+        abacuspb.app.config['PAYEE_INDEX_TTL'] = self.ttl
+    
+    def names(self, uri):
+        rv = self.app.get(uri)
+        self.assertEqual(rv.status_code, 200)
+        return [p['name'] for p in json.loads(rv.get_data())['payees']]
+    
+    def test_PayeeSearch_RankedByUse(self):
+        self.assertEqual(self.names('/api/payees/search?q=gi'), ['Giant Eagle', 'Giant'])
+        rv = self.app.get('/api/payees/search?q=GIANT')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(obj['payees'][0], {'name': 'Giant Eagle', 'count': 3, 'uri': '/api/payees/3'})
+    
+    def test_PayeeSearch_MatchesWords(self):
+        self.assertEqual(self.names('/api/payees/search?q=lion'), ['Food Lion'])
+        self.assertEqual(self.names('/api/payees/search?q=eagle'), ['Giant Eagle'])
+        self.assertEqual(self.names('/api/payees/search?q=zzz'), [])
+    
+    def test_PayeeSearch_Limit(self):
+        self.assertEqual(len(self.names('/api/payees/search?q=&limit=2')), 2)
+    
+    def test_PayeeSearch_KeptUpToDateOnWrite(self):
+        index = PayeeIndex()
+        index.build()
+        index.add('5', 'Gianni Pizza')
+        self.assertEqual([m[1] for m in index.search('gian', 10)], ['Giant Eagle', 'Gianni Pizza', 'Giant'])
+        index.remove('3')
+        index.remove('5')
+        index.add('1', 'Giant Food')
+        index.remove('1')
+        self.assertEqual(index.search('gian', 10), [])
+        self.app.post('/api/payees', data=json.dumps({'name': 'Harris Teeter'}), content_type='application/json')
+        self.assertEqual(self.names('/api/payees/search?q=teet'), ['Harris Teeter'])
+    
+    def test_PayeeSearch_WritesDuringRebuildKept(self):
+        class RacingIndex(PayeeIndex):
+            def load(self):
+                data = PayeeIndex.load(self)
+                self.add('5', 'Gianni Pizza') # Written after the rebuild read the payees
+                self.remove('2')
+                return data
+        index = RacingIndex()
+        index.build()
+        self.assertEqual([m[1] for m in index.search('gian', 10)], ['Giant Eagle', 'Gianni Pizza', 'Giant'])
+        self.assertEqual(index.search('lion', 10), [])
+    
+    def test_PayeeSearch_RebuildsInBackground(self):
+        index = PayeeIndex()
+        index.search('', 10)
+        db.payees.insert({'id': '5', 'name': 'Harris Teeter'}) # Written by another process
+        abacuspb.app.config['PAYEE_INDEX_TTL'] = 0
+        self.assertEqual(index.search('teet', 10), []) # Served from the current snapshot
+        for attempt in range(100):
+            if not index.refreshing:
+                break
+            time.sleep(0.01)
+        self.assertEqual([m[1] for m in index.search('teet', 10)], ['Harris Teeter'])
@@ -1,4 +1,7 @@
 import unittest, abacuspb, json
+from abacuspb.cache import clear_caches
+from abacuspb.indexes import ensure_indexes
+from abacuspb.migrations import dedupe_names
 from test import test_data
 from datetime import datetime
 
@@ -8,6 +11,7 @@ class PayeesAPI_TestCase(unittest.TestCase):
     
     def setUp(self):
         self.app = abacuspb.app.test_client()
+        clear_caches()
         db.payees.drop()
     
     def tearDown(self):
@@ -76,6 +80,26 @@ class PayeesAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['payee']['name'], 'Newegg.com')
         self.assertEqual(obj['payee']['uri'], '/api/payees/53f69e77137a001e344259f2')
     
+    def test_PayeeAPI_Put_NameAlreadyExists(self):
+        db.payees.insert(test_data.db_payees)
+        rv = self.app.put('/api/payees/53f69e77137a001e344259f2',
+                          data=json.dumps({ 'name': 'Costco' }),
+                          content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(obj['message'], 'Payee already exists')
+        self.assertEqual(db.payees.find_one({'id': '53f69e77137a001e344259f2'})['name'], 'Amazon.com')
+    
+    def test_EnsureIndexes_DuplicateNames(self):
+        db.payees.insert(test_data.db_payees)
+        db.payees.insert({ 'id': '53f69e77137a001e344259ff', 'name': 'Costco' })
+        ensure_indexes() # Logs instead of raising
+        self.assertEqual(dedupe_names(), [('payees', '53f69e77137a001e344259ff', 'Costco', None)])
+        ensure_indexes()
+        self.assertEqual(db.payees.find({'name': 'Costco'}).count(), 1)
+        self.assertTrue(any(index['key'] == [('name', 1)] and index.get('unique')
+                            for index in db.payees.index_information().values()))
+    
     def test_PayeeAPI_Delete_Empty(self):
         rv = self.app.delete('/api/payees/53f69e77137a001e344259f2')
         obj = json.loads(rv.get_data())
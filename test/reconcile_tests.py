@@ -0,0 +1,104 @@
+import unittest, abacuspb, json
+from abacuspb.reconcile import verify_balances, computed_balances, record_opening_balances
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class Reconcile_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.rollups.drop()
+        db.checkpoints.drop()
+        db.journal.drop()
+        opening = {'bal_uncleared': 0, 'bal_cleared': 0, 'bal_reconciled': 0}
+        db.accounts.insert([dict(test_data.db_account, bal_uncleared=0, bal_cleared=0, bal_reconciled=0, opening=opening),
+                            dict(test_data.db_account_2, bal_uncleared=0, bal_cleared=0, bal_reconciled=0, opening=opening)])
+        self.app.post('/api/transactions/acct_testaccountname/bulk',
+                      data=json.dumps([dict(test_data.transaction, reconciled='R'),
+                                       dict(test_data.transaction, date='2014-08-11', reconciled='C'),
+                                       test_data.transaction_transfer]),
+                      content_type='application/json')
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.rollups.drop()
+        db.checkpoints.drop()
+        db.journal.drop()
+    
+    def test_Reconcile_ComputedBalances(self):
+        self.assertEqual(computed_balances('acct_testaccountname'),
+                         {'bal_uncleared': -20416, 'bal_cleared': -10416, 'bal_reconciled': -5208})
+        self.assertEqual(computed_balances('acct_toaccountname'),
+                         {'bal_uncleared': 10000, 'bal_cleared': 0, 'bal_reconciled': 0})
+    
+    def test_Reconcile_NoDrift(self):
+        self.assertEqual(verify_balances(), [])
+    
+    def test_Reconcile_ReportAndRepair(self):
+        db.accounts.update_one({'id': 'acct_toaccountname'}, {'$inc': {'bal_cleared': 500}})
+        rv = self.app.get('/api/admin/balances')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(obj['accounts'], [{ 'uri': '/api/accounts/acct_toaccountname',
+                                             'stored': {'bal_uncleared': 100.0, 'bal_cleared': 5.0, 'bal_reconciled': 0.0},
+                                             'computed': {'bal_uncleared': 100.0, 'bal_cleared': 0.0, 'bal_reconciled': 0.0},
+                                             'repaired': False }])
+        self.assertEqual(len(verify_balances()), 1) # GET does not repair
+        rv = self.app.post('/api/admin/balances', data=json.dumps({'repair': True}), content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(len(obj['accounts']), 1)
+        self.assertTrue(obj['accounts'][0]['repaired'])
+        self.assertEqual(verify_balances(), [])
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['bal_cleared'], 0)
+    
+    def test_Reconcile_RepairWaitsForJournaledWrites(self):
+        db.accounts.update_one({'id': 'acct_toaccountname'}, {'$inc': {'bal_cleared': 500}})
+        db.journal.insert({'ops': [{'op': 'balance', 'account_id': 'acct_toaccountname',
+                                    'delta': {'bal_uncleared': 0, 'bal_cleared': 0, 'bal_reconciled': 0}}]})
+        mismatches = verify_balances(repair=True)
+        self.assertEqual(len(mismatches), 1)
+        self.assertFalse(mismatches[0]['repaired'])
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['bal_cleared'], 500)
+        db.journal.drop()
+        self.assertTrue(verify_balances(repair=True)[0]['repaired'])
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['bal_cleared'], 0)
+    
+    def test_Reconcile_MissingTransferAccountWritesNothing(self):
+        rv = self.app.post('/api/transactions/acct_testaccountname',
+                           data=json.dumps(dict(test_data.transaction_transfer, cat_or_acct_id='acct_missing')),
+                           content_type='application/json')
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(db['acct_testaccountname'].count(), 3)
+        self.assertEqual(verify_balances(workers=1), [])
+    
+    def test_Reconcile_RepairKeepsOpeningBalance(self):
+        rv = self.app.put('/api/accounts/acct_toaccountname',
+                          data=json.dumps({'bal_uncleared': 150.0, 'bal_cleared': 50.0}),
+                          content_type='application/json')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['opening'],
+                         {'bal_uncleared': 5000, 'bal_cleared': 5000, 'bal_reconciled': 0})
+        self.assertEqual(verify_balances(), [])
+        db.accounts.update_one({'id': 'acct_toaccountname'}, {'$inc': {'bal_cleared': 500}})
+        self.assertTrue(verify_balances(repair=True)[0]['repaired'])
+        account = db.accounts.find_one({'id': 'acct_toaccountname'})
+        self.assertEqual((account['bal_uncleared'], account['bal_cleared']), (15000, 5000))
+    
+    def test_Reconcile_NoOpeningBalanceNotRepaired(self):
+        db.accounts.update_one({'id': 'acct_toaccountname'}, {'$unset': {'opening': True}, '$inc': {'bal_uncleared': 2500}})
+        mismatches = verify_balances(repair=True)
+        self.assertEqual(len(mismatches), 1)
+        self.assertFalse(mismatches[0]['repaired'])
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['bal_uncleared'], 12500)
+        self.assertEqual(record_opening_balances(), (1, []))
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['opening'],
+                         {'bal_uncleared': 2500, 'bal_cleared': 0, 'bal_reconciled': 0})
+        self.assertEqual(verify_balances(), [])
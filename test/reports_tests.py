@@ -0,0 +1,66 @@
+import unittest, abacuspb, json
+from abacuspb.cache import clear_caches
+from test import test_data
+from datetime import datetime
+
+db = abacuspb.db
+
+class ReportsAPI_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.categories.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+        db.categories.insert(test_data.db_categories)
+        db['acct_testaccountname'].insert([
+            {'id': '1', 'date': datetime(2014,8,1), 'payee': 'Exxon', 'reconciled': '', 'amount': -4092, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259fa'}, # Auto:Gas
+            {'id': '2', 'date': datetime(2014,8,5), 'payee': 'Jiffy Lube', 'reconciled': '', 'amount': -3999, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259fb'}, # Auto:Service
+            {'id': '3', 'date': datetime(2014,9,2), 'payee': 'Exxon', 'reconciled': '', 'amount': -3500, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259fa'}, # Auto:Gas
+            {'id': '4', 'date': datetime(2014,8,9), 'payee': 'To Savings', 'reconciled': '', 'amount': -10000, 'memo': '',
+             'cat_or_acct_id': 'acct_toaccountname'} # Transfer, not spending
+        ])
+        db['acct_toaccountname'].insert([
+            {'id': '5', 'date': datetime(2014,8,20), 'payee': 'Olive Garden', 'reconciled': '', 'amount': -6512, 'memo': '',
+             'cat_or_acct_id': '53f69e77137a001e344259f2'}, # Dining & Entertainment
+            {'id': '4', 'date': datetime(2014,8,9), 'payee': 'To Savings', 'reconciled': '', 'amount': 10000, 'memo': '',
+             'cat_or_acct_id': 'acct_testaccountname'}
+        ])
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.categories.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def test_SpendingReportAPI_GET_ByCategoryRollsUpParents(self):
+        rv = self.app.get('/api/reports/spending?from=2014-08-01&to=2014-08-31')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        groups = obj['report']['groups']
+        self.assertEqual([g['name'] for g in groups], ['Auto', 'Dining & Entertainment'])
+        self.assertEqual(groups[0]['total'], -80.91)
+        self.assertEqual(groups[0]['count'], 2)
+        self.assertEqual([s['name'] for s in groups[0]['subcategories']], ['Gas', 'Service'])
+    
+    def test_SpendingReportAPI_GET_ByPayee(self):
+        rv = self.app.get('/api/reports/spending?groupBy=payee')
+        obj = json.loads(rv.get_data())
+        totals = dict((g['key'], g['total']) for g in obj['report']['groups'])
+        self.assertEqual(totals, {'Exxon': -75.92, 'Jiffy Lube': -39.99, 'Olive Garden': -65.12})
+    
+    def test_SpendingReportAPI_GET_ByMonth(self):
+        rv = self.app.get('/api/reports/spending?groupBy=month')
+        obj = json.loads(rv.get_data())
+        self.assertEqual([(g['key'], g['total']) for g in obj['report']['groups']],
+                         [('2014-08', -146.03), ('2014-09', -35.00)])
+    
+    def test_SpendingReportAPI_GET_InvalidGroupBy(self):
+        rv = self.app.get('/api/reports/spending?groupBy=weekday')
+        self.assertEqual(rv.status_code, 400)
@@ -0,0 +1,54 @@
+import unittest, abacuspb, json
+from abacuspb.rollups import rebuild_rollups
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class Rollups_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def rollups(self, account_id):
+        return dict(((r['category'], r['month']), (r['sum'], r['count'], r['cleared_sum'], r['reconciled_sum']))
+                    for r in db.rollups.find({'account_id': account_id}) if r['count'])
+    
+    def test_Rollups_MaintainedOnWrite(self):
+        rv = self.app.post('/api/transactions/acct_testaccountname',
+                           data=json.dumps(dict(test_data.transaction, cat_or_acct_id='groceries', reconciled='C')),
+                           content_type='application/json')
+        uri = json.loads(rv.get_data())['transaction']['uri']
+        self.assertEqual(self.rollups('acct_testaccountname'), {('groceries', '2014-08'): (-5208, 1, -5208, 0)})
+        self.app.put(uri, data=json.dumps({'date': '2014-09-01', 'amount': -60.00}), content_type='application/json')
+        self.assertEqual(self.rollups('acct_testaccountname'), {('groceries', '2014-09'): (-6000, 1, -6000, 0)})
+        self.app.delete(uri)
+        self.assertEqual(self.rollups('acct_testaccountname'), {})
+    
+    def test_Rollups_TransferBothAccounts(self):
+        self.app.post('/api/transactions/acct_testaccountname',
+                      data=json.dumps(test_data.transaction_transfer),
+                      content_type='application/json')
+        self.assertEqual(self.rollups('acct_testaccountname'), {('acct_toaccountname', '2014-08'): (-10000, 1, 0, 0)})
+        self.assertEqual(self.rollups('acct_toaccountname'), {('acct_testaccountname', '2014-08'): (10000, 1, 0, 0)})
+    
+    def test_Rollups_RebuildMatchesIncremental(self):
+        self.app.post('/api/transactions/acct_testaccountname/bulk',
+                      data=json.dumps([test_data.transaction, test_data.transaction_transfer,
+                                       dict(test_data.transaction, date='2014-07-04', reconciled='R')]),
+                      content_type='application/json')
+        incremental = (self.rollups('acct_testaccountname'), self.rollups('acct_toaccountname'))
+        self.assertEqual(rebuild_rollups(), 4)
+        self.assertEqual((self.rollups('acct_testaccountname'), self.rollups('acct_toaccountname')), incremental)
@@ -0,0 +1,113 @@
+import unittest, abacuspb, json
+from abacuspb.scheduler import materialize_due, occurrence
+from abacuspb.indexes import ensure_account_indexes
+from datetime import datetime, date
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+rent = {
+    'account_id': 'acct_testaccountname',
+    'type': 'EFT',
+    'payee': 'Landlord',
+    'amount': -1200.00,
+    'memo': 'Rent',
+    'cat_or_acct_id': '53f69e77137a001e344259f2',
+    'freq': 'monthly',
+    'start': '2014-01-31'
+}
+
+class SchedulesAPI_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.schedules.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+        ensure_account_indexes('acct_testaccountname')
+        ensure_account_indexes('acct_toaccountname')
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.schedules.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def post(self, schedule):
+        rv = self.app.post('/api/schedules', data=json.dumps(schedule), content_type='application/json')
+        return rv, json.loads(rv.get_data())
+    
+    def test_Occurrence_ClampsToMonthEnd(self):
+        schedule = {'freq': 'monthly', 'interval': 1, 'start': datetime(2014,1,31)}
+        self.assertEqual([occurrence(schedule, n) for n in range(4)],
+                         [datetime(2014,1,31), datetime(2014,2,28), datetime(2014,3,31), datetime(2014,4,30)])
+        schedule = {'freq': 'weekly', 'interval': 2, 'start': datetime(2014,12,25)}
+        self.assertEqual(occurrence(schedule, 1), datetime(2015,1,8))
+    
+    def test_ScheduleListAPI_POST(self):
+        rv, obj = self.post(rent)
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(obj['schedule']['amount'], -1200.0)
+        self.assertEqual(obj['schedule']['interval'], 1)
+        self.assertEqual(obj['schedule']['next_date'], '2014-01-31')
+        rv = self.app.get(obj['schedule']['uri'])
+        self.assertEqual(rv.status_code, 200)
+    
+    def test_Materialize_CatchesUpMissedOccurrences(self):
+        self.post(rent)
+        result = materialize_due(today=date(2014,4,15))
+        self.assertEqual(result, {'created': 3, 'duplicates': 0, 'skipped': []})
+        dates = sorted(t['date'] for t in db['acct_testaccountname'].find())
+        self.assertEqual(dates, [datetime(2014,1,31), datetime(2014,2,28), datetime(2014,3,31)])
+        account = db.accounts.find_one({'id': 'acct_testaccountname'})
+        self.assertEqual(account['bal_uncleared'], 263563 - 3 * 120000)
+        self.assertEqual(db.rollups.find_one({'account_id': 'acct_testaccountname', 'month': '2014-02'})['sum'], -120000)
+        schedule = db.schedules.find_one()
+        self.assertEqual(schedule['next_date'], datetime(2014,4,30))
+        # Nothing new is due until the next occurrence
+        self.assertEqual(materialize_due(today=date(2014,4,29))['created'], 0)
+    
+    def test_Materialize_IsIdempotent(self):
+        self.post(rent)
+        materialize_due(today=date(2014,4,15))
+        db.schedules.update({}, {'$set': {'next_index': 0, 'next_date': datetime(2014,1,31)}}) # As if the advance was lost
+        result = materialize_due(today=date(2014,4,15))
+        self.assertEqual(result['created'], 0)
+        self.assertEqual(result['duplicates'], 3)
+        self.assertEqual(db['acct_testaccountname'].count(), 3)
+    
+    def test_Materialize_TransferWithCount(self):
+        self.post(dict(rent, payee='To Savings', amount=-100, cat_or_acct_id='acct_toaccountname',
+                       freq='weekly', start='2014-08-01', count=2))
+        result = materialize_due(today=date(2014,9,1))
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(db['acct_toaccountname'].count(), 2) # Mirrored transfers
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['bal_uncleared'], 10000 + 2 * 10000)
+        self.assertEqual(db.schedules.find_one()['next_date'], None) # Schedule has ended
+    
+    def test_ScheduleAPI_PUT_RuleChangeResumesAfterLastOccurrence(self):
+        rv, obj = self.post(rent)
+        materialize_due(today=date(2014,2,15))
+        rv = self.app.put(obj['schedule']['uri'], data=json.dumps({'start': '2014-02-01', 'amount': -1250}),
+                          content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(obj['schedule']['next_date'], '2014-02-01')
+        self.assertEqual(obj['schedule']['amount'], -1250.0)
+        materialize_due(today=date(2014,3,15))
+        dates = sorted(t['date'] for t in db['acct_testaccountname'].find())
+        self.assertEqual(dates, [datetime(2014,1,31), datetime(2014,2,1), datetime(2014,3,1)])
+    
+    def test_ScheduleAPI_BadRequests(self):
+        self.assertEqual(self.post(dict(rent, account_id='acct_nope'))[0].status_code, 400)
+        self.assertEqual(self.post(dict(rent, cat_or_acct_id='acct_nope'))[0].status_code, 400)
+        self.assertEqual(self.post(dict(rent, freq='hourly'))[0].status_code, 400)
+        self.assertEqual(self.post(dict(rent, interval=0))[0].status_code, 400)
+        self.assertEqual(self.post(dict(rent, until='2013-12-31'))[0].status_code, 400)
+        self.assertEqual(self.app.get('/api/schedules/nosuchschedule').status_code, 404)
+        self.assertEqual(self.app.delete('/api/schedules/nosuchschedule').status_code, 404)
@@ -0,0 +1,68 @@
+import unittest, abacuspb, json
+from abacuspb.indexes import ensure_account_indexes
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class TransactionSearch_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+        ensure_account_indexes('acct_testaccountname')
+        ensure_account_indexes('acct_toaccountname')
+        # Both halves of a transfer share the transaction id and date
+        transfer = dict(test_data.db_transfer_transactions_toAcct[0], id='53f69e77137a001e344259d0')
+        db['acct_testaccountname'].insert(test_data.db_transactions + [dict(transfer, amount=-10000, cat_or_acct_id='acct_toaccountname')])
+        db['acct_toaccountname'].insert(transfer)
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def search(self, query):
+        rv = self.app.get('/api/search/transactions?' + query)
+        self.assertEqual(rv.status_code, 200)
+        return json.loads(rv.get_data())
+    
+    def test_Search_PayeeAndMemo(self):
+        obj = self.search('q=costco')
+        self.assertEqual([t['payee'] for t in obj['transactions']], ['Costco'])
+        self.assertEqual(obj['transactions'][0]['account_id'], 'acct_testaccountname')
+        self.assertEqual(obj['transactions'][0]['uri'], '/api/transactions/acct_testaccountname/53f69e77137a001e344259c8')
+        self.assertEqual(obj['next'], None)
+        obj = self.search('q=salary') # Memo, newest first
+        self.assertEqual([t['payee'] for t in obj['transactions']], ['U.S. Government', 'Sandy Spring Bank'])
+        self.assertEqual(self.search('q=walmart')['transactions'], [])
+    
+    def test_Search_Filters(self):
+        self.assertEqual(len(self.search('q=savings')['transactions']), 2) # Both halves of the transfer
+        obj = self.search('q=savings&account=acct_toaccountname')
+        self.assertEqual([t['account_id'] for t in obj['transactions']], ['acct_toaccountname'])
+        obj = self.search('q=salary&fromDate=2014-08-01&toDate=2014-08-31')
+        self.assertEqual([t['payee'] for t in obj['transactions']], ['U.S. Government'])
+        obj = self.search('q=salary&minAmount=1000&maxAmount=2000')
+        self.assertEqual([t['amount'] for t in obj['transactions']], [1145.06])
+    
+    def test_Search_Pagination(self):
+        seen = []
+        cursor = ''
+        while True:
+            obj = self.search('q=savings salary&pageSize=1' + cursor)
+            seen += [(t['id'], t['account_id']) for t in obj['transactions']]
+            if not obj['next']:
+                break
+            cursor = '&after=' + obj['next']
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+    
+    def test_Search_BadRequests(self):
+        self.assertEqual(self.app.get('/api/search/transactions?q=').status_code, 400)
+        self.assertEqual(self.app.get('/api/search/transactions?q=salary&after=bogus').status_code, 400)
+        self.assertEqual(self.app.get('/api/search/transactions?q=salary&account=acct_nope').status_code, 400)
@@ -0,0 +1,175 @@
+import unittest, abacuspb, json
+from abacuspb.rollups import rebuild_rollups
+from abacuspb.indexes import ensure_account_indexes
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+split_transaction = {
+    'date': '2014-08-10',
+    'type': 'DEBIT',
+    'payee': 'Target',
+    'reconciled': '',
+    'memo': 'Weekend errands',
+    'splits': [
+        {'cat_or_acct_id': '53f69e77137a001e344259f2', 'amount': -60.00, 'memo': 'Dinner'}, # Dining & Entertainment
+        {'cat_or_acct_id': '53f69e77137a001e344259fa', 'amount': -15.00}, # Auto:Gas
+        {'cat_or_acct_id': 'acct_toaccountname', 'amount': -25.00, 'memo': 'Cash back'}
+    ]
+}
+
+class SplitTransactions_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.categories.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+        db.categories.insert(test_data.db_categories)
+        ensure_account_indexes('acct_testaccountname')
+        ensure_account_indexes('acct_toaccountname')
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.categories.drop()
+        db.rollups.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def post(self, transaction):
+        rv = self.app.post('/api/transactions/acct_testaccountname', data=json.dumps(transaction),
+                           content_type='application/json')
+        return rv, json.loads(rv.get_data())
+    
+    def rollups(self):
+        return sorted((r['account_id'], r['category'], r['month'], r['sum']) for r in db.rollups.find() if r['count'])
+    
+    def balance(self, account_id):
+        return db.accounts.find_one({'id': account_id})['bal_uncleared']
+    
+    def test_POST_SplitTransaction(self):
+        rv, obj = self.post(split_transaction)
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(obj['transaction']['amount'], -100.0)
+        self.assertEqual(obj['transaction']['cat_or_acct_id'], '')
+        self.assertEqual(obj['transaction']['splits'][0], {'cat_or_acct_id': '53f69e77137a001e344259f2', 'amount': -60.0, 'memo': 'Dinner'})
+        # Total applied once to the account, the account split mirrored as a transfer
+        self.assertEqual(self.balance('acct_testaccountname'), 263563 - 10000)
+        self.assertEqual(self.balance('acct_toaccountname'), 10000 + 2500)
+        mirror = db['acct_toaccountname'].find_one()
+        self.assertEqual((mirror['amount'], mirror['cat_or_acct_id'], mirror.get('splits')), (2500, 'acct_testaccountname', None))
+        # One rollup row per split category
+        self.assertEqual(self.rollups(), [('acct_testaccountname', '53f69e77137a001e344259f2', '2014-08', -6000),
+                                          ('acct_testaccountname', '53f69e77137a001e344259fa', '2014-08', -1500),
+                                          ('acct_testaccountname', 'acct_toaccountname', '2014-08', -2500),
+                                          ('acct_toaccountname', 'acct_testaccountname', '2014-08', 2500)])
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+    
+    def test_POST_SplitValidation(self):
+        rv, obj = self.post(dict(split_transaction, amount=-99.99))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(obj['message'], 'Split amounts must add up to the transaction amount')
+        rv, obj = self.post(dict(split_transaction, splits=[{'cat_or_acct_id': 'acct_nope', 'amount': -5}]))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(obj['message'], 'Transfer account does not exist')
+        self.assertEqual(self.post(dict(split_transaction, splits=[{'memo': 'no amount'}]))[0].status_code, 400)
+        self.assertEqual(db['acct_testaccountname'].count(), 0)
+    
+    def test_PUT_ReplaceSplits(self):
+        rv, obj = self.post(split_transaction)
+        uri = obj['transaction']['uri']
+        rv = self.app.put(uri, data=json.dumps({'splits': [{'cat_or_acct_id': '53f69e77137a001e344259f2', 'amount': -70},
+                                                           {'cat_or_acct_id': '53f69e77137a001e344259fa', 'amount': -10}]}),
+                          content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(obj['transaction']['amount'], -80.0)
+        self.assertEqual(self.balance('acct_testaccountname'), 263563 - 8000)
+        self.assertEqual(self.balance('acct_toaccountname'), 10000) # Transfer split removed
+        self.assertEqual(db['acct_toaccountname'].count(), 0)
+        self.assertEqual(self.rollups(), [('acct_testaccountname', '53f69e77137a001e344259f2', '2014-08', -7000),
+                                          ('acct_testaccountname', '53f69e77137a001e344259fa', '2014-08', -1000)])
+        # Back to a plain transaction
+        rv = self.app.put(uri, data=json.dumps({'cat_or_acct_id': 'acct_toaccountname'}), content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(obj['transaction']['splits'], None)
+        self.assertEqual(self.balance('acct_toaccountname'), 10000 + 8000)
+        self.assertEqual(self.rollups(), [('acct_testaccountname', 'acct_toaccountname', '2014-08', -8000),
+                                          ('acct_toaccountname', 'acct_testaccountname', '2014-08', 8000)])
+    
+    def test_PUT_EmptyCategoryKeepsSplits(self):
+        rv, obj = self.post(split_transaction)
+        rv = self.app.put(obj['transaction']['uri'], data=json.dumps({'cat_or_acct_id': '', 'memo': 'Errands'}),
+                          content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(len(obj['transaction']['splits']), 3)
+        self.assertEqual(self.balance('acct_toaccountname'), 10000 + 2500)
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
+    
+    def test_PUT_AmountMustMatchSplits(self):
+        rv, obj = self.post(split_transaction)
+        rv = self.app.put(obj['transaction']['uri'], data=json.dumps({'amount': -50}), content_type='application/json')
+        self.assertEqual(rv.status_code, 400)
+    
+    def test_DELETE_SplitTransaction(self):
+        rv, obj = self.post(split_transaction)
+        rv = self.app.delete(obj['transaction']['uri'])
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(self.balance('acct_testaccountname'), 263563)
+        self.assertEqual(self.balance('acct_toaccountname'), 10000)
+        self.assertEqual(db['acct_toaccountname'].count(), 0)
+        self.assertEqual(self.rollups(), [])
+    
+    def test_DELETE_SplitMirrorRejected(self):
+        rv, obj = self.post(split_transaction)
+        rv = self.app.delete(obj['transaction']['uri'].replace('acct_testaccountname', 'acct_toaccountname'))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.get_data())['message'], 'Edit the split transaction in acct_testaccountname')
+        self.assertEqual(db['acct_testaccountname'].count(), 1)
+        self.assertEqual(db['acct_toaccountname'].count(), 1)
+        self.assertEqual(self.balance('acct_testaccountname'), 263563 - 10000)
+        self.assertEqual(self.balance('acct_toaccountname'), 10000 + 2500)
+    
+    def test_PUT_SplitMirrorOnlyReconciles(self):
+        rv, obj = self.post(split_transaction)
+        uri = obj['transaction']['uri'].replace('acct_testaccountname', 'acct_toaccountname')
+        rv = self.app.put(uri, data=json.dumps({'amount': 40}), content_type='application/json')
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.get_data())['message'], 'Edit the split transaction in acct_testaccountname')
+        origin = db['acct_testaccountname'].find_one()
+        self.assertEqual(origin['amount'], sum(split['amount'] for split in origin['splits']))
+        self.assertEqual(self.balance('acct_toaccountname'), 10000 + 2500)
+        rv = self.app.put(uri, data=json.dumps({'reconciled': 'C'}), content_type='application/json')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(db['acct_toaccountname'].find_one()['reconciled'], 'C')
+        self.assertEqual(db.accounts.find_one({'id': 'acct_toaccountname'})['bal_cleared'], test_data.db_account_2['bal_cleared'] + 2500)
+    
+    def test_Bulk_SplitTransactions(self):
+        rv = self.app.post('/api/transactions/acct_testaccountname/bulk',
+                           data=json.dumps([split_transaction, dict(split_transaction, date='2014-08-11')]),
+                           content_type='application/json')
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(self.balance('acct_testaccountname'), 263563 - 20000)
+        self.assertEqual(self.balance('acct_toaccountname'), 10000 + 5000)
+        self.assertEqual(db['acct_toaccountname'].count(), 2)
+    
+    def test_SpendingReport_CountsSplitCategories(self):
+        self.post(split_transaction)
+        rv = self.app.get('/api/reports/spending?groupBy=category')
+        groups = dict((g['name'], g['total']) for g in json.loads(rv.get_data())['report']['groups'])
+        self.assertEqual(groups, {'Dining & Entertainment': -60.0, 'Auto': -15.0})
+    
+    def test_Search_BySplitCategory(self):
+        self.post(split_transaction)
+        rv = self.app.get('/api/search/transactions?q=target&category=53f69e77137a001e344259fa')
+        self.assertEqual(len(json.loads(rv.get_data())['transactions']), 1)
+        rv = self.app.get('/api/search/transactions?q=target&category=53f69e77137a001e344259f3')
+        self.assertEqual(len(json.loads(rv.get_data())['transactions']), 0)
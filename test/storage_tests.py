@@ -0,0 +1,93 @@
+import unittest, abacuspb, json
+from abacuspb.migrations import migrate_to_single_collection, migrate_balances_to_cents, migrate_amounts_to_cents, backfill_fingerprints
+from abacuspb.storage import transactions_for, SINGLE, PER_ACCOUNT
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class Storage_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        abacuspb.app.config['TRANSACTION_LAYOUT'] = SINGLE
+        db.accounts.drop()
+        db.transactions.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def tearDown(self):
+        abacuspb.app.config['TRANSACTION_LAYOUT'] = PER_ACCOUNT
+        db.accounts.drop()
+        db.transactions.drop()
+        db['acct_testaccountname'].drop()
+        db['acct_toaccountname'].drop()
+    
+    def test_SingleLayout_ScopesByAccount(self):
+        transactions_for('acct_testaccountname').insert(test_data.db_transactions)
+        transactions_for('acct_toaccountname').insert(test_data.db_transfer_transactions_toAcct)
+        self.assertEqual(db.transactions.count(), 6)
+        self.assertEqual(transactions_for('acct_testaccountname').find().count(), 5)
+        self.assertEqual(transactions_for('acct_toaccountname').find_one()['account_id'], 'acct_toaccountname')
+        transactions_for('acct_testaccountname').drop()
+        self.assertEqual(db.transactions.count(), 1)
+    
+    def test_SingleLayout_TransferPostAndDelete(self):
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+        rv = self.app.post('/api/transactions/acct_testaccountname',
+                           data=json.dumps(test_data.transaction_transfer),
+                           content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(db.transactions.count(), 2)
+        rv = self.app.get('/api/transactions/acct_toaccountname')
+        self.assertEqual(json.loads(rv.get_data())['transactions'][0]['cat_or_acct_id'], 'acct_testaccountname')
+        rv = self.app.delete(obj['transaction']['uri'])
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(db.transactions.count(), 0)
+    
+    def test_MigrateToSingleCollection(self):
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+        db['acct_testaccountname'].insert(test_data.db_transactions)
+        db['acct_toaccountname'].insert(test_data.db_transfer_transactions_toAcct)
+        copied = migrate_to_single_collection()
+        self.assertEqual(copied, {'acct_testaccountname': 5, 'acct_toaccountname': 1})
+        migrate_to_single_collection(drop=True) # Re-running must not duplicate
+        self.assertEqual(db.transactions.count(), 6)
+        self.assertNotIn('acct_testaccountname', db.collection_names())
+        rv = self.app.get('/api/transactions/acct_testaccountname')
+        self.assertEqual(len(json.loads(rv.get_data())['transactions']), 5)
+    
+    def test_MigrateBalancesToCents(self):
+        db.accounts.insert(dict(test_data.db_account, bal_uncleared=2635.63, bal_cleared=-40.92, bal_reconciled=1021.61))
+        self.assertEqual(migrate_balances_to_cents(), 1)
+        self.assertEqual(migrate_balances_to_cents(), 0) # Already converted
+        account = db.accounts.find_one()
+        self.assertEqual(account['bal_uncleared'], 263563)
+        self.assertEqual(account['bal_cleared'], -4092)
+        self.assertEqual(account['bal_reconciled'], 102161)
+    
+    def test_MigrateAmountsToCents(self):
+        abacuspb.app.config['TRANSACTION_LAYOUT'] = PER_ACCOUNT
+        db.accounts.insert(test_data.db_account)
+        docs = [dict(t) for t in test_data.db_transactions[:2]]
+        for doc in docs:
+            doc.pop('_id', None)
+        docs[0]['amount'] = 1145.06 # Legacy float dollars
+        db['acct_testaccountname'].insert(docs)
+        self.assertEqual(migrate_amounts_to_cents(), 1)
+        self.assertEqual(db['acct_testaccountname'].find_one({'id': '53f69e77137a001e344259c7'})['amount'], 114506)
+        self.assertEqual(db['acct_testaccountname'].find_one({'id': '53f69e77137a001e344259c8'})['amount'], -12345)
+    
+    def test_BackfillFingerprints_ReportsDuplicates(self):
+        abacuspb.app.config['TRANSACTION_LAYOUT'] = PER_ACCOUNT
+        db.accounts.insert(test_data.db_account)
+        docs = [dict(t) for t in test_data.db_transactions[:2]]
+        docs.append(dict(docs[1], id='53f69e77137a001e344259d0'))
+        for doc in docs:
+            doc.pop('_id', None)
+        db['acct_testaccountname'].insert(docs)
+        fingerprinted, duplicates = backfill_fingerprints()
+        self.assertEqual(fingerprinted, 2)
+        self.assertEqual(duplicates, [('acct_testaccountname', '53f69e77137a001e344259d0', '53f69e77137a001e344259c8')])
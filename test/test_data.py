@@ -20,9 +20,9 @@ db_account = {
     'type': 'Checking',
     'bank_name': 'Bank of Catonsville',
     'account_num': '1234567890',
-    'bal_uncleared': 2635.63,
-    'bal_cleared': -40.92,
-    'bal_reconciled': 1021.61,
+    'bal_uncleared': 263563,
+    'bal_cleared': -4092,
+    'bal_reconciled': 102161,
     'budget_monitored': True
 }
 
@@ -32,9 +32,9 @@ db_account_2 = {
     'type': 'Savings',
     'bank_name': 'Bank of Catonsville',
     'account_num': '0987654321',
-    'bal_uncleared': 100.00,
-    'bal_cleared': 100.00,
-    'bal_reconciled': 200.00,
+    'bal_uncleared': 10000,
+    'bal_cleared': 10000,
+    'bal_reconciled': 20000,
     'budget_monitored': False
 }
 
@@ -44,9 +44,9 @@ db_account_3 = {
     'type': 'Savings',
     'bank_name': 'Bank of Catonsville',
     'account_num': '0987654320',
-    'bal_uncleared': 500.00,
-    'bal_cleared': 500.00,
-    'bal_reconciled': 600.00,
+    'bal_uncleared': 50000,
+    'bal_cleared': 50000,
+    'bal_reconciled': 60000,
     'budget_monitored': False
 }
 
@@ -94,7 +94,7 @@ db_transactions= [
         'type': 'DEP',
         'payee': 'Sandy Spring Bank',
         'reconciled': 'R',
-        'amount': 1145.06,
+        'amount': 114506,
         'memo': 'Sandy\'s Salary',
         'cat_or_acct_id': '1'
     },
@@ -104,7 +104,7 @@ db_transactions= [
         'type': 'EFT',
         'payee': 'Costco',
         'reconciled': 'R',
-        'amount': -123.45,
+        'amount': -12345,
         'memo': 'Test transaction memo',
         'cat_or_acct_id': '2'
     },
@@ -114,7 +114,7 @@ db_transactions= [
         'type': 'EFT',
         'payee': 'Exxon',
         'reconciled': 'C',
-        'amount': -40.92,
+        'amount': -4092,
         'memo': '',
         'cat_or_acct_id': '2'
     },
@@ -124,7 +124,7 @@ db_transactions= [
         'type': 'DEP',
         'payee': 'U.S. Government',
         'reconciled': '',
-        'amount': 2649.52,
+        'amount': 264952,
         'memo': 'Kyle\'s Salary',
         'cat_or_acct_id': '1'
     },
@@ -134,7 +134,7 @@ db_transactions= [
         'type': 'EFT',
         'payee': 'Amazon.com',
         'reconciled': '',
-        'amount': -13.89,
+        'amount': -1389,
         'memo': '',
         'cat_or_acct_id': '2'
     }
@@ -147,7 +147,7 @@ db_transfer_transactions_fromAcct= [
         'type': 'XFER',
         'payee': 'To Savings',
         'reconciled': 'C',
-        'amount': -100.00,
+        'amount': -10000,
         'memo': '',
         'cat_or_acct_id': 'acct_toaccountname'
     },
@@ -157,7 +157,7 @@ db_transfer_transactions_fromAcct= [
         'type': 'XFER',
         'payee': 'To Savings',
         'reconciled': 'C',
-        'amount': -100.00,
+        'amount': -10000,
         'memo': '',
         'cat_or_acct_id': 'somecategoryidstring'
     }
@@ -170,7 +170,7 @@ db_transfer_transactions_toAcct= [
         'type': 'XFER',
         'payee': 'To Savings',
         'reconciled': 'R',
-        'amount': 100.00,
+        'amount': 10000,
         'memo': '',
         'cat_or_acct_id': 'acct_testaccountname'
     }                                  
@@ -1,4 +1,5 @@
 import unittest, abacuspb, json
+from abacuspb.cache import clear_caches
 from test import test_data
 from datetime import datetime
 
@@ -8,6 +9,7 @@ class TransactionsAPI_TestCase(unittest.TestCase):
     
     def setUp(self):
         self.app = abacuspb.app.test_client()
+        clear_caches()
         db.accounts.drop()
         db['acct_testaccountname'].drop()
         db['acct_toaccountname'].drop()
@@ -74,6 +76,36 @@ class TransactionsAPI_TestCase(unittest.TestCase):
             self.assertGreaterEqual(second, fdate) # check query for last item
             self.assertLessEqual(second, tdate) # check query for last item
     
+    def test_TransactionListAPI_GET_PageSizeAndCursors(self):
+        db['acct_testaccountname'].insert(test_data.db_transactions)
+        rv = self.app.get('/api/transactions/acct_testaccountname?pageSize=2')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(len(obj['transactions']), 2)
+        self.assertIsNone(obj['prev'])
+        self.assertIsNotNone(obj['next'])
+        seen = [t['uri'] for t in obj['transactions']]
+        # Walk forward to the last page
+        while obj['next']:
+            rv = self.app.get('/api/transactions/acct_testaccountname?pageSize=2&after='+obj['next'])
+            obj = json.loads(rv.get_data())
+            self.assertEqual(rv.status_code, 200)
+            seen.extend([t['uri'] for t in obj['transactions']])
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        # Walk back one page
+        rv = self.app.get('/api/transactions/acct_testaccountname?pageSize=2&before='+obj['prev'])
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual([t['uri'] for t in obj['transactions']], seen[2:4])
+    
+    def test_TransactionListAPI_GET_InvalidCursor(self):
+        db['acct_testaccountname'].insert(test_data.db_transactions)
+        rv = self.app.get('/api/transactions/acct_testaccountname?after=notacursor')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(obj['message'], 'Invalid cursor')
+    
     def test_TransactionListAPI_POST_NoAccountExists(self):
         rv = self.app.post('/api/transactions/acct_testaccountname',
                            data=json.dumps(test_data.transaction),
@@ -95,9 +127,9 @@ class TransactionsAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['accounts'][0]['bal_uncleared'], 2583.55)
         self.assertEqual(obj['accounts'][0]['bal_cleared'], -40.92)
         self.assertEqual(obj['accounts'][0]['bal_reconciled'], 1021.61)
-        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 2583.55)
-        self.assertEqual(db.accounts.find_one()['bal_cleared'], -40.92)
-        self.assertEqual(db.accounts.find_one()['bal_reconciled'], 1021.61)
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 258355)
+        self.assertEqual(db.accounts.find_one()['bal_cleared'], -4092)
+        self.assertEqual(db.accounts.find_one()['bal_reconciled'], 102161)
         
     def test_TransactionListAPI_POST_AccountExists_ClearedTrans(self):
         test_data.transaction['reconciled'] = 'C'
@@ -112,9 +144,9 @@ class TransactionsAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['accounts'][0]['bal_uncleared'], 2583.55)
         self.assertEqual(obj['accounts'][0]['bal_cleared'], -93.00)
         self.assertEqual(obj['accounts'][0]['bal_reconciled'], 1021.61)
-        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 2583.55)
-        self.assertEqual(db.accounts.find_one()['bal_cleared'], -93.00)
-        self.assertEqual(db.accounts.find_one()['bal_reconciled'], 1021.61)
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 258355)
+        self.assertEqual(db.accounts.find_one()['bal_cleared'], -9300)
+        self.assertEqual(db.accounts.find_one()['bal_reconciled'], 102161)
         test_data.transaction['reconciled'] = '' # Rest test data
         
     def test_TransactionListAPI_POST_AccountExists_ReconciledTrans(self):
@@ -130,11 +162,28 @@ class TransactionsAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['accounts'][0]['bal_uncleared'], 2583.55)
         self.assertEqual(obj['accounts'][0]['bal_cleared'], -93.00)
         self.assertEqual(obj['accounts'][0]['bal_reconciled'], 969.53)
-        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 2583.55)
-        self.assertEqual(db.accounts.find_one()['bal_cleared'], -93.00)
-        self.assertEqual(db.accounts.find_one()['bal_reconciled'], 969.53)
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 258355)
+        self.assertEqual(db.accounts.find_one()['bal_cleared'], -9300)
+        self.assertEqual(db.accounts.find_one()['bal_reconciled'], 96953)
         test_data.transaction['reconciled'] = '' # Rest test data
         
+    def test_TransactionListAPI_POST_DuplicateIsIdempotent(self):
+        db.accounts.insert(test_data.db_account)
+        rv = self.app.post('/api/transactions/acct_testaccountname',
+                           data=json.dumps(test_data.transaction),
+                           content_type='application/json')
+        self.assertEqual(rv.status_code, 201)
+        first = json.loads(rv.get_data())
+        rv = self.app.post('/api/transactions/acct_testaccountname',
+                           data=json.dumps(test_data.transaction),
+                           content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(obj['duplicate'])
+        self.assertEqual(obj['transaction']['uri'], first['transaction']['uri'])
+        self.assertEqual(db['acct_testaccountname'].count(), 1)
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 258355)
+        
     # Transfer transaction POST tests    
     def test_TransactionListAPI_POST_TransferAcctDoesNotExist(self):
         db.accounts.insert(test_data.db_account)
@@ -157,16 +206,84 @@ class TransactionsAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['accounts'][0]['bal_uncleared'], 2535.63)
         self.assertEqual(obj['accounts'][0]['bal_cleared'], -40.92)
         self.assertEqual(obj['accounts'][0]['bal_reconciled'], 1021.61)
-        self.assertEqual(db.accounts.find_one({'id':'acct_testaccountname'})['bal_uncleared'], 2535.63)
-        self.assertEqual(db.accounts.find_one({'id':'acct_testaccountname'})['bal_cleared'], -40.92)
-        self.assertEqual(db.accounts.find_one({'id':'acct_testaccountname'})['bal_reconciled'], 1021.61)
+        self.assertEqual(db.accounts.find_one({'id':'acct_testaccountname'})['bal_uncleared'], 253563)
+        self.assertEqual(db.accounts.find_one({'id':'acct_testaccountname'})['bal_cleared'], -4092)
+        self.assertEqual(db.accounts.find_one({'id':'acct_testaccountname'})['bal_reconciled'], 102161)
         self.assertEqual(obj['accounts'][1]['bal_uncleared'], 200.00)
         self.assertEqual(obj['accounts'][1]['bal_cleared'], 100.00)
         self.assertEqual(obj['accounts'][1]['bal_reconciled'], 200.00)
-        self.assertEqual(db.accounts.find_one({'id':'acct_toaccountname'})['bal_uncleared'], 200.00)
-        self.assertEqual(db.accounts.find_one({'id':'acct_toaccountname'})['bal_cleared'], 100.00)
-        self.assertEqual(db.accounts.find_one({'id':'acct_toaccountname'})['bal_reconciled'], 200.00)
+        self.assertEqual(db.accounts.find_one({'id':'acct_toaccountname'})['bal_uncleared'], 20000)
+        self.assertEqual(db.accounts.find_one({'id':'acct_toaccountname'})['bal_cleared'], 10000)
+        self.assertEqual(db.accounts.find_one({'id':'acct_toaccountname'})['bal_reconciled'], 20000)
         
+    # TransactionExportAPI Tests
+    def test_TransactionExportAPI_GET_NDJSON(self):
+        db['acct_testaccountname'].insert(test_data.db_transactions)
+        rv = self.app.get('/api/transactions/acct_testaccountname/export')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in rv.get_data().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['date'], '2014-08-18')
+    
+    def test_TransactionExportAPI_GET_JSONBetweenDates(self):
+        db['acct_testaccountname'].insert(test_data.db_transactions)
+        rv = self.app.get('/api/transactions/acct_testaccountname/export?format=json&fromDate=2014-08-01&toDate=2014-08-12')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual([t['date'] for t in obj['transactions']], ['2014-08-12', '2014-08-06', '2014-08-01'])
+    
+    # TransactionBulkAPI Tests
+    def test_TransactionBulkAPI_POST_WithTransfer(self):
+        db.accounts.insert([test_data.db_account, test_data.db_account_2])
+        rv = self.app.post('/api/transactions/acct_testaccountname/bulk',
+                           data=json.dumps([test_data.transaction, test_data.transaction_transfer]),
+                           content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(obj['count'], 2)
+        self.assertEqual(obj['accounts'][0]['bal_uncleared'], 2483.55) # 2635.63 - 52.08 - 100.00
+        self.assertEqual(obj['accounts'][1]['bal_uncleared'], 200.00)
+        self.assertEqual(db['acct_testaccountname'].count(), 2)
+        self.assertEqual(db['acct_toaccountname'].find_one()['amount'], 10000)
+    
+    def test_TransactionBulkAPI_POST_NDJSON(self):
+        db.accounts.insert(test_data.db_account)
+        rv = self.app.post('/api/transactions/acct_testaccountname/bulk',
+                           data='\n'.join(json.dumps(dict(test_data.transaction, fitid=str(i))) for i in range(3)),
+                           content_type='application/x-ndjson')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(obj['count'], 3)
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 247939)
+    
+    def test_TransactionBulkAPI_POST_SkipsDuplicates(self):
+        db.accounts.insert(test_data.db_account)
+        rows = [dict(test_data.transaction, fitid='1'), dict(test_data.transaction, fitid='2')]
+        rv = self.app.post('/api/transactions/acct_testaccountname/bulk',
+                           data=json.dumps(rows),
+                           content_type='application/json')
+        self.assertEqual(json.loads(rv.get_data())['count'], 2)
+        rv = self.app.post('/api/transactions/acct_testaccountname/bulk',
+                           data=json.dumps(rows + [dict(test_data.transaction, fitid='3')] * 2),
+                           content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(obj['count'], 1)
+        self.assertEqual(obj['duplicates'], 3)
+        self.assertEqual(db['acct_testaccountname'].count(), 3)
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 263563 - 3 * 5208)
+    
+    def test_TransactionBulkAPI_POST_InvalidWritesNothing(self):
+        db.accounts.insert(test_data.db_account)
+        rv = self.app.post('/api/transactions/acct_testaccountname/bulk',
+                           data=json.dumps([test_data.transaction, {'date': '2014-13-45', 'amount': 1}]),
+                           content_type='application/json')
+        obj = json.loads(rv.get_data())
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(obj['errors'][0]['index'], 1)
+        self.assertEqual(db['acct_testaccountname'].count(), 0)
+        self.assertEqual(db.accounts.find_one()['bal_uncleared'], 263563)
+    
     # TransactionAPI Tests
     def test_TransactionAPI_GET_TransactionDoesNotExist(self):
         rv = self.app.get('/api/transactions/acct_testaccountname/123')
@@ -334,11 +451,11 @@ class TransactionsAPI_TestCase(unittest.TestCase):
         self.assertEqual(obj['accounts'][0]['bal_uncleared'], 2685.63) # testaccountname
         self.assertEqual(obj['accounts'][0]['bal_cleared'], 9.08)
         self.assertEqual(obj['accounts'][0]['bal_reconciled'], 1021.61)
-        self.assertEqual(obj['accounts'][1]['bal_uncleared'], 150.00) # toaccountname
-        self.assertEqual(obj['accounts'][1]['bal_cleared'], 150.00)
-        self.assertEqual(obj['accounts'][1]['bal_reconciled'], 200.00)
-        self.assertEqual(db['acct_testaccountname'].find_one({'id':'53f69e77137a001e344259c7'})['amount'], -50.00)
-        self.assertEqual(db['acct_toaccountname'].find_one({'id':'53f69e77137a001e344259c7'})['amount'], 50.00)
+        self.assertEqual(obj['accounts'][1]['bal_uncleared'], 50.00) # toaccountname: +100.00 'R' mirror is now +50.00
+        self.assertEqual(obj['accounts'][1]['bal_cleared'], 50.00)
+        self.assertEqual(obj['accounts'][1]['bal_reconciled'], 150.00)
+        self.assertEqual(db['acct_testaccountname'].find_one({'id':'53f69e77137a001e344259c7'})['amount'], -5000)
+        self.assertEqual(db['acct_toaccountname'].find_one({'id':'53f69e77137a001e344259c7'})['amount'], 5000)
     
     def test_TransactionAPI_PUT_Transfer_ChangeAccountToCategory(self):
         db.accounts.insert([test_data.db_account, test_data.db_account_2])
@@ -0,0 +1,66 @@
+import unittest, abacuspb, json
+from datetime import datetime, timedelta
+from werkzeug.http import http_date
+from abacuspb.cache import clear_caches
+from test import test_data
+
+db = abacuspb.db
+
+class ConditionalGet_TestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = abacuspb.app.test_client()
+        clear_caches()
+        db.accounts.drop()
+        db.payees.drop()
+        db.versions.drop()
+        db['acct_testaccountname'].drop()
+        db.accounts.insert(test_data.db_account)
+        db.payees.insert({'id': '53f69e77137a001e344259e0', 'name': 'Giant'})
+    
+    def tearDown(self):
+        db.accounts.drop()
+        db.payees.drop()
+        db.versions.drop()
+        db['acct_testaccountname'].drop()
+    
+    def test_ConditionalGet_NotModified(self):
+        rv = self.app.get('/api/payees')
+        self.assertEqual(rv.status_code, 200)
+        etag = rv.headers['ETag']
+        self.assertIsNotNone(rv.headers.get('Last-Modified'))
+        rv = self.app.get('/api/payees', headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.get_data(), '')
+        self.assertEqual(rv.headers['ETag'], etag)
+    
+    def test_ConditionalGet_WriteChangesETag(self):
+        etag = self.app.get('/api/payees').headers['ETag']
+        self.app.post('/api/payees', data=json.dumps({'name': 'Safeway'}), content_type='application/json')
+        db.versions.update_one({'_id': 'payees'}, {'$set': {'modified': datetime.utcnow() + timedelta(seconds=5)}}) # Keep it in the current second
+        rv = self.app.get('/api/payees', headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertNotEqual(rv.headers['ETag'], etag)
+        self.assertEqual(len(json.loads(rv.get_data())['payees']), 2)
+    
+    def test_ConditionalGet_TransactionWriteChangesAccounts(self):
+        etag = self.app.get('/api/accounts').headers['ETag']
+        self.app.post('/api/transactions/acct_testaccountname',
+                      data=json.dumps(test_data.transaction),
+                      content_type='application/json')
+        rv = self.app.get('/api/accounts', headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.get_data())['accounts'][0]['bal_uncleared'], 2583.55)
+    
+    def test_ConditionalGet_IfModifiedSince(self):
+        rv = self.app.get('/api/payees')
+        last_modified = rv.headers['Last-Modified']
+        rv = self.app.get('/api/payees', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(rv.status_code, 304)
+        # Changed within the current second: not answered from the whole-second date
+        self.app.post('/api/payees', data=json.dumps({'name': 'Safeway'}), content_type='application/json')
+        db.versions.update_one({'_id': 'payees'}, {'$set': {'modified': datetime.utcnow() + timedelta(seconds=5)}}) # Keep it in the current second
+        rv = self.app.get('/api/payees', headers={'If-Modified-Since': http_date(datetime.utcnow() + timedelta(seconds=1))})
+        self.assertEqual(rv.status_code, 200)
+        self.assertIsNone(rv.headers.get('Last-Modified'))
+        self.assertEqual(len(json.loads(rv.get_data())['payees']), 2)
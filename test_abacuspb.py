@@ -3,11 +3,45 @@ import test.accounts_tests
 import test.transactions_tests
 import test.payees_tests
 import test.categories_tests
+import test.storage_tests
+import test.importer_tests
+import test.reports_tests
+import test.rollups_tests
+import test.checkpoints_tests
+import test.reconcile_tests
+import test.journal_tests
+import test.marshalling_tests
+import test.encoding_tests
+import test.versions_tests
+import test.cache_tests
+import test.payee_index_tests
+import test.search_tests
+import test.networth_tests
+import test.budgets_tests
+import test.schedules_tests
+import test.splits_tests
         
 testsuite = unittest.TestSuite([
     unittest.TestLoader().loadTestsFromModule(test.accounts_tests),
     unittest.TestLoader().loadTestsFromModule(test.transactions_tests),
     unittest.TestLoader().loadTestsFromModule(test.payees_tests),
-    unittest.TestLoader().loadTestsFromModule(test.categories_tests)
+    unittest.TestLoader().loadTestsFromModule(test.categories_tests),
+    unittest.TestLoader().loadTestsFromModule(test.storage_tests),
+    unittest.TestLoader().loadTestsFromModule(test.importer_tests),
+    unittest.TestLoader().loadTestsFromModule(test.reports_tests),
+    unittest.TestLoader().loadTestsFromModule(test.rollups_tests),
+    unittest.TestLoader().loadTestsFromModule(test.checkpoints_tests),
+    unittest.TestLoader().loadTestsFromModule(test.reconcile_tests),
+    unittest.TestLoader().loadTestsFromModule(test.journal_tests),
+    unittest.TestLoader().loadTestsFromModule(test.marshalling_tests),
+    unittest.TestLoader().loadTestsFromModule(test.encoding_tests),
+    unittest.TestLoader().loadTestsFromModule(test.versions_tests),
+    unittest.TestLoader().loadTestsFromModule(test.cache_tests),
+    unittest.TestLoader().loadTestsFromModule(test.payee_index_tests),
+    unittest.TestLoader().loadTestsFromModule(test.search_tests),
+    unittest.TestLoader().loadTestsFromModule(test.networth_tests),
+    unittest.TestLoader().loadTestsFromModule(test.budgets_tests),
+    unittest.TestLoader().loadTestsFromModule(test.schedules_tests),
+    unittest.TestLoader().loadTestsFromModule(test.splits_tests)
     ])
 unittest.TextTestRunner(verbosity=1).run(testsuite)
\ No newline at end of file